@@ -0,0 +1,30 @@
+"""Add cancellation and deadline fields to validation_runs
+
+Revision ID: a3f9d2b7c641
+Revises: f1c7a8d4e902
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3f9d2b7c641'
+down_revision: Union[str, None] = 'f1c7a8d4e902'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('validation_runs', sa.Column('skipped_cells', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('validation_runs', sa.Column('deadline_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('validation_runs', 'deadline_at')
+    op.drop_column('validation_runs', 'skipped_cells')
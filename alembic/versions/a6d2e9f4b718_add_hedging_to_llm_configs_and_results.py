@@ -0,0 +1,34 @@
+"""Add hedging settings to llm_configs and hedge flags to generated_results
+
+Revision ID: a6d2e9f4b718
+Revises: f8c3a6e2d914
+Create Date: 2026-10-16 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a6d2e9f4b718'
+down_revision: Union[str, None] = 'f8c3a6e2d914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('llm_configs', sa.Column('hedging_enabled', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column('llm_configs', sa.Column('alternate_base_urls', sa.JSON(), nullable=True))
+    op.add_column('generated_results', sa.Column('hedged', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column('generated_results', sa.Column('hedge_won', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('generated_results', 'hedge_won')
+    op.drop_column('generated_results', 'hedged')
+    op.drop_column('llm_configs', 'alternate_base_urls')
+    op.drop_column('llm_configs', 'hedging_enabled')
@@ -0,0 +1,51 @@
+"""Add run_work_items
+
+Revision ID: b5e8c1f3a297
+Revises: a3f9d2b7c641
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5e8c1f3a297'
+down_revision: Union[str, None] = 'a3f9d2b7c641'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'run_work_items',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('validation_run_id', sa.Integer(), nullable=False),
+        sa.Column('nlq_id', sa.Integer(), nullable=False),
+        sa.Column('prompt_set_id', sa.Integer(), nullable=False),
+        sa.Column('llm_config_id', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(), nullable=False),
+        sa.Column('lease_owner', sa.String(), nullable=True),
+        sa.Column('lease_expires_at', sa.DateTime(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['validation_run_id'], ['validation_runs.id']),
+        sa.ForeignKeyConstraint(['nlq_id'], ['nlqs.id']),
+        sa.ForeignKeyConstraint(['prompt_set_id'], ['prompt_sets.id']),
+        sa.ForeignKeyConstraint(['llm_config_id'], ['llm_configs.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('validation_run_id', 'nlq_id', 'prompt_set_id', 'llm_config_id', name='uq_run_work_items_cell'),
+    )
+    op.create_index(op.f('ix_run_work_items_id'), 'run_work_items', ['id'], unique=False)
+    op.create_index(op.f('ix_run_work_items_validation_run_id'), 'run_work_items', ['validation_run_id'], unique=False)
+    op.create_index(op.f('ix_run_work_items_status'), 'run_work_items', ['status'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_run_work_items_status'), table_name='run_work_items')
+    op.drop_index(op.f('ix_run_work_items_validation_run_id'), table_name='run_work_items')
+    op.drop_index(op.f('ix_run_work_items_id'), table_name='run_work_items')
+    op.drop_table('run_work_items')
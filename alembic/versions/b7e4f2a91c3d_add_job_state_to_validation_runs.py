@@ -0,0 +1,44 @@
+"""Add background job state to validation_runs
+
+Revision ID: b7e4f2a91c3d
+Revises: 9a524ef6745a, 999999999999
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e4f2a91c3d'
+down_revision: Union[str, Sequence[str], None] = ('9a524ef6745a', '999999999999')
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('validation_runs', sa.Column('status', sa.String(), nullable=True))
+    op.add_column('validation_runs', sa.Column('total_cells', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('validation_runs', sa.Column('completed_cells', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('validation_runs', sa.Column('failed_cells', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('validation_runs', sa.Column('started_at', sa.DateTime(), nullable=True))
+    op.add_column('validation_runs', sa.Column('finished_at', sa.DateTime(), nullable=True))
+    op.add_column('validation_runs', sa.Column('error', sa.Text(), nullable=True))
+    op.create_index('ix_validation_runs_status', 'validation_runs', ['status'])
+    # Runs created before the job runner existed all ran to completion synchronously
+    op.execute("UPDATE validation_runs SET status = 'completed'")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_validation_runs_status', table_name='validation_runs')
+    op.drop_column('validation_runs', 'error')
+    op.drop_column('validation_runs', 'finished_at')
+    op.drop_column('validation_runs', 'started_at')
+    op.drop_column('validation_runs', 'failed_cells')
+    op.drop_column('validation_runs', 'completed_cells')
+    op.drop_column('validation_runs', 'total_cells')
+    op.drop_column('validation_runs', 'status')
@@ -0,0 +1,30 @@
+"""Add batch_id and batch_turnaround_ms to generated_results
+
+Revision ID: b8e3f1a5c926
+Revises: a6d2e9f4b718
+Create Date: 2026-10-16 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e3f1a5c926'
+down_revision: Union[str, None] = 'a6d2e9f4b718'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('generated_results', sa.Column('batch_id', sa.String(), nullable=True))
+    op.add_column('generated_results', sa.Column('batch_turnaround_ms', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('generated_results', 'batch_turnaround_ms')
+    op.drop_column('generated_results', 'batch_id')
@@ -0,0 +1,45 @@
+"""Add status and error_class to generated_results
+
+Revision ID: c2d8e5f07a14
+Revises: b7e4f2a91c3d
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c2d8e5f07a14'
+down_revision: Union[str, None] = 'b7e4f2a91c3d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('generated_results', sa.Column('status', sa.String(), nullable=False, server_default='success'))
+    op.add_column('generated_results', sa.Column('error_class', sa.String(), nullable=True))
+    op.create_index('ix_generated_results_status', 'generated_results', ['status'])
+    # Backfill from the error markers previously written into generated_sql
+    op.execute("""
+        UPDATE generated_results
+        SET status = 'error',
+            error_class = CASE
+                WHEN generated_sql LIKE '%429%' THEN 'rate_limit'
+                WHEN generated_sql LIKE '%timed out%' THEN 'timeout'
+                WHEN generated_sql LIKE '%Server Error%' THEN 'server_error'
+                WHEN generated_sql LIKE '%Client Error%' THEN 'client_error'
+                ELSE 'other'
+            END
+        WHERE generated_sql LIKE '%-- GEMINI ERROR:%' OR generated_sql LIKE '%-- ERROR:%';
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_generated_results_status', table_name='generated_results')
+    op.drop_column('generated_results', 'error_class')
+    op.drop_column('generated_results', 'status')
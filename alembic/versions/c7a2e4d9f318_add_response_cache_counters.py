@@ -0,0 +1,32 @@
+"""Add response cache hit/miss counters and cache_hit tag
+
+Revision ID: c7a2e4d9f318
+Revises: b5e8c1f3a297
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a2e4d9f318'
+down_revision: Union[str, None] = 'b5e8c1f3a297'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('validation_runs', sa.Column('cache_hits', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('validation_runs', sa.Column('cache_misses', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('generated_results', sa.Column('cache_hit', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('generated_results', 'cache_hit')
+    op.drop_column('validation_runs', 'cache_misses')
+    op.drop_column('validation_runs', 'cache_hits')
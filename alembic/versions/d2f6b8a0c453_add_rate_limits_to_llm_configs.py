@@ -0,0 +1,30 @@
+"""Add rate limit budgets to llm_configs
+
+Revision ID: d2f6b8a0c453
+Revises: c7a2e4d9f318
+Create Date: 2026-10-16 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2f6b8a0c453'
+down_revision: Union[str, None] = 'c7a2e4d9f318'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('llm_configs', sa.Column('rpm_limit', sa.Integer(), nullable=True))
+    op.add_column('llm_configs', sa.Column('tpm_limit', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('llm_configs', 'tpm_limit')
+    op.drop_column('llm_configs', 'rpm_limit')
@@ -0,0 +1,28 @@
+"""Add query_stats to validation_runs
+
+Revision ID: d4a1c9e3b276
+Revises: c2d8e5f07a14
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a1c9e3b276'
+down_revision: Union[str, None] = 'c2d8e5f07a14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('validation_runs', sa.Column('query_stats', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('validation_runs', 'query_stats')
@@ -0,0 +1,28 @@
+"""Add retry_count to generated_results
+
+Revision ID: e4b7d1c8f590
+Revises: d2f6b8a0c453
+Create Date: 2026-10-16 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b7d1c8f590'
+down_revision: Union[str, None] = 'd2f6b8a0c453'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('generated_results', sa.Column('retry_count', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('generated_results', 'retry_count')
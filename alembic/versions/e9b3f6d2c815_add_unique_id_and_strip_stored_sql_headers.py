@@ -0,0 +1,59 @@
+"""Add unique_id to generated_results and strip stored SQL comment headers
+
+Revision ID: e9b3f6d2c815
+Revises: d4a1c9e3b276
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9b3f6d2c815'
+down_revision: Union[str, None] = 'd4a1c9e3b276'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HEADER_PREFIXES = ('-- NLQ:', '-- Prompt/Model:', '-- Unique ID:', '-- Result ID:')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('generated_results', sa.Column('unique_id', sa.String(), nullable=True))
+    # The header is now rendered on read; move the stored Unique ID into its column and
+    # strip the comment block that used to be written into generated_sql
+    conn = op.get_bind()
+    rows = conn.execute(sa.text(
+        "SELECT id, generated_sql FROM generated_results WHERE generated_sql LIKE '-- NLQ:%'"
+    )).fetchall()
+    updates = []
+    for row_id, generated_sql in rows:
+        unique_id = None
+        lines = generated_sql.splitlines()
+        body_start = 0
+        for i, line in enumerate(lines):
+            if not line.startswith(HEADER_PREFIXES):
+                body_start = i
+                break
+            if line.startswith('-- Unique ID:'):
+                unique_id = line[len('-- Unique ID:'):].strip() or None
+        else:
+            body_start = len(lines)
+        updates.append({
+            "id": row_id,
+            "generated_sql": '\n'.join(lines[body_start:]).lstrip('\n'),
+            "unique_id": unique_id,
+        })
+    if updates:
+        conn.execute(
+            sa.text("UPDATE generated_results SET generated_sql = :generated_sql, unique_id = :unique_id WHERE id = :id"),
+            updates,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('generated_results', 'unique_id')
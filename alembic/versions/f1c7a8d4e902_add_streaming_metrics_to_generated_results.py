@@ -0,0 +1,32 @@
+"""Add streaming metrics to generated_results
+
+Revision ID: f1c7a8d4e902
+Revises: e9b3f6d2c815
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1c7a8d4e902'
+down_revision: Union[str, None] = 'e9b3f6d2c815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('generated_results', sa.Column('time_to_first_token_ms', sa.Integer(), nullable=True))
+    op.add_column('generated_results', sa.Column('output_tokens_per_second', sa.Float(), nullable=True))
+    op.add_column('generated_results', sa.Column('aborted_early', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('generated_results', 'aborted_early')
+    op.drop_column('generated_results', 'output_tokens_per_second')
+    op.drop_column('generated_results', 'time_to_first_token_ms')
@@ -0,0 +1,45 @@
+"""Add token usage to generated_results and model_prices
+
+Revision ID: f8c3a6e2d914
+Revises: e4b7d1c8f590
+Create Date: 2026-10-16 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f8c3a6e2d914'
+down_revision: Union[str, None] = 'e4b7d1c8f590'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('generated_results', sa.Column('prompt_tokens', sa.Integer(), nullable=True))
+    op.add_column('generated_results', sa.Column('completion_tokens', sa.Integer(), nullable=True))
+    op.add_column('generated_results', sa.Column('cached_tokens', sa.Integer(), nullable=True))
+    op.create_table(
+        'model_prices',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('model', sa.String(), nullable=False),
+        sa.Column('input_per_million', sa.Float(), nullable=False),
+        sa.Column('output_per_million', sa.Float(), nullable=False),
+        sa.Column('cached_input_per_million', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('model'),
+    )
+    op.create_index(op.f('ix_model_prices_id'), 'model_prices', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_model_prices_id'), table_name='model_prices')
+    op.drop_table('model_prices')
+    op.drop_column('generated_results', 'cached_tokens')
+    op.drop_column('generated_results', 'completion_tokens')
+    op.drop_column('generated_results', 'prompt_tokens')
@@ -1,21 +1,53 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import except_, func, select, true
 from sqlalchemy.orm import Session
 from app.database.database import SessionLocal, SQLALCHEMY_DATABASE_URL
+from app.database.query_counter import count_queries
 from app.models import core
-from app.schemas import EvaluateRunRequest, EvaluateRunResponse, ValidationRunRead
-from typing import List
-from datetime import datetime
+from app.schemas import EvaluateRunRequest, EvaluateRunResponse, ValidationRunRead, RunStatusRead
+from typing import Dict, List
+from datetime import datetime, timedelta
 from app.utils import file_readers
+from app.services.evaluation_engine import EvaluationEngine, EvaluationCell, CellOutcome
+from app.services.batch_jobs import BatchExecutor
+from app.services.job_runner import job_runner
+from app.services.llm_service import llm_service, rate_limiter, CancellationToken, StreamResult, GEMINI_API_BASE_URL
+from app.services.mock_provider import FixtureNotFoundError, exchange_fixtures, mock_provider
+from app.services.run_events import run_events, EVENT_RESULT, EVENT_PROGRESS, EVENT_DONE
+from app.services import work_queue
+from app.services.http_clients import http_clients
+from app.services.response_cache import response_cache
+from app.services.resilience import RetryPolicy, call_with_retry, circuit_breakers
+from app.api.run_details import to_result_summary
+import asyncio
 import logging
 import json
+import httpx
+import os
+import random
 import requests
+import string
 import time
 
 logger = logging.getLogger("evaluate")
 
-GEMINI_API_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+# Results are written in batches: whichever limit is reached first triggers a bulk INSERT
+RESULT_BATCH_SIZE = int(os.getenv("EVAL_RESULT_BATCH_SIZE", "25"))
+RESULT_FLUSH_INTERVAL_SECONDS = float(os.getenv("EVAL_RESULT_FLUSH_INTERVAL_SECONDS", "0.5"))
 
-def call_gemini_llm(prompt: str, llm_config):
+# "inline" executes runs on this process's job runner; "workers" queues their cells
+# as leased work items for `python -m app.worker` processes to drain
+DISPATCH_MODE_INLINE = "inline"
+DISPATCH_MODE_WORKERS = "workers"
+DISPATCH_MODE = os.getenv("EVAL_DISPATCH_MODE", DISPATCH_MODE_INLINE)
+
+# "batch" runs package their prompts into provider batch jobs (app.services.batch_jobs);
+# they always execute on this process's job runner, whatever the dispatch mode
+EXECUTION_MODE_ONLINE = "online"
+EXECUTION_MODE_BATCH = "batch"
+
+def request_gemini_completion(prompt: str, llm_config) -> str:
+    """Calls the Gemini REST API and returns the generated text. Raises on any failure."""
     url = f"{GEMINI_API_BASE_URL}/models/{llm_config.model}:generateContent?key={llm_config.api_key}"
     payload = {
         "contents": [{"parts": [{"text": prompt}]}]
@@ -28,15 +60,57 @@ def call_gemini_llm(prompt: str, llm_config):
     logger.info(f"LLM API call URL: {url}")
     logger.info(f"LLM API call payload: {json.dumps(payload, indent=2)}")
     logger.info(f"LLM API call full prompt:\n{prompt}")
+    reservation = rate_limiter.acquire(llm_config, prompt)
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=60)
-        resp.raise_for_status()
-        data = resp.json()
-        # Gemini returns generated text in a nested structure
-        return data['candidates'][0]['content']['parts'][0]['text']
+        resp = http_clients.post(url, json=payload, headers=headers)
     except Exception as e:
-        logger.error(f"Gemini API error: {e}")
-        return f"-- GEMINI ERROR: {str(e)}"
+        rate_limiter.refund_if_unsent(reservation, e)
+        raise
+    try:
+        resp.raise_for_status()
+    except requests.HTTPError as e:
+        rate_limiter.note_error(llm_config, e)
+        raise
+    data = resp.json()
+    rate_limiter.record_output_tokens(llm_config, (data.get("usageMetadata") or {}).get("candidatesTokenCount"))
+    # Gemini returns generated text in a nested structure
+    return data['candidates'][0]['content']['parts'][0]['text']
+
+def call_gemini_llm(prompt: str, llm_config):
+    attempted = call_with_retry(
+        lambda: request_gemini_completion(prompt, llm_config),
+        circuit_breakers.get(provider_of(llm_config), llm_config.model),
+        RetryPolicy(),
+        classify_llm_error,
+    )
+    if attempted.exception is not None:
+        logger.error(f"Gemini API error ({attempted.error_class}, {attempted.retries} retries): {attempted.exception}")
+        return f"-- GEMINI ERROR: {str(attempted.exception)}"
+    return attempted.result
+
+def classify_llm_error(exc: Exception) -> str:
+    """Maps a provider call exception (requests, httpx or LiteLLM) to a GeneratedResult error class."""
+    if isinstance(exc, FixtureNotFoundError):
+        # Not the provider's fault, so it must not count against its circuit breaker
+        return core.GeneratedResult.ERROR_FIXTURE_MISSING
+    if isinstance(exc, (requests.Timeout, httpx.TimeoutException, TimeoutError)) or "timeout" in type(exc).__name__.lower():
+        return core.GeneratedResult.ERROR_TIMEOUT
+    status_code = None
+    if isinstance(exc, (requests.HTTPError, httpx.HTTPStatusError)) and exc.response is not None:
+        status_code = exc.response.status_code
+    elif isinstance(getattr(exc, "status_code", None), int):
+        # LiteLLM exceptions carry the provider's HTTP status
+        status_code = exc.status_code
+    if status_code is not None:
+        return core.GeneratedResult.error_class_for_status(status_code)
+    if isinstance(exc, (ValueError, KeyError, IndexError, TypeError)):
+        # Malformed JSON or an unexpected response shape
+        return core.GeneratedResult.ERROR_PARSE
+    return core.GeneratedResult.ERROR_OTHER
+
+def provider_of(llm_config) -> str:
+    """Provider key used to cap in-flight requests; non-Gemini configs are served by the mock path."""
+    return "gemini" if llm_config.model.startswith("gemini") else "mock"
 
 router = APIRouter()
 
@@ -74,107 +148,487 @@ def explain_query(
     explanation = call_gemini_llm(prompt, llm)
     return {"explanation": explanation}
 
+def generate_for_cell(cell: EvaluationCell, llm, cancel_token: CancellationToken = None) -> StreamResult:
+    logger.info(f"    Calling LLM {llm.name} (model: {llm.model}) for NLQ {cell.nlq_id} and Prompt Set {cell.prompt_set_id}")
+    if provider_of(llm) == "gemini":
+        if exchange_fixtures.replaying:
+            return exchange_fixtures.replay(llm, cell.full_prompt, cancel_token)
+        if not exchange_fixtures.recording:
+            return llm_service.stream_generate(llm, cell.full_prompt, cancel_token=cancel_token, static_prefix_chars=cell.static_prefix_chars)
+        start = time.perf_counter()
+        try:
+            result = llm_service.stream_generate(llm, cell.full_prompt, cancel_token=cancel_token, static_prefix_chars=cell.static_prefix_chars)
+        except (requests.HTTPError, httpx.HTTPStatusError) as e:
+            if e.response is not None:
+                exchange_fixtures.record_error(llm, cell.full_prompt, e.response.status_code, str(e), int((time.perf_counter() - start) * 1000))
+            raise
+        exchange_fixtures.record(llm, cell.full_prompt, result)
+        return result
+    text = f"SELECT 1; -- MOCK SQL for NLQ: {cell.nlq_text} / LLM: {llm.name} / PromptSet: {cell.prompt_set_id}"
+    return mock_provider.stream_generate(llm, cell.full_prompt, text, cancel_token)
+
+# Shared by every run on the job runner loop, so provider and API key caps apply across runs
+engine = EvaluationEngine(generate=generate_for_cell, provider_of=provider_of, classify_error=classify_llm_error)
+batch_executor = BatchExecutor(engine, provider_of=provider_of, classify_error=classify_llm_error)
+
+# Cancellation tokens of runs submitted to the job runner, keyed by run id
+cancel_tokens: Dict[int, CancellationToken] = {}
+
+def pending_cell_keys(db: Session, run, exclude_statuses) -> List[tuple]:
+    """
+    Returns the (nlq_id, prompt_set_id, llm_config_id) cells of a run that still need
+    to be dispatched: the requested matrix minus cells that already have a result
+    whose status is in exclude_statuses. Computed with a single EXCEPT query.
+    """
+    parameters = run.parameters or {}
+    # The matrix is a deliberate cross product; explicit ON TRUE joins say so to SQLAlchemy
+    requested = (
+        select(core.NLQ.id, core.PromptSet.id, core.LLMConfig.id)
+        .select_from(core.NLQ)
+        .join(core.PromptSet, true())
+        .join(core.LLMConfig, true())
+        .where(
+            core.NLQ.id.in_(parameters.get("nlq_ids", [])),
+            core.PromptSet.id.in_(parameters.get("prompt_set_ids", [])),
+            core.LLMConfig.id.in_(parameters.get("llm_config_ids", [])),
+        )
+    )
+    finished = select(
+        core.GeneratedResult.nlq_id,
+        core.GeneratedResult.prompt_set_id,
+        core.GeneratedResult.llm_config_id,
+    ).where(
+        core.GeneratedResult.validation_run_id == run.id,
+        core.GeneratedResult.status.in_(exclude_statuses),
+    )
+    return [tuple(row) for row in db.execute(except_(requested, finished)).all()]
+
+def load_reference_rows(db: Session, parameters: dict):
+    """
+    Loads every NLQ, PromptSet and LLMConfig a run refers to with one IN query each.
+    Returns (nlqs, prompt_sets, llm_configs) as dicts keyed by id.
+    """
+    nlqs = {n.id: n for n in db.query(core.NLQ).filter(core.NLQ.id.in_(parameters.get("nlq_ids", []))).all()}
+    prompt_sets = {p.id: p for p in db.query(core.PromptSet).filter(core.PromptSet.id.in_(parameters.get("prompt_set_ids", []))).all()}
+    llm_configs = {l.id: l for l in db.query(core.LLMConfig).filter(core.LLMConfig.id.in_(parameters.get("llm_config_ids", []))).all()}
+    return nlqs, prompt_sets, llm_configs
+
+def seed_hedging_history(db: Session, llm_configs: dict):
+    """
+    Seeds llm_service's hedging policy with the latest successful response times of
+    each hedging-enabled model not seen yet, with one window-function query. Cache
+    hits and batch results are skipped: their times are not model latency.
+    """
+    models = {c.model for c in llm_configs.values() if c.hedging_enabled and llm_service.hedging.needs_history(c.model)}
+    if not models:
+        return
+    GR, LC = core.GeneratedResult, core.LLMConfig
+    recent = (
+        select(
+            LC.model.label("model"),
+            GR.llm_response_time_ms.label("latency_ms"),
+            func.row_number().over(partition_by=LC.model, order_by=GR.id.desc()).label("recency"),
+        )
+        .join(LC, LC.id == GR.llm_config_id)
+        .where(
+            LC.model.in_(models),
+            GR.status == GR.STATUS_SUCCESS,
+            GR.cache_hit.is_(False),
+            GR.aborted_early.is_(False),
+            GR.batch_id.is_(None),
+            GR.llm_response_time_ms > 0,
+        )
+        .subquery()
+    )
+    latencies = {model: [] for model in models}
+    rows = db.execute(
+        select(recent.c.model, recent.c.latency_ms)
+        .where(recent.c.recency <= llm_service.hedging.history_size)
+        .order_by(recent.c.model, recent.c.recency.desc())
+    )
+    for model, latency_ms in rows:
+        latencies[model].append(latency_ms)
+    for model, history in latencies.items():
+        llm_service.hedging.seed(model, history)
+
+def build_cells(cell_keys: List[tuple], nlqs: dict, prompt_sets: dict, llm_configs: dict) -> List[EvaluationCell]:
+    """
+    Builds evaluation cells for the given (nlq_id, prompt_set_id, llm_config_id) keys
+    from preloaded reference rows.
+    Each prompt set is compiled once per run and rendered once per (NLQ, prompt set) pair.
+    """
+    cells = []
+    templates = {}
+    prompts = {}
+    static_prefixes = {}
+    prompt_sets_base_dir = "prompt_sets"  # Adjust this path as needed for your deployment
+    for nlq_id, prompt_set_id, llm_config_id in cell_keys:
+        nlq = nlqs[nlq_id]
+        prompt_set = prompt_sets[prompt_set_id]
+        if prompt_set_id not in templates:
+            # --- Compile the prompt set (includes resolved) once for the whole run ---
+            try:
+                templates[prompt_set_id] = file_readers.compile_prompt_set_by_name(prompt_set.name, prompt_sets_base_dir)
+            except Exception as e:
+                logger.error(f"Error constructing prompt for PromptSet {prompt_set.name}: {e}")
+                templates[prompt_set_id] = e
+        if (nlq_id, prompt_set_id) not in prompts:
+            logger.info(f"Evaluating NLQ id {nlq_id}: {getattr(nlq, 'nlq_text', None)}")
+            logger.info(f"  Using prompt set {prompt_set_id}")
+            macros = {
+                "NLQ": nlq.nlq_text,
+                "BASELINE_SQL": "",
+                # Add more as needed
+            }
+            template = templates[prompt_set_id]
+            try:
+                if isinstance(template, Exception):
+                    raise template
+                prompts[(nlq_id, prompt_set_id)] = template.render(macros)
+                static_prefixes[(nlq_id, prompt_set_id)] = template.static_prefix_chars
+            except Exception as e:
+                logger.error(f"Error constructing prompt for PromptSet {prompt_set.name}: {e}")
+                prompts[(nlq_id, prompt_set_id)] = f"[Prompt construction error: {e}]"
+        cells.append(EvaluationCell(
+            nlq_id=nlq_id,
+            prompt_set_id=prompt_set_id,
+            llm_config_id=llm_config_id,
+            full_prompt=prompts[(nlq_id, prompt_set_id)],
+            nlq_text=nlq.nlq_text,
+            static_prefix_chars=static_prefixes.get((nlq_id, prompt_set_id), 0),
+        ))
+    return cells
+
+class ResultWriter:
+    """
+    Buffers finished cells and writes them to generated_results with one bulk
+    INSERT per batch, then publishes them to run event subscribers. A batch is
+    flushed once it reaches batch_size rows or flush_interval seconds have
+    passed, whichever comes first.
+    """
+
+    def __init__(self, db: Session, run, batch_size: int = RESULT_BATCH_SIZE, flush_interval: float = RESULT_FLUSH_INTERVAL_SECONDS):
+        self.db = db
+        self.run = run
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows = []
+        self.last_flush = time.monotonic()
+
+    def add(self, outcome: CellOutcome):
+        generated_sql = outcome.generated_sql
+        # The comment header is rendered on read from the structured columns (GeneratedResult.render_sql)
+        logger.info(f"    Generated SQL: {generated_sql[:80]}{'...' if len(generated_sql) > 80 else ''}")
+        self.rows.append(core.GeneratedResult(
+            validation_run_id=self.run.id,
+            nlq_id=outcome.cell.nlq_id,
+            prompt_set_id=outcome.cell.prompt_set_id,
+            prompt_component_id=None,
+            llm_config_id=outcome.cell.llm_config_id,
+            generated_sql=generated_sql,
+            full_prompt=outcome.cell.full_prompt,
+            human_evaluation_tag="",  # Use empty string for safety
+            comments="",  # Use empty string for safety
+            llm_response_time_ms=outcome.llm_response_time_ms,
+            status=outcome.status,
+            error_class=outcome.error_class,
+            unique_id=''.join(random.choices(string.ascii_uppercase + string.digits, k=5)),
+            time_to_first_token_ms=outcome.time_to_first_token_ms,
+            output_tokens_per_second=outcome.output_tokens_per_second,
+            aborted_early=outcome.aborted_early,
+            cache_hit=bool(outcome.cache_hit),
+            retry_count=outcome.retries,
+            prompt_tokens=outcome.prompt_tokens,
+            completion_tokens=outcome.completion_tokens,
+            cached_tokens=outcome.cached_tokens,
+            hedged=outcome.hedged,
+            hedge_won=outcome.hedge_won,
+            batch_id=outcome.batch_id,
+            batch_turnaround_ms=outcome.batch_turnaround_ms,
+        ))
+        if len(self.rows) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        rows = self._owned_rows(rows)
+        # add_all is flushed as a batched multi-row INSERT that also returns the new ids
+        self.db.add_all(rows)
+        statuses = [row.status for row in rows]
+        failed = statuses.count(core.GeneratedResult.STATUS_ERROR)
+        skipped = statuses.count(core.GeneratedResult.STATUS_SKIPPED)
+        counts = {
+            "completed_cells": len(rows) - failed - skipped,
+            "failed_cells": failed,
+            "skipped_cells": skipped,
+        }
+        if (self.run.parameters or {}).get("use_cache"):
+            cache_hits = sum(1 for row in rows if row.cache_hit)
+            counts["cache_hits"] = cache_hits
+            counts["cache_misses"] = len(rows) - skipped - cache_hits
+        self._record_counts(counts)
+        self.db.commit()
+        if run_events.has_subscribers(self.run.id):
+            # Related rows are preloaded in this session, so rendering the header issues no queries
+            for row in rows:
+                run_events.publish(self.run.id, EVENT_RESULT, to_result_summary(row))
+            run_events.publish(self.run.id, EVENT_PROGRESS, self.run.progress())
+
+    def _owned_rows(self, rows: list) -> list:
+        """Rows this writer may store; overridden by workers that can lose a lease."""
+        return rows
+
+    def _record_counts(self, counts: dict):
+        """Adds counts (ValidationRun column name -> increment) to the run."""
+        for column, increment in counts.items():
+            setattr(self.run, column, (getattr(self.run, column) or 0) + increment)
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+async def execute_run(run_id: int, retry_failed: bool = False):
+    """
+    Executes (or continues) a validation run on the job runner loop.
+    Cells that already have a GeneratedResult are skipped, so this is safe to call
+    again for a run that was interrupted by a restart. With retry_failed, cells whose
+    result failed are dispatched again and their failed rows replaced. Cells skipped
+    by an earlier cancellation are always dispatched again.
+    """
+    cancel_token = cancel_tokens.setdefault(run_id, CancellationToken())
+    try:
+        with count_queries() as query_counter:
+            await _execute_run(run_id, retry_failed, query_counter, cancel_token)
+    finally:
+        if cancel_tokens.get(run_id) is cancel_token:
+            del cancel_tokens[run_id]
+
+def prepare_pending_cells(db: Session, run, retry_failed: bool = False) -> List[tuple]:
+    """
+    Drops the run's skipped rows (and failed rows with retry_failed), recounts its
+    finished cells and returns the cell keys that still need to be dispatched.
+    The caller commits.
+    """
+    GR = core.GeneratedResult
+    # Skipped rows are placeholders for cells a cancelled run never finished
+    replaced_statuses = [GR.STATUS_SKIPPED, GR.STATUS_ERROR] if retry_failed else [GR.STATUS_SKIPPED]
+    db.query(GR).filter(GR.validation_run_id == run.id, GR.status.in_(replaced_statuses)).delete(synchronize_session=False)
+    cell_keys = pending_cell_keys(db, run, exclude_statuses=[GR.STATUS_SUCCESS, GR.STATUS_ERROR])
+    run.completed_cells = db.query(GR).filter(GR.validation_run_id == run.id, GR.status == GR.STATUS_SUCCESS).count()
+    run.failed_cells = db.query(GR).filter(GR.validation_run_id == run.id, GR.status == GR.STATUS_ERROR).count()
+    run.skipped_cells = 0
+    run.total_cells = len(cell_keys) + run.completed_cells + run.failed_cells
+    return cell_keys
+
+def cancellation_message(run, reason: str) -> str:
+    if reason == core.GeneratedResult.ERROR_DEADLINE:
+        return f"Deadline of {(run.parameters or {}).get('deadline_seconds')} seconds exceeded"
+    return "Cancelled by request"
+
+async def _execute_run(run_id: int, retry_failed: bool, query_counter, cancel_token: CancellationToken):
+    # Preloaded reference rows must stay loaded across the per-batch commits
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        run = db.query(core.ValidationRun).filter(core.ValidationRun.id == run_id).first()
+        if not run:
+            logger.warning(f"ValidationRun id {run_id} not found.")
+            return
+        run.status = core.ValidationRun.STATUS_RUNNING
+        run.started_at = run.started_at or datetime.utcnow()
+        run.error = None
+        db.commit()
+
+        nlqs, prompt_sets, llm_configs = load_reference_rows(db, run.parameters or {})
+        seed_hedging_history(db, llm_configs)
+        cell_keys = prepare_pending_cells(db, run, retry_failed)
+        cells = build_cells(cell_keys, nlqs, prompt_sets, llm_configs)
+        db.commit()
+        run_events.publish(run.id, EVENT_PROGRESS, run.progress())
+
+        writer = ResultWriter(db, run)
+        flusher = asyncio.create_task(writer.flush_periodically())
+        try:
+            deadline_seconds = (run.deadline_at - datetime.utcnow()).total_seconds() if run.deadline_at else None
+            cache = response_cache if (run.parameters or {}).get("use_cache") else None
+            if is_batch_run(run):
+                jobs = {int(llm_config_id): batch_id for llm_config_id, batch_id in (run.parameters.get("batch_jobs") or {}).items()}
+                await batch_executor.run(
+                    cells, llm_configs, writer.add, cancel_token=cancel_token, deadline_seconds=deadline_seconds, cache=cache,
+                    jobs=jobs, on_submitted=lambda llm_config_id, batch_id: record_batch_job(db, run, llm_config_id, batch_id),
+                )
+            else:
+                await engine.run(cells, llm_configs, writer.add, cancel_token=cancel_token, deadline_seconds=deadline_seconds, cache=cache)
+        finally:
+            flusher.cancel()
+            writer.flush()
+
+        if cancel_token.cancelled:
+            run.status = core.ValidationRun.STATUS_CANCELLED
+            run.error = cancellation_message(run, cancel_token.reason)
+        else:
+            run.status = core.ValidationRun.STATUS_COMPLETED
+        run.finished_at = datetime.utcnow()
+        run.query_stats = dict(query_counter, cells=run.total_cells)
+        db.commit()
+        run_events.publish(run.id, EVENT_DONE, run.progress())
+        logger.info(f"Evaluation run {run.id} {run.status}. SQL statements: {dict(query_counter)}")
+    except Exception as e:
+        logger.exception(f"Error in evaluation run {run_id}")
+        db.rollback()
+        run = db.query(core.ValidationRun).filter(core.ValidationRun.id == run_id).first()
+        if run:
+            run.status = core.ValidationRun.STATUS_FAILED
+            run.finished_at = datetime.utcnow()
+            run.error = str(e)
+            run.query_stats = dict(query_counter, cells=run.total_cells)
+            db.commit()
+            run_events.publish(run.id, EVENT_DONE, run.progress())
+    finally:
+        db.close()
+
+def is_batch_run(run) -> bool:
+    return (run.parameters or {}).get("execution_mode") == EXECUTION_MODE_BATCH
+
+def record_batch_job(db: Session, run, llm_config_id: int, batch_id):
+    """
+    Stores the id of a submitted batch job in the run's parameters, so a restarted
+    run polls it instead of submitting again; batch_id None removes it.
+    """
+    parameters = dict(run.parameters or {})
+    jobs = dict(parameters.get("batch_jobs") or {})
+    if batch_id is None:
+        jobs.pop(str(llm_config_id), None)
+    else:
+        jobs[str(llm_config_id)] = batch_id
+    parameters["batch_jobs"] = jobs
+    run.parameters = parameters
+    db.commit()
+
+def enqueue_run(run_id: int, retry_failed: bool = False):
+    """Queues the pending cells of a run as work items for app.worker processes."""
+    db = SessionLocal()
+    try:
+        run = db.query(core.ValidationRun).filter(core.ValidationRun.id == run_id).first()
+        if not run:
+            logger.warning(f"ValidationRun id {run_id} not found.")
+            return
+        cell_keys = prepare_pending_cells(db, run, retry_failed)
+        queued = work_queue.enqueue(db, run.id, cell_keys)
+        if not queued:
+            run.status = core.ValidationRun.STATUS_COMPLETED
+            run.finished_at = datetime.utcnow()
+        db.commit()
+        logger.info(f"Queued {queued} work items for evaluation run {run_id}")
+    finally:
+        db.close()
+
+def submit_run(run_id: int, retry_failed: bool = False, execution_mode: str = EXECUTION_MODE_ONLINE):
+    if DISPATCH_MODE == DISPATCH_MODE_WORKERS and execution_mode != EXECUTION_MODE_BATCH:
+        enqueue_run(run_id, retry_failed=retry_failed)
+        return
+    # Registered before the job starts so a queued run can be cancelled too
+    if not job_runner.is_active(run_id):
+        cancel_tokens[run_id] = CancellationToken()
+    job_runner.submit(run_id, lambda: execute_run(run_id, retry_failed=retry_failed))
+
+def is_run_active(run) -> bool:
+    """Whether a job, in this process or on a worker, may still be executing the run."""
+    if DISPATCH_MODE == DISPATCH_MODE_WORKERS and not is_batch_run(run):
+        return run.status in (core.ValidationRun.STATUS_QUEUED, core.ValidationRun.STATUS_RUNNING)
+    return job_runner.is_active(run.id)
+
+def resume_unfinished_runs():
+    """Re-queues runs that were queued or running when the server last stopped."""
+    db = SessionLocal()
+    try:
+        unfinished = db.query(core.ValidationRun).filter(
+            core.ValidationRun.status.in_([core.ValidationRun.STATUS_QUEUED, core.ValidationRun.STATUS_RUNNING])
+        ).all()
+        # Workers reclaim the expired leases of interrupted cells themselves
+        unfinished = [(run.id, is_batch_run(run)) for run in unfinished if is_batch_run(run) or DISPATCH_MODE != DISPATCH_MODE_WORKERS]
+    finally:
+        db.close()
+    for run_id, batch in unfinished:
+        logger.info(f"Resuming unfinished evaluation run {run_id}")
+        submit_run(run_id, execution_mode=EXECUTION_MODE_BATCH if batch else EXECUTION_MODE_ONLINE)
+
 @router.post("/evaluate/run", response_model=EvaluateRunResponse)
 def evaluate_run(req: EvaluateRunRequest, db: Session = Depends(get_db)):
+    if req.execution_mode not in (EXECUTION_MODE_ONLINE, EXECUTION_MODE_BATCH):
+        raise HTTPException(status_code=400, detail=f"Unknown execution_mode: {req.execution_mode}")
     try:
         logger.info(f"Starting evaluation run. NLQ IDs: {req.nlq_ids}, Prompt Set IDs: {req.prompt_set_ids}, LLM Config IDs: {req.llm_config_ids}")
         logger.info(f"Database path: {SQLALCHEMY_DATABASE_URL}")
         logger.info(f"Using database file: {SQLALCHEMY_DATABASE_URL.split(':///')[-1]}")
+        timestamp = datetime.utcnow()
         run = core.ValidationRun(
-            timestamp=datetime.utcnow(),
+            timestamp=timestamp,
             parameters={
                 "llm_config_ids": req.llm_config_ids,
                 "prompt_set_ids": req.prompt_set_ids,
-                "nlq_ids": req.nlq_ids
-            }
+                "nlq_ids": req.nlq_ids,
+                "deadline_seconds": req.deadline_seconds,
+                "use_cache": req.use_cache,
+                "execution_mode": req.execution_mode,
+            },
+            status=core.ValidationRun.STATUS_QUEUED,
+            total_cells=len(req.nlq_ids) * len(req.prompt_set_ids) * len(req.llm_config_ids),
+            deadline_at=timestamp + timedelta(seconds=req.deadline_seconds) if req.deadline_seconds else None,
         )
         db.add(run)
         db.commit()
         db.refresh(run)
-
-        for nlq_id in req.nlq_ids:
-            nlq = db.query(core.NLQ).filter(core.NLQ.id == nlq_id).first()
-            if not nlq:
-                logger.warning(f"NLQ id {nlq_id} not found.")
-                continue
-            logger.info(f"Evaluating NLQ id {nlq_id}: {getattr(nlq, 'nlq_text', None)}")
-            for prompt_set_id in req.prompt_set_ids:
-                logger.info(f"  Using prompt set {prompt_set_id}")
-                # --- Refactor: Use load_prompt_set_by_name to load prompt with macros and includes ---
-                prompt_set = db.query(core.PromptSet).filter(core.PromptSet.id == prompt_set_id).first()
-                if not prompt_set:
-                    logger.warning(f"PromptSet id {prompt_set_id} not found.")
-                    continue
-                prompt_sets_base_dir = "prompt_sets"  # Adjust this path as needed for your deployment
-                prompt_set_name = prompt_set.name
-                macros = {
-                    "NLQ": nlq.nlq_text,
-                    "BASELINE_SQL": "",
-                    # Add more as needed
-                }
-                try:
-                    full_prompt = file_readers.load_prompt_set_by_name(prompt_set_name, prompt_sets_base_dir, macros)
-                except Exception as e:
-                    logger.error(f"Error constructing prompt for PromptSet {prompt_set_name}: {e}")
-                    full_prompt = f"[Prompt construction error: {e}]"
-                for llm_config_id in req.llm_config_ids:
-                    llm = db.query(core.LLMConfig).filter(core.LLMConfig.id == llm_config_id).first()
-                    logger.info(f"    Calling LLM {llm.name} (model: {llm.model}) for NLQ {nlq_id} and Prompt Set {prompt_set_id}")
-                    try:
-                        llm_response_time_ms = None
-                        if llm.model.startswith("gemini"):
-                            start = time.perf_counter()
-                            generated_sql = call_gemini_llm(full_prompt, llm)
-                            end = time.perf_counter()
-                            llm_response_time_ms = int((end - start) * 1000)
-                        else:
-                            generated_sql = f"SELECT 1; -- MOCK SQL for NLQ: {nlq.nlq_text} / LLM: {llm.name} / PromptSet: {prompt_set_id}"
-                            llm_response_time_ms = 0
-                        # Do not prepend any comment block here. Comment block will be added after result.id is known.
-                        logger.info(f"    Generated SQL: {generated_sql[:80]}{'...' if len(generated_sql) > 80 else ''}")
-                    except Exception as llm_exc:
-                        logger.error(f"    Error calling LLM: {llm_exc}")
-                        generated_sql = f"-- ERROR: {llm_exc}"
-                        llm_response_time_ms = 0
-                    result = core.GeneratedResult(
-                        validation_run_id=run.id,
-                        nlq_id=nlq.id,
-                        prompt_set_id=prompt_set_id,
-                        prompt_component_id=None,
-                        llm_config_id=llm.id,
-                        generated_sql=generated_sql,
-                        full_prompt=full_prompt,
-                        human_evaluation_tag="",  # Use empty string for safety
-                        comments="",  # Use empty string for safety
-                        llm_response_time_ms=llm_response_time_ms
-                    )
-                    db.add(result)
-        db.commit()
-        # After commit, update each result to prepend the single, final comment block with NLQ, Prompt/Model, Unique ID, and Result ID
-        results = db.query(core.GeneratedResult).filter(core.GeneratedResult.validation_run_id == run.id).all()
-        import random, string
-        for result in results:
-            nlq = db.query(core.NLQ).filter(core.NLQ.id == result.nlq_id).first()
-            prompt_set = db.query(core.PromptSet).filter(core.PromptSet.id == result.prompt_set_id).first()
-            llm = db.query(core.LLMConfig).filter(core.LLMConfig.id == result.llm_config_id).first()
-            unique_id = ''.join(random.choices(string.ascii_uppercase + string.digits, k=5))
-            sql_comment = f"-- NLQ: {nlq.nlq_text}\n-- Prompt/Model: {prompt_set.name} / {llm.name}\n-- Unique ID: {unique_id}\n-- Result ID: {result.id}\n\n"
-            # Remove any previous similar comment block if present
-            sql_lines = result.generated_sql.splitlines()
-            # Remove lines that look like our comment block (start with -- NLQ:, -- Prompt/Model:, -- Unique ID:, -- Result ID:)
-            filtered_sql_lines = []
-            skipping = True
-            for line in sql_lines:
-                if skipping and (line.startswith('-- NLQ:') or line.startswith('-- Prompt/Model:') or line.startswith('-- Unique ID:') or line.startswith('-- Result ID:')):
-                    continue
-                else:
-                    skipping = False
-                    filtered_sql_lines.append(line)
-            new_generated_sql = sql_comment + '\n'.join(filtered_sql_lines).lstrip('\n')
-            result.generated_sql = new_generated_sql
-        db.commit()
-        logger.info(f"Evaluation run {run.id} completed.")
-        return EvaluateRunResponse(run_id=run.id)
+        submit_run(run.id, execution_mode=req.execution_mode)
+        return EvaluateRunResponse(run_id=run.id, status=run.status)
     except Exception as e:
         logger.exception("Error in evaluate_run orchestration")
         raise HTTPException(status_code=500, detail=f"Evaluation failed: {str(e)}")
+
+@router.post("/runs/{run_id}/resume", response_model=EvaluateRunResponse)
+def resume_run(run_id: int, db: Session = Depends(get_db)):
+    """
+    Re-dispatches only the cells of a run that are missing, failed or skipped.
+    The run's deadline, if any, starts again from now.
+    """
+    run = db.query(core.ValidationRun).filter(core.ValidationRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="ValidationRun not found")
+    if is_run_active(run):
+        raise HTTPException(status_code=409, detail="ValidationRun is still in progress")
+    run.status = core.ValidationRun.STATUS_QUEUED
+    run.finished_at = None
+    deadline_seconds = (run.parameters or {}).get("deadline_seconds")
+    run.deadline_at = datetime.utcnow() + timedelta(seconds=deadline_seconds) if deadline_seconds else None
+    db.commit()
+    logger.info(f"Resuming evaluation run {run_id} (missing and failed cells only)")
+    submit_run(run_id, retry_failed=True, execution_mode=(run.parameters or {}).get("execution_mode", EXECUTION_MODE_ONLINE))
+    return EvaluateRunResponse(run_id=run.id, status=run.status)
+
+@router.post("/runs/{run_id}/cancel", response_model=RunStatusRead)
+def cancel_run(run_id: int, db: Session = Depends(get_db)):
+    """
+    Cancels a queued or running run. In-flight provider calls are stopped, cells
+    that did not finish are recorded as skipped, and results already generated
+    remain available from /runs/{run_id}. The run moves to cancelled once its job
+    has wound down.
+    """
+    run = db.query(core.ValidationRun).filter(core.ValidationRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="ValidationRun not found")
+    if run.status not in (core.ValidationRun.STATUS_QUEUED, core.ValidationRun.STATUS_RUNNING):
+        raise HTTPException(status_code=409, detail=f"ValidationRun is already {run.status}")
+    cancel_token = cancel_tokens.get(run_id)
+    if cancel_token and job_runner.is_active(run_id):
+        logger.info(f"Cancelling evaluation run {run_id}")
+        cancel_token.cancel(core.GeneratedResult.ERROR_CANCELLED)
+    else:
+        # No job is executing the run in this process; workers stop on seeing the status
+        run.status = core.ValidationRun.STATUS_CANCELLED
+        run.finished_at = datetime.utcnow()
+        run.error = cancellation_message(run, core.GeneratedResult.ERROR_CANCELLED)
+        db.commit()
+    return RunStatusRead(**run.progress(), query_stats=run.query_stats)
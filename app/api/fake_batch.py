@@ -0,0 +1,95 @@
+"""
+Local fake of the OpenAI Files + Batches API, for testing batch runs offline.
+
+Enabled with EVAL_FAKE_BATCH_ENABLED=1 and used by pointing EVAL_BATCH_BASE_URL at
+http://<host>:<port>/fake_batch/v1. Batches complete EVAL_FAKE_BATCH_SECONDS after
+they are created and answer every request with mock SQL. State is in memory.
+"""
+import json
+import os
+import time
+import uuid
+from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+
+FAKE_BATCH_ENABLED = os.getenv("EVAL_FAKE_BATCH_ENABLED", "").lower() in ("1", "true", "yes")
+FAKE_BATCH_SECONDS = float(os.getenv("EVAL_FAKE_BATCH_SECONDS", "2"))
+
+router = APIRouter(prefix="/fake_batch/v1")
+
+files = {}
+batches = {}
+
+def fake_response(request: dict) -> dict:
+    prompt = request["body"]["messages"][-1]["content"]
+    text = f"SELECT 1; -- FAKE BATCH SQL for model {request['body']['model']}"
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = max(1, len(text) // 4)
+    return {
+        "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+        "custom_id": request["custom_id"],
+        "response": {
+            "status_code": 200,
+            "body": {
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            },
+        },
+        "error": None,
+    }
+
+def refresh(batch: dict) -> dict:
+    """Completes the batch once FAKE_BATCH_SECONDS have passed since it was created."""
+    if batch["status"] == "in_progress" and time.time() - batch["created_at"] >= FAKE_BATCH_SECONDS:
+        requests = [json.loads(line) for line in files[batch["input_file_id"]].splitlines() if line.strip()]
+        output_file_id = f"file-{uuid.uuid4().hex[:12]}"
+        files[output_file_id] = "\n".join(json.dumps(fake_response(request)) for request in requests)
+        batch.update(status="completed", output_file_id=output_file_id, completed_at=int(time.time()),
+                     request_counts={"total": len(requests), "completed": len(requests), "failed": 0})
+    return batch
+
+@router.post("/files")
+async def upload_file(purpose: str = Form(...), file: UploadFile = File(...)):
+    file_id = f"file-{uuid.uuid4().hex[:12]}"
+    files[file_id] = (await file.read()).decode("utf-8")
+    return {"id": file_id, "object": "file", "purpose": purpose, "filename": file.filename}
+
+@router.get("/files/{file_id}/content", response_class=PlainTextResponse)
+def get_file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="File not found")
+    return files[file_id]
+
+@router.post("/batches")
+def create_batch(body: dict):
+    if body.get("input_file_id") not in files:
+        raise HTTPException(status_code=400, detail="input_file_id not found")
+    batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+    batches[batch_id] = {
+        "id": batch_id,
+        "object": "batch",
+        "endpoint": body.get("endpoint"),
+        "input_file_id": body["input_file_id"],
+        "completion_window": body.get("completion_window"),
+        "status": "in_progress",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": time.time(),
+    }
+    return batches[batch_id]
+
+@router.get("/batches/{batch_id}")
+def get_batch(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return refresh(batches[batch_id])
+
+@router.post("/batches/{batch_id}/cancel")
+def cancel_batch(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    batch = refresh(batches[batch_id])
+    if batch["status"] == "in_progress":
+        batch["status"] = "cancelled"
+    return batch
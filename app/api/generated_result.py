@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from app.api.nlq import get_db
 from fastapi import Body
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from app.database.database import SessionLocal
 from app.models import core
 from app.schemas import GeneratedResultCreate, GeneratedResultRead
@@ -10,6 +10,12 @@ from pydantic import BaseModel
 
 router = APIRouter()
 
+def to_result_read(result: core.GeneratedResult) -> GeneratedResultRead:
+    """Serializes a result with its SQL comment header rendered from the structured columns."""
+    result_read = GeneratedResultRead.from_orm(result)
+    result_read.generated_sql = result.render_sql()
+    return result_read
+
 @router.get("/nlqs/{nlq_id}/baseline_sql", response_model=GeneratedResultRead)
 def get_baseline_sql_for_nlq(nlq_id: int, db: Session = Depends(get_db)):
     # Try to fetch the baseline
@@ -18,14 +24,14 @@ def get_baseline_sql_for_nlq(nlq_id: int, db: Session = Depends(get_db)):
         core.GeneratedResult.is_baseline == True
     ).order_by(core.GeneratedResult.id.desc()).first()
     if baseline:
-        return baseline
+        return to_result_read(baseline)
     # Fallback: latest 'Correct'
     correct = db.query(core.GeneratedResult).filter(
         core.GeneratedResult.nlq_id == nlq_id,
         core.GeneratedResult.human_evaluation_tag == "Correct"
     ).order_by(core.GeneratedResult.id.desc()).first()
     if correct:
-        return correct
+        return to_result_read(correct)
     raise HTTPException(status_code=404, detail="No baseline or correct SQL found for this NLQ.")
 
 def get_db():
@@ -45,11 +51,16 @@ def create_generated_result(result_in: GeneratedResultCreate, db: Session = Depe
     db.add(result)
     db.commit()
     db.refresh(result)
-    return result
+    return to_result_read(result)
 
 @router.get("/generated_results", response_model=List[GeneratedResultRead])
 def list_generated_results(db: Session = Depends(get_db)):
-    return db.query(core.GeneratedResult).all()
+    results = db.query(core.GeneratedResult).options(
+        joinedload(core.GeneratedResult.nlq),
+        joinedload(core.GeneratedResult.prompt_set),
+        joinedload(core.GeneratedResult.llm_config),
+    ).all()
+    return [to_result_read(r) for r in results]
 
 @router.put("/generated_results/{result_id}", response_model=GeneratedResultRead)
 def update_generated_result(result_id: int, update: GeneratedResultUpdate = Body(...), db: Session = Depends(get_db)):
@@ -71,4 +82,4 @@ def update_generated_result(result_id: int, update: GeneratedResultUpdate = Body
         result.comments = update.comments
     db.commit()
     db.refresh(result)
-    return result
+    return to_result_read(result)
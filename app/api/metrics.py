@@ -0,0 +1,37 @@
+from fastapi import APIRouter
+from app.services.http_clients import http_clients
+from app.services.llm_service import llm_service, rate_limiter
+from app.services.resilience import circuit_breakers
+from app.utils.file_cache import file_cache
+
+router = APIRouter()
+
+@router.get("/metrics/http_pools")
+def get_http_pool_stats():
+    """Connection pool statistics per provider host, for tuning the EVAL_HTTP_* limits."""
+    return http_clients.stats()
+
+@router.get("/metrics/rate_limits")
+def get_rate_limit_stats():
+    """Token-bucket state per provider and API key (last 4 characters of the key)."""
+    return rate_limiter.stats()
+
+@router.get("/metrics/circuit_breakers")
+def get_circuit_breaker_stats():
+    """Circuit breaker state and recent failure counts per provider and model."""
+    return circuit_breakers.stats()
+
+@router.get("/metrics/context_caches")
+def get_context_cache_stats():
+    """Gemini context caches created for static prompt prefixes ({{cache_break}})."""
+    return llm_service.context_cache.stats()
+
+@router.get("/metrics/hedging")
+def get_hedging_stats():
+    """Hedge delay (p95 response time), sample count and hedged/won calls per model."""
+    return llm_service.hedging.stats()
+
+@router.get("/metrics/file_cache")
+def get_file_cache_stats():
+    """Prompt-set file cache size and hit rate (EVAL_FILE_CACHE_MAX_BYTES, EVAL_FILE_CACHE_WATCH)."""
+    return file_cache.stats()
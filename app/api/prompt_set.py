@@ -2,7 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.database.database import SessionLocal
 from app.models import core
-from app.schemas import PromptSetCreate, PromptSetRead
+from app.schemas import PromptSetCreate, PromptSetRead, PromptSetProfile
+from app.services.prompt_profiler import prompt_profiler
 from typing import List
 
 router = APIRouter()
@@ -25,3 +26,18 @@ def create_prompt_set(prompt_set_in: PromptSetCreate, db: Session = Depends(get_
 @router.get("/prompt_sets", response_model=List[PromptSetRead])
 def list_prompt_sets(db: Session = Depends(get_db)):
     return db.query(core.PromptSet).all()
+
+@router.get("/prompt_sets/{prompt_set_id}/profile", response_model=PromptSetProfile)
+def profile_prompt_set(prompt_set_id: int, nlq: str = "", db: Session = Depends(get_db)):
+    """
+    Renders the prompt set for nlq and reports its token counts per include file
+    and against the context window of every configured LLM.
+    """
+    prompt_set = db.query(core.PromptSet).filter(core.PromptSet.id == prompt_set_id).first()
+    if not prompt_set:
+        raise HTTPException(status_code=404, detail="Prompt set not found")
+    llm_configs = db.query(core.LLMConfig).all()
+    try:
+        return prompt_profiler.profile(prompt_set, llm_configs, nlq=nlq)
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Prompt construction error: {e}")
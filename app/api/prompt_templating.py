@@ -1,18 +1,26 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from app.utils.prompt_templating import apply_prompt_template
-from typing import Dict
+from app.utils.prompt_templating import MissingMacrosError, apply_prompt_template, compile_template
+from typing import Any, Dict, List, Optional
 
 router = APIRouter()
 
 class PromptTemplateRequest(BaseModel):
     template: str
-    macros: Dict[str, str]
+    macros: Dict[str, Any] = {}
+    macro_sets: Optional[List[Dict[str, Any]]] = None  # Batch mode: render the template once per macro dict
+    strict: bool = False  # Reject missing macros instead of leaving them in place
 
 class PromptTemplateResponse(BaseModel):
-    result: str
+    result: Optional[str] = None
+    results: Optional[List[str]] = None
 
 @router.post("/prompt_template", response_model=PromptTemplateResponse)
 def prompt_template_endpoint(req: PromptTemplateRequest):
-    result = apply_prompt_template(req.template, req.macros)
-    return PromptTemplateResponse(result=result)
+    template = compile_template(req.template)
+    try:
+        if req.macro_sets is not None:
+            return PromptTemplateResponse(results=[template.render(macros, req.strict) for macros in req.macro_sets])
+        return PromptTemplateResponse(result=template.render(req.macros, req.strict))
+    except MissingMacrosError as e:
+        raise HTTPException(status_code=400, detail=str(e))
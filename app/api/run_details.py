@@ -1,9 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from app.database.database import SessionLocal
 from app.models import core
-from app.schemas import ValidationRunWithResults, GeneratedResultReadFull
+from app.schemas import ValidationRunWithResults, GeneratedResultReadFull, GeneratedResultSummary, RunStatusRead
+from app.services.job_runner import job_runner
+from app.services.run_events import run_events, format_sse, EVENT_RESULT, EVENT_PROGRESS, EVENT_DONE
+from fastapi.responses import StreamingResponse
 from typing import List
+import asyncio
+
+SSE_KEEPALIVE_SECONDS = 15
+# Runs executed by out-of-process workers publish no in-process events, so their streams poll the database
+SSE_POLL_SECONDS = 2
 
 router = APIRouter()
 
@@ -19,9 +27,17 @@ def get_run_details(run_id: int, db: Session = Depends(get_db)):
     run = db.query(core.ValidationRun).filter(core.ValidationRun.id == run_id).first()
     if not run:
         raise HTTPException(status_code=404, detail="ValidationRun not found")
-    results = db.query(core.GeneratedResult).filter(core.GeneratedResult.validation_run_id == run_id).all()
-    # Convert to Pydantic models
-    results_data = [GeneratedResultReadFull.from_orm(r) for r in results]
+    results = db.query(core.GeneratedResult).options(
+        joinedload(core.GeneratedResult.nlq),
+        joinedload(core.GeneratedResult.prompt_set),
+        joinedload(core.GeneratedResult.llm_config),
+    ).filter(core.GeneratedResult.validation_run_id == run_id).all()
+    # Convert to Pydantic models, rendering the SQL comment header from the structured columns
+    results_data = []
+    for r in results:
+        result_data = GeneratedResultReadFull.from_orm(r)
+        result_data.generated_sql = r.render_sql()
+        results_data.append(result_data)
     return ValidationRunWithResults(
         id=run.id,
         timestamp=run.timestamp.isoformat() if run.timestamp else None,
@@ -30,3 +46,110 @@ def get_run_details(run_id: int, db: Session = Depends(get_db)):
         selected_nlq_ids=run.parameters.get("nlq_ids", []),
         generated_results=results_data
     )
+
+@router.get("/runs/{run_id}/status", response_model=RunStatusRead)
+def get_run_status(run_id: int, db: Session = Depends(get_db)):
+    run = db.query(core.ValidationRun).filter(core.ValidationRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="ValidationRun not found")
+    return RunStatusRead(**run.progress(), query_stats=run.query_stats)
+
+def to_result_summary(result: core.GeneratedResult) -> dict:
+    """Result payload for run events: rendered SQL header, no full_prompt."""
+    summary = GeneratedResultSummary.from_orm(result)
+    summary.generated_sql = result.render_sql()
+    return summary.dict()
+
+def load_run_snapshot(run_id: int, after_id: int = 0):
+    """Returns (result summaries with id > after_id, progress), or None if the run does not exist."""
+    db = SessionLocal()
+    try:
+        run = db.query(core.ValidationRun).filter(core.ValidationRun.id == run_id).first()
+        if not run:
+            return None
+        results = db.query(core.GeneratedResult).options(
+            joinedload(core.GeneratedResult.nlq),
+            joinedload(core.GeneratedResult.prompt_set),
+            joinedload(core.GeneratedResult.llm_config),
+        ).filter(
+            core.GeneratedResult.validation_run_id == run_id,
+            core.GeneratedResult.id > after_id,
+        ).order_by(core.GeneratedResult.id).all()
+        return [to_result_summary(r) for r in results], run.progress()
+    finally:
+        db.close()
+
+def is_finished(progress: dict) -> bool:
+    return progress["status"] in (core.ValidationRun.STATUS_COMPLETED, core.ValidationRun.STATUS_FAILED, core.ValidationRun.STATUS_CANCELLED)
+
+@router.get("/runs/{run_id}/events")
+async def stream_run_events(run_id: int):
+    """
+    Server-Sent Events stream for a run. Results already persisted are sent first,
+    then each GeneratedResult (without full_prompt) as soon as it is written, plus
+    progress events. The stream ends with a done event once the run finishes.
+    """
+    # Subscribe before taking the snapshot so no result falls between the two
+    queue = run_events.subscribe(run_id)
+    try:
+        # Off the event loop, like the polling below: the snapshot queries block
+        snapshot = await asyncio.to_thread(load_run_snapshot, run_id)
+    except BaseException:
+        run_events.unsubscribe(run_id, queue)
+        raise
+    if snapshot is None:
+        run_events.unsubscribe(run_id, queue)
+        raise HTTPException(status_code=404, detail="ValidationRun not found")
+    results, progress = snapshot
+
+    async def event_stream():
+        try:
+            sent_ids = set()
+            for result in results:
+                sent_ids.add(result["id"])
+                yield format_sse(EVENT_RESULT, result)
+            yield format_sse(EVENT_PROGRESS, progress)
+            if is_finished(progress):
+                yield format_sse(EVENT_DONE, progress)
+                return
+            last_progress = progress
+            while True:
+                in_process = job_runner.is_active(run_id)
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS if in_process else SSE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    if in_process:
+                        yield ": keep-alive\n\n"
+                        continue
+                    polled = await asyncio.to_thread(load_run_snapshot, run_id, max(sent_ids, default=0))
+                    if polled is None:
+                        return
+                    new_results, polled_progress = polled
+                    for result in new_results:
+                        if result["id"] not in sent_ids:
+                            sent_ids.add(result["id"])
+                            yield format_sse(EVENT_RESULT, result)
+                    if is_finished(polled_progress):
+                        yield format_sse(EVENT_DONE, polled_progress)
+                        return
+                    if polled_progress != last_progress:
+                        last_progress = polled_progress
+                        yield format_sse(EVENT_PROGRESS, polled_progress)
+                    else:
+                        yield ": keep-alive\n\n"
+                    continue
+                if event == EVENT_RESULT:
+                    if data["id"] in sent_ids:
+                        continue
+                    sent_ids.add(data["id"])
+                yield format_sse(event, data)
+                if event == EVENT_DONE:
+                    return
+        finally:
+            run_events.unsubscribe(run_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,93 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy import String, and_, case, cast, func, select
+from sqlalchemy.orm import Session
+from app.database.database import SessionLocal
+from app.models import core
+from app.schemas import ModelPriceCreate, ModelPriceRead, UsageSummary
+from typing import List, Optional
+
+router = APIRouter()
+
+GR = core.GeneratedResult
+LC = core.LLMConfig
+MP = core.ModelPrice
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@router.post("/model_prices", response_model=ModelPriceRead)
+def upsert_model_price(price_in: ModelPriceCreate, db: Session = Depends(get_db)):
+    """Creates or replaces the price of a model (USD per million tokens)."""
+    price = db.query(MP).filter(MP.model == price_in.model).first()
+    if price is None:
+        price = MP(model=price_in.model)
+        db.add(price)
+    price.input_per_million = price_in.input_per_million
+    price.output_per_million = price_in.output_per_million
+    price.cached_input_per_million = price_in.cached_input_per_million
+    db.commit()
+    db.refresh(price)
+    return price
+
+@router.get("/model_prices", response_model=List[ModelPriceRead])
+def list_model_prices(db: Session = Depends(get_db)):
+    return db.query(MP).order_by(MP.model).all()
+
+def cost_usd():
+    """Per-result cost; NULL when the result's model has no price, so SUM skips it."""
+    prompt = func.coalesce(GR.prompt_tokens, 0)
+    cached = func.coalesce(GR.cached_tokens, 0)
+    completion = func.coalesce(GR.completion_tokens, 0)
+    return (
+        (prompt - cached) * MP.input_per_million
+        + cached * func.coalesce(MP.cached_input_per_million, MP.input_per_million)
+        + completion * MP.output_per_million
+    ) / 1_000_000
+
+def usage_summary(db: Session, group_column, name_column, run_id: Optional[int] = None, join=None) -> List[UsageSummary]:
+    """
+    Rolls token counts and cost up by group_column with a single GROUP BY query.
+    join is an optional (entity, onclause) needed to select name_column.
+    """
+    stmt = (
+        select(
+            group_column.label("id"),
+            name_column.label("name"),
+            func.count(GR.id).label("results"),
+            func.coalesce(func.sum(GR.prompt_tokens), 0).label("prompt_tokens"),
+            func.coalesce(func.sum(GR.completion_tokens), 0).label("completion_tokens"),
+            func.coalesce(func.sum(GR.cached_tokens), 0).label("cached_tokens"),
+            func.sum(cost_usd()).label("cost_usd"),
+            func.coalesce(func.sum(case((and_(GR.prompt_tokens.isnot(None), MP.id.is_(None)), 1), else_=0)), 0).label("unpriced_results"),
+        )
+        .select_from(GR)
+        .outerjoin(LC, LC.id == GR.llm_config_id)
+        .outerjoin(MP, MP.model == LC.model)
+    )
+    if join is not None:
+        stmt = stmt.join(*join)
+    if run_id is not None:
+        stmt = stmt.where(GR.validation_run_id == run_id)
+    stmt = stmt.group_by(group_column, name_column).order_by(group_column)
+    return [UsageSummary(**row._mapping) for row in db.execute(stmt)]
+
+@router.get("/usage/by_run", response_model=List[UsageSummary])
+def usage_by_run(run_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Token and cost totals per validation run (name is the run timestamp)."""
+    return usage_summary(db, GR.validation_run_id, cast(core.ValidationRun.timestamp, String), run_id,
+                         join=(core.ValidationRun, core.ValidationRun.id == GR.validation_run_id))
+
+@router.get("/usage/by_prompt_set", response_model=List[UsageSummary])
+def usage_by_prompt_set(run_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Token and cost totals per prompt set, optionally within one run."""
+    return usage_summary(db, GR.prompt_set_id, core.PromptSet.name, run_id,
+                         join=(core.PromptSet, core.PromptSet.id == GR.prompt_set_id))
+
+@router.get("/usage/by_llm_config", response_model=List[UsageSummary])
+def usage_by_llm_config(run_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """Token and cost totals per LLM config, optionally within one run."""
+    return usage_summary(db, GR.llm_config_id, LC.name, run_id)
@@ -0,0 +1,39 @@
+"""
+Per-unit-of-work SQL statement counting.
+
+Wrap a block of work in count_queries() to get a Counter of every statement the
+engine executes inside it, broken down by statement type. The active counter is
+held in a context variable, so concurrent runs on the same event loop are counted
+separately.
+"""
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_current_counter = contextvars.ContextVar("query_counter", default=None)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is None:
+        return
+    counter["total"] += 1
+    verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+    counter[verb] += 1
+    if executemany:
+        counter["executemany"] += 1
+
+
+@contextmanager
+def count_queries():
+    """Counts statements executed within the block; yields the live Counter."""
+    counter = Counter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
@@ -9,6 +9,10 @@ from fastapi import FastAPI
 from app.api import nlq, prompt_set, prompt_component, llm_config, validation_run, generated_result, run_details, prompt_templating, evaluate
 from app.api import nlq_analytics  # <-- new analytics API
 from app.api import snowflake_api  # <-- new snowflake API
+from app.api import metrics, usage, fake_batch
+from app.services.job_runner import job_runner
+from app.services.http_clients import http_clients
+from app.utils.file_cache import file_cache, FILE_CACHE_WATCH
 from fastapi.middleware.cors import CORSMiddleware
 
 app = FastAPI()
@@ -33,6 +37,24 @@ app.include_router(prompt_templating.router)
 app.include_router(evaluate.router)
 app.include_router(nlq_analytics.router)
 app.include_router(snowflake_api.router, prefix="/api")
+app.include_router(metrics.router)
+app.include_router(usage.router)
+if fake_batch.FAKE_BATCH_ENABLED:
+    app.include_router(fake_batch.router)
+
+@app.on_event("startup")
+def start_job_runner():
+    job_runner.start()
+    if FILE_CACHE_WATCH:
+        file_cache.start_watcher()
+    evaluate.resume_unfinished_runs()
+
+@app.on_event("shutdown")
+async def stop_job_runner():
+    job_runner.stop()
+    file_cache.stop_watcher()
+    await http_clients.aclose()
+    http_clients.close()
 
 @app.get("/")
 def read_root():
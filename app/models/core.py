@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, JSON, Boolean, Float, UniqueConstraint
 from sqlalchemy.orm import relationship
 from app.database.database import Base
 import datetime
@@ -13,14 +13,34 @@ class NLQ(Base):
 class LLMConfig(Base):
     __tablename__ = "llm_configs"
     __table_args__ = {'extend_existing': True}
+    PROVIDER_GEMINI = "gemini"
+    PROVIDER_OPENAI = "openai"
+    PROVIDER_ANTHROPIC = "anthropic"
+    PROVIDER_AZURE = "azure"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     api_key = Column(String, nullable=False)  # Store securely in production!
     model = Column(String, nullable=False)
     default_parameters = Column(JSON, nullable=True)
+    provider = Column(String, nullable=False, server_default=PROVIDER_OPENAI)  # Added by migration 999999999999
+    base_url = Column(String, nullable=True)
+    rpm_limit = Column(Integer, nullable=True)  # Requests per minute shared by configs with this provider and API key
+    tpm_limit = Column(Integer, nullable=True)  # Prompt + output tokens per minute
+    hedging_enabled = Column(Boolean, nullable=False, default=False)  # Duplicate calls slower than the model's p95
+    alternate_base_urls = Column(JSON, nullable=True)  # Endpoints (e.g. other regions) hedged requests are sent to
     generated_results = relationship("GeneratedResult", back_populates="llm_config")
     validation_runs = relationship("ValidationRun", back_populates="llm_config")
 
+class ModelPrice(Base):
+    """USD prices per million tokens for a model name, matched against LLMConfig.model."""
+    __tablename__ = "model_prices"
+    __table_args__ = {'extend_existing': True}
+    id = Column(Integer, primary_key=True, index=True)
+    model = Column(String, nullable=False, unique=True)
+    input_per_million = Column(Float, nullable=False)
+    output_per_million = Column(Float, nullable=False)
+    cached_input_per_million = Column(Float, nullable=True)  # Defaults to the input price
+
 class PromptComponent(Base):
     __tablename__ = "prompt_components"
     __table_args__ = {'extend_existing': True}
@@ -51,20 +71,80 @@ class PromptSetComponent(Base):
 class ValidationRun(Base):
     __tablename__ = "validation_runs"
     __table_args__ = {'extend_existing': True}
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+    STATUS_CANCELLED = "cancelled"
     id = Column(Integer, primary_key=True, index=True)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
     llm_config_id = Column(Integer, ForeignKey("llm_configs.id"))
     prompt_set_id = Column(Integer, ForeignKey("prompt_sets.id"))
     nlq_id = Column(Integer, ForeignKey("nlqs.id"))
     parameters = Column(JSON, nullable=True)
+    # Background job state
+    status = Column(String, nullable=True, index=True)  # queued, running, completed, failed, cancelled
+    total_cells = Column(Integer, nullable=False, default=0)
+    completed_cells = Column(Integer, nullable=False, default=0)
+    failed_cells = Column(Integer, nullable=False, default=0)
+    skipped_cells = Column(Integer, nullable=False, default=0)  # Not finished when the run was cancelled or hit its deadline
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    deadline_at = Column(DateTime, nullable=True)
+    cache_hits = Column(Integer, nullable=False, default=0)  # Response cache lookups, for runs with use_cache
+    cache_misses = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    query_stats = Column(JSON, nullable=True)  # SQL statement counts recorded while executing the run
     llm_config = relationship("LLMConfig", back_populates="validation_runs")
     prompt_set = relationship("PromptSet", back_populates="validation_runs")
     nlq = relationship("NLQ")
     generated_results = relationship("GeneratedResult", back_populates="validation_run")
 
+    def progress(self) -> dict:
+        """Cell counts, timing and ETA for the run's background job."""
+        total = self.total_cells or 0
+        completed = self.completed_cells or 0
+        failed = self.failed_cells or 0
+        skipped = self.skipped_cells or 0
+        pending = max(total - completed - failed - skipped, 0)
+        # ETA extrapolates the average wall time per finished cell over the pending cells
+        eta_seconds = None
+        if self.status == self.STATUS_RUNNING and self.started_at and (completed + failed) > 0:
+            elapsed = (datetime.datetime.utcnow() - self.started_at).total_seconds()
+            eta_seconds = round(elapsed / (completed + failed) * pending, 1)
+        return {
+            "run_id": self.id,
+            "status": self.status,
+            "total": total,
+            "completed": completed,
+            "failed": failed,
+            "skipped": skipped,
+            "pending": pending,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "deadline_at": self.deadline_at.isoformat() if self.deadline_at else None,
+            "cache_hits": self.cache_hits or 0,
+            "cache_misses": self.cache_misses or 0,
+            "eta_seconds": eta_seconds,
+            "error": self.error,
+        }
+
 class GeneratedResult(Base):
     __tablename__ = "generated_results"
     __table_args__ = {'extend_existing': True}
+    STATUS_SUCCESS = "success"
+    STATUS_ERROR = "error"
+    STATUS_SKIPPED = "skipped"  # Placeholder for a cell left unfinished by a cancelled run
+    ERROR_TIMEOUT = "timeout"
+    ERROR_RATE_LIMIT = "rate_limit"  # HTTP 429
+    ERROR_SERVER = "server_error"  # HTTP 5xx
+    ERROR_CLIENT = "client_error"  # other HTTP 4xx
+    ERROR_PARSE = "parse"
+    ERROR_OTHER = "other"
+    ERROR_CIRCUIT_OPEN = "circuit_open"  # Not attempted: provider/model circuit breaker open
+    ERROR_FIXTURE_MISSING = "fixture_missing"  # Replay mode: no recorded exchange for the prompt
+    ERROR_CANCELLED = "cancelled"  # Skipped: run cancelled
+    ERROR_DEADLINE = "deadline"  # Skipped: run deadline exceeded
     id = Column(Integer, primary_key=True, index=True)
     validation_run_id = Column(Integer, ForeignKey("validation_runs.id"))
     nlq_id = Column(Integer, ForeignKey("nlqs.id"))
@@ -78,7 +158,62 @@ class GeneratedResult(Base):
     comments = Column(Text, nullable=True)
     llm_response_time_ms = Column(Integer, nullable=True)  # Time in milliseconds for LLM response
     is_baseline = Column(Boolean, nullable=False, default=False)
+    status = Column(String, nullable=False, default=STATUS_SUCCESS, index=True)  # success, error, skipped
+    error_class = Column(String, nullable=True)  # timeout, rate_limit, server_error, client_error, parse, circuit_open, fixture_missing, other; cancelled, deadline when skipped
+    retry_count = Column(Integer, nullable=False, default=0)  # Retries before the final attempt; error_class is the final attempt's
+    prompt_tokens = Column(Integer, nullable=True)  # Provider-reported usage, estimated when not reported; NULL if no call was made
+    completion_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)  # Part of prompt_tokens served from the provider's context cache
+    unique_id = Column(String, nullable=True)  # Short random id shown in the SQL comment header
+    time_to_first_token_ms = Column(Integer, nullable=True)  # Streaming only
+    output_tokens_per_second = Column(Float, nullable=True)  # Output tokens / time after the first token
+    aborted_early = Column(Boolean, nullable=False, default=False)  # Stream stopped on a refusal sentinel
+    cache_hit = Column(Boolean, nullable=False, default=False)  # Served from the response cache; latency is the lookup time
+    hedged = Column(Boolean, nullable=False, default=False)  # A duplicate request was sent after the model's p95 latency
+    hedge_won = Column(Boolean, nullable=False, default=False)  # The duplicate answered first
+    batch_id = Column(String, nullable=True)  # Provider batch job that produced the result; llm_response_time_ms is NULL for these
+    batch_turnaround_ms = Column(Integer, nullable=True)  # Submit-to-results time of that batch job, shared by its results
     validation_run = relationship("ValidationRun", back_populates="generated_results")
     nlq = relationship("NLQ", back_populates="generated_results")
     llm_config = relationship("LLMConfig", back_populates="generated_results")
     prompt_component = relationship("PromptComponent")
+
+    @classmethod
+    def error_class_for_status(cls, status_code: int) -> str:
+        """Error class of a failed provider response with this HTTP status."""
+        if status_code == 429:
+            return cls.ERROR_RATE_LIMIT
+        if status_code >= 500:
+            return cls.ERROR_SERVER
+        return cls.ERROR_CLIENT
+
+    def render_sql(self) -> str:
+        """
+        Returns generated_sql with the comment header (NLQ, Prompt/Model, Unique ID,
+        Result ID) rendered from the structured columns. The header is never stored.
+        """
+        nlq_text = self.nlq.nlq_text if self.nlq else ""
+        prompt_set_name = self.prompt_set.name if self.prompt_set else ""
+        llm_name = self.llm_config.name if self.llm_config else ""
+        sql_comment = f"-- NLQ: {nlq_text}\n-- Prompt/Model: {prompt_set_name} / {llm_name}\n-- Unique ID: {self.unique_id or ''}\n-- Result ID: {self.id}\n\n"
+        return sql_comment + self.generated_sql.lstrip('\n')
+
+class RunWorkItem(Base):
+    """One cell of a validation run queued for out-of-process workers (app.worker)."""
+    __tablename__ = "run_work_items"
+    __table_args__ = (
+        UniqueConstraint("validation_run_id", "nlq_id", "prompt_set_id", "llm_config_id", name="uq_run_work_items_cell"),
+        {'extend_existing': True},
+    )
+    STATUS_PENDING = "pending"
+    STATUS_LEASED = "leased"
+    STATUS_DONE = "done"
+    id = Column(Integer, primary_key=True, index=True)
+    validation_run_id = Column(Integer, ForeignKey("validation_runs.id"), nullable=False, index=True)
+    nlq_id = Column(Integer, ForeignKey("nlqs.id"), nullable=False)
+    prompt_set_id = Column(Integer, ForeignKey("prompt_sets.id"), nullable=False)
+    llm_config_id = Column(Integer, ForeignKey("llm_configs.id"), nullable=False)
+    status = Column(String, nullable=False, default=STATUS_PENDING, index=True)  # pending, leased, done
+    lease_owner = Column(String, nullable=True)  # Worker id holding the lease
+    lease_expires_at = Column(DateTime, nullable=True)  # An expired lease makes the item claimable again
+    attempts = Column(Integer, nullable=False, default=0)  # Number of times the item was claimed
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 
 
 
@@ -19,6 +19,12 @@ class LLMConfigCreate(BaseModel):
     api_key: str
     model: str
     default_parameters: Optional[dict] = None
+    provider: Optional[str] = None
+    base_url: Optional[str] = None
+    rpm_limit: Optional[int] = None
+    tpm_limit: Optional[int] = None
+    hedging_enabled: Optional[bool] = False
+    alternate_base_urls: Optional[List[str]] = None
 
 class LLMConfigRead(BaseModel):
     id: int
@@ -26,9 +32,68 @@ class LLMConfigRead(BaseModel):
     api_key: str
     model: str
     default_parameters: Optional[dict] = None
+    provider: Optional[str] = None
+    base_url: Optional[str] = None
+    rpm_limit: Optional[int] = None
+    tpm_limit: Optional[int] = None
+    hedging_enabled: Optional[bool] = False
+    alternate_base_urls: Optional[List[str]] = None
     class Config:
         from_attributes = True
 
+class ModelPriceCreate(BaseModel):
+    model: str
+    input_per_million: float
+    output_per_million: float
+    cached_input_per_million: Optional[float] = None
+
+class ModelPriceRead(ModelPriceCreate):
+    id: int
+    class Config:
+        from_attributes = True
+
+class UsageSummary(BaseModel):
+    """Token and cost totals for one run, prompt set or LLM config."""
+    id: int
+    name: Optional[str] = None
+    results: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    cost_usd: Optional[float] = None  # None when none of the results has a price
+    unpriced_results: int = 0  # Results with token counts but no ModelPrice for their model
+
+class PromptProfileInclude(BaseModel):
+    file: str  # Relative to the prompt set folder
+    occurrences: int
+    chars: int
+    tokens: Dict[str, int]  # Per tokenizer, for all occurrences
+    share: float  # Fraction of the prompt's tiktoken count
+
+class PromptProfileModel(BaseModel):
+    model: str
+    provider: Optional[str] = None
+    llm_config_ids: List[int] = []
+    tokenizer: str
+    prompt_tokens: int
+    context_window: Optional[int] = None
+    budget_tokens: Optional[int] = None
+    context_used: Optional[float] = None
+    over_budget: bool = False
+
+class PromptSetProfile(BaseModel):
+    """Token counts of a rendered prompt set, per include file and per configured model."""
+    prompt_set_id: int
+    name: str
+    content_hash: str  # Over every file in the include tree, the NLQ and the models
+    nlq: str
+    rendered_chars: int
+    static_prefix_chars: int
+    tokens: Dict[str, int]
+    includes: List[PromptProfileInclude]
+    models: List[PromptProfileModel]
+    warnings: List[str] = []
+
 class PromptComponentCreate(BaseModel):
     name: str
     type: str
@@ -77,6 +142,20 @@ class GeneratedResultRead(BaseModel):
     human_eval_tag: Optional[str] = ""
     comments: Optional[str] = ""
     llm_response_time_ms: Optional[int] = 0
+    status: Optional[str] = None
+    error_class: Optional[str] = None
+    time_to_first_token_ms: Optional[int] = None
+    output_tokens_per_second: Optional[float] = None
+    aborted_early: Optional[bool] = False
+    cache_hit: Optional[bool] = False
+    retry_count: Optional[int] = 0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    hedged: Optional[bool] = False
+    hedge_won: Optional[bool] = False
+    batch_id: Optional[str] = None
+    batch_turnaround_ms: Optional[int] = None
     class Config:
         from_attributes = True
 
@@ -91,6 +170,48 @@ class GeneratedResultReadFull(BaseModel):
     human_eval_tag: Optional[str] = ""
     comments: Optional[str] = ""
     llm_response_time_ms: Optional[int] = 0
+    status: Optional[str] = None
+    error_class: Optional[str] = None
+    time_to_first_token_ms: Optional[int] = None
+    output_tokens_per_second: Optional[float] = None
+    aborted_early: Optional[bool] = False
+    cache_hit: Optional[bool] = False
+    retry_count: Optional[int] = 0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    hedged: Optional[bool] = False
+    hedge_won: Optional[bool] = False
+    batch_id: Optional[str] = None
+    batch_turnaround_ms: Optional[int] = None
+    class Config:
+        from_attributes = True
+
+class GeneratedResultSummary(BaseModel):
+    """GeneratedResultReadFull without full_prompt, for streaming run events."""
+    id: int
+    generated_sql: str
+    validation_run_id: int
+    nlq_id: int
+    prompt_set_id: int
+    llm_config_id: int
+    human_evaluation_tag: Optional[str] = ""
+    comments: Optional[str] = ""
+    llm_response_time_ms: Optional[int] = 0
+    status: Optional[str] = None
+    error_class: Optional[str] = None
+    time_to_first_token_ms: Optional[int] = None
+    output_tokens_per_second: Optional[float] = None
+    aborted_early: Optional[bool] = False
+    cache_hit: Optional[bool] = False
+    retry_count: Optional[int] = 0
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    hedged: Optional[bool] = False
+    hedge_won: Optional[bool] = False
+    batch_id: Optional[str] = None
+    batch_turnaround_ms: Optional[int] = None
     class Config:
         from_attributes = True
 
@@ -123,6 +244,27 @@ class EvaluateRunRequest(BaseModel):
     nlq_ids: List[int]
     prompt_set_ids: List[int]
     llm_config_ids: List[int]
+    deadline_seconds: Optional[int] = None  # Cells not finished by then are skipped
+    use_cache: bool = False  # Answer repeated (model, parameters, prompt) cells from the response cache
+    execution_mode: str = "online"  # "batch" submits the prompts as provider batch jobs (slow, cheaper)
 
 class EvaluateRunResponse(BaseModel):
     run_id: int
+    status: Optional[str] = None
+
+class RunStatusRead(BaseModel):
+    run_id: int
+    status: Optional[str]
+    total: int
+    completed: int
+    failed: int
+    skipped: int = 0
+    pending: int
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    deadline_at: Optional[str] = None
+    cache_hits: int = 0
+    cache_misses: int = 0
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+    query_stats: Optional[dict] = None
@@ -0,0 +1,286 @@
+"""
+Provider batch execution for large offline runs.
+
+Runs submitted with execution_mode "batch" package their rendered prompts into one
+batch job per LLM config, in the OpenAI Batch API format (a JSONL file of
+/v1/chat/completions requests), poll the job until the provider has finished it,
+and fan the responses back out as cell outcomes. Gemini configs are submitted to
+Gemini's OpenAI-compatible endpoint. Configs without a batch endpoint (the mock
+provider) are executed online by the EvaluationEngine instead.
+
+EVAL_BATCH_BASE_URL sends every batch to another OpenAI-compatible server, such
+as the fake one in app.api.fake_batch for offline testing.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from app.models.core import GeneratedResult
+from app.services.evaluation_engine import CellOutcome, EvaluationCell, EvaluationEngine
+from app.services.http_clients import http_clients
+from app.services.llm_service import CancellationToken
+
+logger = logging.getLogger("batch_jobs")
+
+BATCH_BASE_URL = os.getenv("EVAL_BATCH_BASE_URL")
+BATCH_POLL_SECONDS = float(os.getenv("EVAL_BATCH_POLL_SECONDS", "30"))
+BATCH_COMPLETION_WINDOW = os.getenv("EVAL_BATCH_COMPLETION_WINDOW", "24h")
+
+# OpenAI-compatible batch endpoints per provider key (see provider_of)
+PROVIDER_BATCH_BASE_URLS = {
+    "gemini": "https://generativelanguage.googleapis.com/v1beta/openai",
+}
+
+BATCH_STATUS_COMPLETED = "completed"
+BATCH_TERMINAL_STATUSES = {BATCH_STATUS_COMPLETED, "failed", "expired", "cancelled"}
+
+
+class BatchJobError(Exception):
+    """A batch job ended without output (failed, expired or cancelled by the provider)."""
+
+
+def batch_custom_id(cell: EvaluationCell) -> str:
+    return f"{cell.nlq_id}-{cell.prompt_set_id}-{cell.llm_config_id}"
+
+
+class OpenAIBatchClient:
+    """Files + Batches API client for one base URL and API key."""
+
+    def __init__(self, base_url: str, api_key: str):
+        self.base_url = base_url.rstrip("/")
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+
+    @property
+    def _client(self):
+        return http_clients.async_client(self.base_url)
+
+    async def submit(self, llm_config, cells: List[EvaluationCell]) -> str:
+        """Uploads the cells' prompts as a JSONL input file and creates the batch. Returns the batch id."""
+        lines = []
+        for cell in cells:
+            body = {"model": llm_config.model, "messages": [{"role": "user", "content": cell.full_prompt}]}
+            if llm_config.default_parameters:
+                body.update(llm_config.default_parameters)
+            lines.append(json.dumps({"custom_id": batch_custom_id(cell), "method": "POST", "url": "/v1/chat/completions", "body": body}))
+        resp = await self._client.post(
+            f"{self.base_url}/files",
+            data={"purpose": "batch"},
+            files={"file": ("batch.jsonl", "\n".join(lines).encode("utf-8"), "application/jsonl")},
+            headers=self.headers,
+        )
+        resp.raise_for_status()
+        input_file_id = resp.json()["id"]
+        resp = await self._client.post(
+            f"{self.base_url}/batches",
+            json={"input_file_id": input_file_id, "endpoint": "/v1/chat/completions", "completion_window": BATCH_COMPLETION_WINDOW},
+            headers=self.headers,
+        )
+        resp.raise_for_status()
+        return resp.json()["id"]
+
+    async def get(self, batch_id: str) -> dict:
+        resp = await self._client.get(f"{self.base_url}/batches/{batch_id}", headers=self.headers)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def cancel(self, batch_id: str):
+        resp = await self._client.post(f"{self.base_url}/batches/{batch_id}/cancel", headers=self.headers)
+        resp.raise_for_status()
+
+    async def results(self, batch: dict) -> Dict[str, dict]:
+        """Output and error file lines of a finished batch, keyed by custom_id."""
+        lines = {}
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if not file_id:
+                continue
+            resp = await self._client.get(f"{self.base_url}/files/{file_id}/content", headers=self.headers)
+            resp.raise_for_status()
+            for line in resp.text.splitlines():
+                if line.strip():
+                    entry = json.loads(line)
+                    lines[entry["custom_id"]] = entry
+        return lines
+
+
+class BatchExecutor:
+    """
+    Executes run cells as provider batch jobs, one per LLM config.
+
+    - jobs: batch ids already submitted for this run, keyed by LLM config id; they
+      are polled instead of submitting again (e.g. after a restart).
+    - on_submitted(llm_config_id, batch_id): called when a job is submitted, and
+      with batch_id None once its results have been reported.
+    """
+
+    def __init__(self, engine: EvaluationEngine, provider_of: Callable[[Any], str],
+                 classify_error: Callable[[Exception], str], poll_seconds: float = BATCH_POLL_SECONDS,
+                 base_url: Optional[str] = BATCH_BASE_URL):
+        self.engine = engine
+        self.provider_of = provider_of
+        self.classify_error = classify_error
+        self.poll_seconds = poll_seconds
+        self.base_url = base_url
+
+    def base_url_for(self, llm_config) -> Optional[str]:
+        return self.base_url or PROVIDER_BATCH_BASE_URLS.get(self.provider_of(llm_config))
+
+    async def run(
+        self,
+        cells: Iterable[EvaluationCell],
+        llm_configs: Dict[int, Any],
+        on_result: Callable[[CellOutcome], None],
+        cancel_token: Optional[CancellationToken] = None,
+        deadline_seconds: Optional[float] = None,
+        cache=None,
+        jobs: Optional[Dict[int, str]] = None,
+        on_submitted: Callable[[int, Optional[str]], None] = lambda llm_config_id, batch_id: None,
+    ):
+        """
+        Reports every cell through on_result, like EvaluationEngine.run. Cancelling
+        cancel_token (or reaching deadline_seconds) cancels the provider jobs and
+        reports their cells as skipped.
+        """
+        loop = asyncio.get_running_loop()
+        cancel_token = cancel_token or CancellationToken()
+        cancelled = loop.create_future()
+
+        def _signal_cancelled():
+            if not cancelled.done():
+                cancelled.set_result(cancel_token.reason)
+
+        unregister = cancel_token.on_cancel(lambda: loop.call_soon_threadsafe(_signal_cancelled))
+        deadline = None
+        if deadline_seconds is not None and deadline_seconds <= 0:
+            cancel_token.cancel(GeneratedResult.ERROR_DEADLINE)
+        elif deadline_seconds is not None:
+            deadline = loop.call_later(deadline_seconds, cancel_token.cancel, GeneratedResult.ERROR_DEADLINE)
+
+        by_config = defaultdict(list)
+        online = []
+        for cell in cells:
+            if self.base_url_for(llm_configs[cell.llm_config_id]):
+                by_config[cell.llm_config_id].append(cell)
+            else:
+                online.append(cell)
+        jobs = jobs or {}
+        logger.info(f"Submitting {sum(len(c) for c in by_config.values())} cells as {len(by_config)} batch jobs; {len(online)} cells run online")
+        try:
+            await asyncio.gather(
+                self.engine.run(online, llm_configs, on_result, cancel_token=cancel_token, cache=cache),
+                *(
+                    self._run_job(llm_configs[llm_config_id], config_cells, on_result, cancel_token, cancelled,
+                                  cache, jobs.get(llm_config_id), on_submitted)
+                    for llm_config_id, config_cells in by_config.items()
+                ),
+            )
+        finally:
+            unregister()
+            if deadline:
+                deadline.cancel()
+            if not cancelled.done():
+                cancelled.cancel()
+
+    async def _run_job(self, llm_config, cells: List[EvaluationCell], on_result, cancel_token: CancellationToken,
+                       cancelled: asyncio.Future, cache, batch_id: Optional[str], on_submitted):
+        pending = {}
+        for cell in cells:
+            cached = None
+            if cache is not None:
+                try:
+                    cached = cache.get(llm_config, cell.full_prompt)
+                except Exception as cache_exc:
+                    logger.warning(f"Response cache lookup failed: {cache_exc}")
+            if cached is not None:
+                on_result(CellOutcome(cell=cell, generated_sql=cached, llm_response_time_ms=0, cache_hit=True))
+            else:
+                pending[batch_custom_id(cell)] = cell
+        if not pending:
+            return
+        client = OpenAIBatchClient(self.base_url_for(llm_config), llm_config.api_key)
+        start = time.perf_counter()
+        try:
+            if batch_id is None:
+                batch_id = await client.submit(llm_config, list(pending.values()))
+                on_submitted(llm_config.id, batch_id)
+                logger.info(f"Submitted batch {batch_id} with {len(pending)} prompts for LLM {llm_config.name}")
+            else:
+                logger.info(f"Resuming batch {batch_id} for LLM {llm_config.name}")
+            batch = await self._wait(client, batch_id, cancelled)
+            if batch is None:
+                try:
+                    await client.cancel(batch_id)
+                except Exception as cancel_exc:
+                    logger.warning(f"Could not cancel batch {batch_id}: {cancel_exc}")
+                on_submitted(llm_config.id, None)
+                for cell in pending.values():
+                    on_result(EvaluationEngine._skipped(cell, cancel_token.reason))
+                return
+            if batch.get("status") != BATCH_STATUS_COMPLETED:
+                raise BatchJobError(f"Batch {batch_id} {batch.get('status')}: {batch.get('errors')}")
+            lines = await client.results(batch)
+        except Exception as batch_exc:
+            error_class = self.classify_error(batch_exc)
+            logger.error(f"Batch job for LLM {llm_config.name} failed ({error_class}): {batch_exc}")
+            on_submitted(llm_config.id, None)
+            for cell in pending.values():
+                on_result(CellOutcome(cell=cell, generated_sql=f"-- ERROR: {batch_exc}", llm_response_time_ms=0,
+                                      status=GeneratedResult.STATUS_ERROR, error_class=error_class,
+                                      cache_hit=False if cache is not None else None))
+            return
+        # Every cell of a batch shares its turnaround time, which is not model latency
+        turnaround_ms = int((time.perf_counter() - start) * 1000)
+        for custom_id, cell in pending.items():
+            outcome = self._outcome(cell, lines.get(custom_id), batch_id, turnaround_ms)
+            if cache is not None:
+                outcome.cache_hit = False
+                if outcome.status == GeneratedResult.STATUS_SUCCESS:
+                    try:
+                        cache.put(llm_config, cell.full_prompt, outcome.generated_sql)
+                    except Exception as cache_exc:
+                        logger.warning(f"Response cache store failed: {cache_exc}")
+            on_result(outcome)
+        on_submitted(llm_config.id, None)
+        logger.info(f"Batch {batch_id} for LLM {llm_config.name} finished in {turnaround_ms} ms")
+
+    async def _wait(self, client: OpenAIBatchClient, batch_id: str, cancelled: asyncio.Future) -> Optional[dict]:
+        """Polls until the batch reaches a terminal status. Returns None if the run was cancelled first."""
+        while True:
+            batch = await client.get(batch_id)
+            if batch.get("status") in BATCH_TERMINAL_STATUSES:
+                return batch
+            done, _ = await asyncio.wait({cancelled}, timeout=self.poll_seconds)
+            if done:
+                return None
+
+    @staticmethod
+    def _outcome(cell: EvaluationCell, line: Optional[dict], batch_id: str, turnaround_ms: int) -> CellOutcome:
+        batch = {"batch_id": batch_id, "batch_turnaround_ms": turnaround_ms}
+        if line is None:
+            return CellOutcome(cell=cell, generated_sql=f"-- ERROR: no response in batch {batch_id}", llm_response_time_ms=None,
+                               status=GeneratedResult.STATUS_ERROR, error_class=GeneratedResult.ERROR_OTHER, **batch)
+        response = line.get("response") or {}
+        body = response.get("body") or {}
+        status_code = response.get("status_code")
+        if line.get("error") or status_code != 200:
+            error = line.get("error") or body.get("error") or f"HTTP {status_code}"
+            error_class = GeneratedResult.error_class_for_status(status_code) if status_code else GeneratedResult.ERROR_OTHER
+            return CellOutcome(cell=cell, generated_sql=f"-- ERROR: {error}", llm_response_time_ms=None,
+                               status=GeneratedResult.STATUS_ERROR, error_class=error_class, **batch)
+        try:
+            text = body["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            return CellOutcome(cell=cell, generated_sql=f"-- ERROR: unexpected batch response: {body}", llm_response_time_ms=None,
+                               status=GeneratedResult.STATUS_ERROR, error_class=GeneratedResult.ERROR_PARSE, **batch)
+        usage = body.get("usage") or {}
+        return CellOutcome(
+            cell=cell,
+            generated_sql=text,
+            llm_response_time_ms=None,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+            cached_tokens=(usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+            **batch,
+        )
@@ -0,0 +1,287 @@
+"""
+Async execution engine for evaluation runs.
+
+Every (NLQ, prompt set, LLM config) cell of a run is dispatched concurrently.
+In-flight requests are capped per provider and per API key, and each outcome is
+handed back to the caller as soon as it completes so it can be persisted
+immediately. A run can be cancelled (or given a deadline) through a
+CancellationToken: in-flight calls are stopped cooperatively and cells that have
+not finished are reported as skipped. Failed calls are retried per RetryPolicy,
+and a circuit breaker per provider and model fails cells fast while the provider
+is down.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from app.models.core import GeneratedResult
+from app.services.llm_service import CancellationToken, GenerationCancelled, StreamResult
+from app.services.resilience import CircuitBreakers, RetryPolicy, call_with_retry, circuit_breakers
+
+logger = logging.getLogger("evaluation_engine")
+
+# Concurrency caps, overridable from the environment
+MAX_IN_FLIGHT_PER_PROVIDER = int(os.getenv("EVAL_MAX_IN_FLIGHT_PER_PROVIDER", "8"))
+MAX_IN_FLIGHT_PER_API_KEY = int(os.getenv("EVAL_MAX_IN_FLIGHT_PER_API_KEY", "4"))
+MAX_WORKER_THREADS = int(os.getenv("EVAL_MAX_WORKER_THREADS", "32"))
+
+
+@dataclass
+class EvaluationCell:
+    """One (NLQ, prompt set, LLM config) combination with its rendered prompt."""
+    nlq_id: int
+    prompt_set_id: int
+    llm_config_id: int
+    full_prompt: str
+    nlq_text: str = ""
+    static_prefix_chars: int = 0  # Length of full_prompt's NLQ-independent prefix, cacheable by providers
+
+
+@dataclass
+class CellOutcome:
+    """Result of dispatching a single cell."""
+    cell: EvaluationCell
+    generated_sql: str
+    llm_response_time_ms: Optional[int]  # Model latency; None when not measured per call (batch jobs)
+    status: str = GeneratedResult.STATUS_SUCCESS
+    error_class: Optional[str] = None
+    time_to_first_token_ms: Optional[int] = None
+    output_tokens_per_second: Optional[float] = None
+    aborted_early: bool = False
+    cache_hit: Optional[bool] = None  # None when the run does not use the response cache
+    retries: int = 0
+    prompt_tokens: Optional[int] = None  # Token usage of streamed responses; None for cache hits
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    hedged: bool = False
+    hedge_won: bool = False
+    batch_id: Optional[str] = None
+    batch_turnaround_ms: Optional[int] = None
+
+
+class EvaluationEngine:
+    """
+    Fans out evaluation cells over asyncio with per-provider and per-API-key caps.
+
+    - generate: blocking callable (cell, llm_config, cancel_token) -> generated
+      text or a StreamResult. It runs on a worker thread so the event loop is never
+      blocked by provider I/O. A StreamResult's own timings are used as model
+      latency. It should stop and raise GenerationCancelled once the token is
+      cancelled.
+    - provider_of: callable llm_config -> provider key used for the provider cap.
+    - classify_error: optional callable exception -> GeneratedResult error class.
+      Errors whose class is in retry_policy.retryable are retried with jittered
+      backoff; every attempt goes through the (provider, model) circuit breaker.
+
+    A run may pass a response cache (see app.services.response_cache): cells found
+    in it are answered without calling generate, and successful responses are
+    stored in it.
+
+    Semaphores are created lazily and live for the lifetime of the engine, so all
+    runs sharing an engine also share its caps.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[EvaluationCell, Any, CancellationToken], Any],
+        provider_of: Callable[[Any], str],
+        classify_error: Optional[Callable[[Exception], str]] = None,
+        max_in_flight_per_provider: int = MAX_IN_FLIGHT_PER_PROVIDER,
+        max_in_flight_per_api_key: int = MAX_IN_FLIGHT_PER_API_KEY,
+        max_worker_threads: int = MAX_WORKER_THREADS,
+        retry_policy: Optional[RetryPolicy] = None,
+        breakers: CircuitBreakers = circuit_breakers,
+    ):
+        self._generate = generate
+        self._provider_of = provider_of
+        self._classify_error = classify_error or (lambda exc: GeneratedResult.ERROR_OTHER)
+        self._max_per_provider = max_in_flight_per_provider
+        self._max_per_api_key = max_in_flight_per_api_key
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._breakers = breakers
+        self._executor = ThreadPoolExecutor(max_workers=max_worker_threads, thread_name_prefix="eval-cell")
+        self._provider_limits: Dict[str, asyncio.Semaphore] = {}
+        self._api_key_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def _provider_limit(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self._provider_limits:
+            self._provider_limits[provider] = asyncio.Semaphore(self._max_per_provider)
+        return self._provider_limits[provider]
+
+    def _api_key_limit(self, api_key: str) -> asyncio.Semaphore:
+        if api_key not in self._api_key_limits:
+            self._api_key_limits[api_key] = asyncio.Semaphore(self._max_per_api_key)
+        return self._api_key_limits[api_key]
+
+    @staticmethod
+    def _skipped(cell: EvaluationCell, reason: str) -> CellOutcome:
+        return CellOutcome(
+            cell=cell,
+            generated_sql=f"-- SKIPPED: run {reason}",
+            llm_response_time_ms=0,
+            status=GeneratedResult.STATUS_SKIPPED,
+            error_class=reason,
+        )
+
+    def _cached_generate(self, cell: EvaluationCell, llm_config, cancel_token: CancellationToken, cache) -> CellOutcome:
+        if cache is None:
+            return self._timed_generate(cell, llm_config, cancel_token)
+        start = time.perf_counter()
+        try:
+            cached = cache.get(llm_config, cell.full_prompt)
+        except Exception as cache_exc:
+            logger.warning(f"Response cache lookup failed: {cache_exc}")
+            cached = None
+        if cached is not None:
+            # Lookup time only; cache hits are tagged so they can be left out of latency stats
+            return CellOutcome(cell=cell, generated_sql=cached, llm_response_time_ms=int((time.perf_counter() - start) * 1000), cache_hit=True)
+        outcome = self._timed_generate(cell, llm_config, cancel_token)
+        if outcome.status == GeneratedResult.STATUS_SKIPPED:
+            return outcome
+        outcome.cache_hit = False
+        if outcome.status == GeneratedResult.STATUS_SUCCESS and not outcome.aborted_early:
+            try:
+                cache.put(llm_config, cell.full_prompt, outcome.generated_sql, outcome.llm_response_time_ms)
+            except Exception as cache_exc:
+                logger.warning(f"Response cache store failed: {cache_exc}")
+        return outcome
+
+    def _timed_generate(self, cell: EvaluationCell, llm_config, cancel_token: CancellationToken) -> CellOutcome:
+        # Timed on the worker thread so executor queueing is not counted as model latency;
+        # only the final attempt is timed, not earlier failures and backoff sleeps
+        timing = {}
+
+        def attempt():
+            timing["start"] = time.perf_counter()
+            generated = self._generate(cell, llm_config, cancel_token)
+            timing["end"] = time.perf_counter()
+            return generated
+
+        breaker = self._breakers.get(self._provider_of(llm_config), llm_config.model)
+        try:
+            attempted = call_with_retry(attempt, breaker, self._retry_policy, self._classify_error, cancel_token)
+        except GenerationCancelled as cancelled:
+            return self._skipped(cell, cancelled.reason)
+        if attempted.exception is not None:
+            llm_exc = attempted.exception
+            logger.error(f"Error calling LLM {llm_config.name} for NLQ {cell.nlq_id} ({attempted.error_class}, {attempted.retries} retries): {llm_exc}")
+            return CellOutcome(
+                cell=cell,
+                generated_sql=f"-- ERROR: {llm_exc}",
+                llm_response_time_ms=0,
+                status=GeneratedResult.STATUS_ERROR,
+                error_class=attempted.error_class,
+                retries=attempted.retries,
+            )
+        generated, start, end = attempted.result, timing["start"], timing["end"]
+        if isinstance(generated, StreamResult):
+            return CellOutcome(
+                cell=cell,
+                generated_sql=generated.text,
+                llm_response_time_ms=generated.total_time_ms,
+                time_to_first_token_ms=generated.time_to_first_token_ms,
+                output_tokens_per_second=generated.output_tokens_per_second,
+                aborted_early=generated.aborted_early,
+                retries=attempted.retries,
+                prompt_tokens=generated.prompt_tokens,
+                completion_tokens=generated.output_tokens,
+                cached_tokens=generated.cached_tokens,
+                hedged=generated.hedged,
+                hedge_won=generated.hedge_won,
+            )
+        return CellOutcome(cell=cell, generated_sql=generated, llm_response_time_ms=int((end - start) * 1000), retries=attempted.retries)
+
+    async def _dispatch(self, cell: EvaluationCell, llm_config, cancel_token: CancellationToken, cancelled: asyncio.Future, cache) -> CellOutcome:
+        limits = (self._provider_limit(self._provider_of(llm_config)), self._api_key_limit(llm_config.api_key))
+        acquired = []
+        try:
+            for limit in limits:
+                await limit.acquire()
+                acquired.append(limit)
+            if cancel_token.cancelled:
+                return self._skipped(cell, cancel_token.reason)
+            loop = asyncio.get_running_loop()
+            work = loop.run_in_executor(self._executor, self._cached_generate, cell, llm_config, cancel_token, cache)
+            # The slots belong to the call until its thread returns, even if the run stops waiting for it
+            self._release_when_done(work, acquired)
+            acquired = []
+            await asyncio.wait({work, cancelled}, return_when=asyncio.FIRST_COMPLETED)
+            if work.done():
+                return work.result()
+            # The call is still blocked (e.g. waiting for response headers); stop waiting
+            # for it. The token closes its stream once one is open.
+            return self._skipped(cell, cancel_token.reason)
+        finally:
+            for limit in acquired:
+                limit.release()
+
+    @staticmethod
+    def _release_when_done(work: asyncio.Future, limits: List[asyncio.Semaphore]):
+        def release(future: asyncio.Future):
+            if not future.cancelled() and future.exception() is not None:
+                logger.debug(f"Abandoned evaluation call failed: {future.exception()}")
+            for limit in limits:
+                limit.release()
+
+        work.add_done_callback(release)
+
+    async def run(
+        self,
+        cells: Iterable[EvaluationCell],
+        llm_configs: Dict[int, Any],
+        on_result: Callable[[CellOutcome], None],
+        cancel_token: Optional[CancellationToken] = None,
+        deadline_seconds: Optional[float] = None,
+        cache=None,
+    ) -> List[CellOutcome]:
+        """
+        Dispatches all cells concurrently and calls on_result for each one in
+        completion order. Returns the outcomes in completion order.
+
+        Cancelling cancel_token, or reaching deadline_seconds (which cancels it with
+        reason GeneratedResult.ERROR_DEADLINE), still reports every cell: cells that
+        did not finish come back with status GeneratedResult.STATUS_SKIPPED.
+        """
+        loop = asyncio.get_running_loop()
+        cancel_token = cancel_token or CancellationToken()
+        cancelled = loop.create_future()
+
+        def _signal_cancelled():
+            if not cancelled.done():
+                cancelled.set_result(cancel_token.reason)
+
+        unregister = cancel_token.on_cancel(lambda: loop.call_soon_threadsafe(_signal_cancelled))
+        deadline = None
+        if deadline_seconds is not None and deadline_seconds <= 0:
+            cancel_token.cancel(GeneratedResult.ERROR_DEADLINE)
+        elif deadline_seconds is not None:
+            deadline = loop.call_later(deadline_seconds, cancel_token.cancel, GeneratedResult.ERROR_DEADLINE)
+        tasks = [
+            asyncio.create_task(self._dispatch(cell, llm_configs[cell.llm_config_id], cancel_token, cancelled, cache))
+            for cell in cells
+        ]
+        logger.info(f"Dispatching {len(tasks)} evaluation cells")
+        outcomes = []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                outcome = await next_done
+                on_result(outcome)
+                outcomes.append(outcome)
+        finally:
+            unregister()
+            if deadline:
+                deadline.cancel()
+            if not cancelled.done():
+                cancelled.cancel()
+            for task in tasks:
+                task.cancel()
+        if cancel_token.cancelled:
+            skipped = sum(1 for outcome in outcomes if outcome.status == GeneratedResult.STATUS_SKIPPED)
+            logger.info(f"Run {cancel_token.reason}: {skipped} of {len(outcomes)} cells skipped")
+        return outcomes
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,143 @@
+"""
+Shared, pooled HTTP clients for provider calls.
+
+Creating a client per request pays a new TCP + TLS handshake every time. Provider
+calls instead go through:
+
+- a requests.Session whose adapter keeps up to HTTP_POOL_MAXSIZE_PER_HOST
+  keep-alive connections per host (used from worker threads), and
+- one httpx.AsyncClient per (event loop, host), limited to the same number of
+  connections and using HTTP/2 when the h2 package is installed.
+
+stats() reports per-host connection and request counts for tuning the limits.
+"""
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import weakref
+from collections import Counter
+from typing import Dict
+from urllib.parse import urlsplit
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("http_clients")
+
+HTTP_POOL_MAXSIZE_PER_HOST = int(os.getenv("EVAL_HTTP_POOL_MAXSIZE_PER_HOST", "32"))
+HTTP_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("EVAL_HTTP_KEEPALIVE_EXPIRY_SECONDS", "60"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("EVAL_HTTP_TIMEOUT_SECONDS", "60"))
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class HTTPClients:
+    """Owns the pooled sync session and the per-loop, per-host async clients."""
+
+    def __init__(self, maxsize_per_host: int = HTTP_POOL_MAXSIZE_PER_HOST,
+                 keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY_SECONDS, timeout: float = HTTP_TIMEOUT_SECONDS):
+        self.maxsize_per_host = maxsize_per_host
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self._session = None
+        # httpx connections belong to the event loop that opened them
+        self._async_clients: "weakref.WeakKeyDictionary[object, Dict[str, httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+        self._async_requests = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        """Thread-safe pooled session; urllib3 keeps one connection pool per host."""
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                # pool_maxsize is per host; block=True waits for a free connection instead of opening extra ones
+                adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.maxsize_per_host, pool_block=True)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def async_client(self, url: str) -> httpx.AsyncClient:
+        """Returns the pooled AsyncClient for url's host on the running event loop."""
+        loop = asyncio.get_running_loop()
+        host = urlsplit(url).netloc
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(host)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    http2=HTTP2_AVAILABLE,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.maxsize_per_host,
+                        max_keepalive_connections=self.maxsize_per_host,
+                        keepalive_expiry=self.keepalive_expiry,
+                    ),
+                    event_hooks={"request": [self._count_async_request]},
+                )
+                clients[host] = client
+                logger.info(f"Opened pooled async HTTP client for {host} (HTTP/2: {HTTP2_AVAILABLE})")
+            return client
+
+    async def _count_async_request(self, request: httpx.Request):
+        self._async_requests[request.url.netloc.decode()] += 1
+
+    async def aclose(self):
+        """Closes the async clients of the running event loop."""
+        with self._lock:
+            clients = self._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.aclose()
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def stats(self) -> dict:
+        """Per-host pool statistics for the sync session and the async clients."""
+        sync = {}
+        with self._lock:
+            session = self._session
+            async_clients = [(host, client) for clients in list(self._async_clients.values()) for host, client in clients.items()]
+        if session is not None:
+            adapter = session.get_adapter("https://")
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools[key]
+                idle = sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0
+                sync[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                    "requests": pool.num_requests,
+                    "connections_opened": pool.num_connections,
+                    "idle_connections": idle,
+                    "max_connections": self.maxsize_per_host,
+                }
+        async_stats = {}
+        for host, client in async_clients:
+            entry = async_stats.setdefault(host, {"clients": 0, "connections": 0, "idle_connections": 0, "http2_connections": 0})
+            entry["clients"] += 1
+            # httpcore does not expose pool counters publicly; read its connection list defensively
+            connections = getattr(getattr(client._transport, "_pool", None), "connections", [])
+            for connection in connections:
+                entry["connections"] += 1
+                entry["idle_connections"] += 1 if connection.is_idle() else 0
+                entry["http2_connections"] += 1 if "HTTP/2" in connection.info() else 0
+        for host, count in self._async_requests.items():
+            async_stats.setdefault(host, {"clients": 0, "connections": 0, "idle_connections": 0, "http2_connections": 0})["requests"] = count
+        return {
+            "http2_available": HTTP2_AVAILABLE,
+            "max_connections_per_host": self.maxsize_per_host,
+            "keepalive_expiry_seconds": self.keepalive_expiry,
+            "sync": sync,
+            "async": async_stats,
+        }
+
+
+# Create a singleton instance
+http_clients = HTTPClients()
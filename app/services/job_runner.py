@@ -0,0 +1,104 @@
+"""
+Background job runner.
+
+Owns a dedicated thread running an asyncio event loop. Long-running jobs (such as
+evaluation runs) are submitted as coroutines and executed there, so HTTP handlers
+can return immediately instead of holding the request open.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger("job_runner")
+
+# How long stop() waits for cancelled jobs to unwind before stopping the loop
+JOB_CANCEL_TIMEOUT_SECONDS = 5
+
+
+async def _wait_for_other_tasks(timeout: float):
+    tasks = asyncio.all_tasks() - {asyncio.current_task()}
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+
+
+class JobRunner:
+    """
+    Runs submitted coroutines on a background event loop.
+
+    Jobs are keyed by an id (e.g. the validation run id) so that the same job is
+    never scheduled twice while it is still active.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._jobs: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        self.start()
+        return self._loop
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="job-runner", daemon=True)
+            self._thread.start()
+            logger.info("Job runner started")
+
+    def stop(self):
+        with self._lock:
+            if not self._loop:
+                return
+            loop, thread = self._loop, self._thread
+            futures = list(self._jobs.values())
+        # Cancelling runs _on_done, which takes the lock, so it must not be held here
+        for future in futures:
+            future.cancel()
+        # Let the cancelled jobs unwind (and their finally blocks run) before the loop stops
+        try:
+            asyncio.run_coroutine_threadsafe(_wait_for_other_tasks(JOB_CANCEL_TIMEOUT_SECONDS), loop).result(JOB_CANCEL_TIMEOUT_SECONDS + 1)
+        except Exception as e:
+            logger.warning(f"Cancelled jobs did not finish before shutdown: {e!r}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=5)
+        with self._lock:
+            self._loop = None
+            self._thread = None
+            self._jobs.clear()
+        logger.info("Job runner stopped")
+
+    def submit(self, job_id: int, job: Callable[[], Awaitable[None]]) -> Future:
+        """
+        Schedules job() on the background loop. If a job with the same id is still
+        active, the existing future is returned instead.
+        """
+        loop = self.loop
+        with self._lock:
+            existing = self._jobs.get(job_id)
+            if existing and not existing.done():
+                return existing
+            future = asyncio.run_coroutine_threadsafe(job(), loop)
+            self._jobs[job_id] = future
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return future
+
+    def is_active(self, job_id: int) -> bool:
+        future = self._jobs.get(job_id)
+        return bool(future and not future.done())
+
+    def _on_done(self, job_id: int, future: Future):
+        with self._lock:
+            if self._jobs.get(job_id) is future:
+                del self._jobs[job_id]
+        if not future.cancelled() and future.exception():
+            logger.error(f"Job {job_id} failed: {future.exception()}")
+
+
+# Create a singleton instance
+job_runner = JobRunner()
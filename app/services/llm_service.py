@@ -1,14 +1,674 @@
+import asyncio
+import hashlib
 import os
+import re
+import json
+import socket
+import math
+import threading
 import time
-from typing import Dict, Any, Optional, Tuple
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Any, Iterable, Optional, Tuple
+from urllib.parse import urlparse
 import litellm
+import httpx
+import requests
+from urllib3.exceptions import NewConnectionError
 from litellm import completion, acompletion
 from app.models.core import LLMConfig
+from app.services.http_clients import http_clients
 import logging
 import google.generativeai as genai
+from google.ai import generativelanguage as glm
+from google.api_core.client_options import ClientOptions
 
 logger = logging.getLogger(__name__)
 
+# Fallback budgets for configs without rpm_limit / tpm_limit; 0 means unlimited
+DEFAULT_RPM_LIMIT = int(os.getenv("EVAL_DEFAULT_RPM_LIMIT", "0"))
+DEFAULT_TPM_LIMIT = int(os.getenv("EVAL_DEFAULT_TPM_LIMIT", "0"))
+# Used when a 429 carries no Retry-After header
+DEFAULT_RETRY_AFTER_SECONDS = float(os.getenv("EVAL_DEFAULT_RETRY_AFTER_SECONDS", "5"))
+
+GEMINI_API_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+# Provider-side caching of the static prompt prefix declared with {{cache_break}}
+CONTEXT_CACHING_ENABLED = os.getenv("EVAL_CONTEXT_CACHING", "1").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("EVAL_CONTEXT_CACHE_TTL_SECONDS", "600"))
+# Gemini refuses to cache contents below a model-specific minimum size
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("EVAL_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+
+# Hedged requests for configs with hedging_enabled: a duplicate is sent once a call
+# runs longer than this percentile of the model's recent response times
+HEDGE_PERCENTILE = float(os.getenv("EVAL_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("EVAL_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_HISTORY_SIZE = int(os.getenv("EVAL_HEDGE_HISTORY_SIZE", "200"))
+HEDGE_MAX_THREADS = int(os.getenv("EVAL_HEDGE_MAX_THREADS", "32"))
+
+# Refusal messages the prompt sets instruct the model to return; a stream that starts
+# with one of these is stopped early since the rest is only an explanation
+ABORT_SENTINELS = (
+    "Cannot formulate a valid SQL query",
+    "No time context provided",
+)
+
+# Leading whitespace, SQL comment markers and quotes are ignored when matching sentinels
+_SENTINEL_PREFIX_NOISE = re.compile(r'^[\s\-/*"\'`]+')
+
+
+@dataclass
+class StreamResult:
+    """Outcome of a streaming generation, with latency and throughput measurements."""
+    text: str
+    total_time_ms: int
+    time_to_first_token_ms: Optional[int] = None
+    output_tokens: Optional[int] = None
+    output_tokens_per_second: Optional[float] = None
+    aborted_early: bool = False
+    prompt_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None  # Prompt tokens served from the provider's context cache
+    hedged: bool = False  # A duplicate request was sent because this one was slow
+    hedge_won: bool = False  # The duplicate answered first and its response was used
+
+
+class GenerationCancelled(Exception):
+    """Raised when a streaming generation is stopped through its CancellationToken."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Generation cancelled ({reason})")
+        self.reason = reason
+
+
+class CancellationToken:
+    """
+    Thread-safe cancellation signal shared by a run and its in-flight provider calls.
+    Callbacks registered with on_cancel run once, on the thread that cancels.
+    """
+
+    def __init__(self):
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning(f"Cancellation callback failed: {e}")
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Registers callback to run on cancellation (immediately if already cancelled).
+        Returns a function that unregisters it.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def child(self) -> Tuple["CancellationToken", Callable[[], None]]:
+        """
+        Returns a token that is also cancelled when this one is, and a function that
+        detaches it. Cancelling the child leaves this token untouched.
+        """
+        child = CancellationToken()
+        detach = self.on_cancel(lambda: child.cancel(self.reason))
+        return child, detach
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise GenerationCancelled(self.reason)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleeps up to timeout seconds, returning early (True) if cancelled."""
+        return self._event.wait(timeout)
+
+
+class _StreamRecorder:
+    """Accumulates streamed text, timing the first token and watching for abort sentinels."""
+
+    def __init__(self, abort_on: Iterable[str], prompt: str = ""):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.parts = []
+        self.prompt = prompt
+        self.prompt_tokens = None
+        self.output_tokens = None
+        self.cached_tokens = None
+        self.aborted_early = False
+        self._sentinels = tuple(abort_on or ())
+        self._checking = bool(self._sentinels)
+
+    def add(self, text: Optional[str]) -> bool:
+        """Records a chunk of text. Returns False once the stream should be aborted."""
+        if not text:
+            return True
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.parts.append(text)
+        if self._checking:
+            head = _SENTINEL_PREFIX_NOISE.sub('', ''.join(self.parts))
+            if any(head.startswith(sentinel) for sentinel in self._sentinels):
+                self.aborted_early = True
+                return False
+            # Stop checking once the head can no longer grow into a sentinel
+            if head and not any(sentinel.startswith(head[:len(sentinel)]) for sentinel in self._sentinels):
+                self._checking = False
+        return True
+
+    def record_usage(self, prompt_tokens: Optional[int], output_tokens: Optional[int], cached_tokens: Optional[int]):
+        """Keeps the provider-reported counts; usage may arrive in several chunks."""
+        if prompt_tokens is not None:
+            self.prompt_tokens = prompt_tokens
+        if output_tokens is not None:
+            self.output_tokens = output_tokens
+        if cached_tokens is not None:
+            self.cached_tokens = cached_tokens
+
+    def result(self) -> StreamResult:
+        end = time.perf_counter()
+        text = ''.join(self.parts)
+        # Estimated (~4 characters per token) when the provider reports no usage
+        output_tokens = self.output_tokens if self.output_tokens is not None else max(1, len(text) // 4) if text else 0
+        prompt_tokens = self.prompt_tokens if self.prompt_tokens is not None else estimate_tokens(self.prompt)
+        time_to_first_token_ms = None
+        output_tokens_per_second = None
+        if self.first_token_at is not None:
+            time_to_first_token_ms = int((self.first_token_at - self.start) * 1000)
+            generation_seconds = end - self.first_token_at
+            if generation_seconds > 0:
+                output_tokens_per_second = round(output_tokens / generation_seconds, 2)
+        return StreamResult(
+            text=text,
+            total_time_ms=int((end - self.start) * 1000),
+            time_to_first_token_ms=time_to_first_token_ms,
+            output_tokens=output_tokens,
+            output_tokens_per_second=output_tokens_per_second,
+            aborted_early=self.aborted_early,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=self.cached_tokens or 0,
+        )
+
+class GeminiModel:
+    """
+    A Gemini model bound to its own GenerativeServiceClient. Requests are built
+    with the public generativelanguage types, and responses are wrapped like
+    genai.GenerativeModel.generate_content's (text, usage_metadata).
+
+    A base_url (e.g. a proxy) is reached over the REST transport at its scheme and
+    host; the transport adds the API version path itself.
+    """
+
+    def __init__(self, model_name: str, api_key: str, base_url: Optional[str] = None):
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        if base_url:
+            parsed = urlparse(base_url)
+            endpoint = f"{parsed.scheme}://{parsed.netloc}" if parsed.netloc else base_url
+            self.client = glm.GenerativeServiceClient(client_options=ClientOptions(api_key=api_key, api_endpoint=endpoint), transport="rest")
+        else:
+            self.client = glm.GenerativeServiceClient(client_options=ClientOptions(api_key=api_key))
+
+    def generate_content(self, prompt: str) -> genai.types.GenerateContentResponse:
+        request = glm.GenerateContentRequest(model=self.model_name, contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])])
+        return genai.types.GenerateContentResponse.from_response(self.client.generate_content(request=request))
+
+
+class GeminiModelRegistry:
+    """
+    Caches one GeminiModel per LLMConfig, each with its own API client, so
+    clients are created once instead of per call. An entry is keyed by config id
+    and rebuilt when the config's version (a fingerprint of the fields the client
+    depends on) changes. Per-config clients also avoid genai.configure(), whose
+    API key is process-global and would race between configs.
+    """
+
+    def __init__(self):
+        self._models: Dict[Any, Tuple[str, GeminiModel]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version_of(config: LLMConfig) -> str:
+        material = json.dumps([config.api_key, config.model, config.base_url, config.default_parameters], sort_keys=True, default=str)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()[:16]
+
+    def get(self, config: LLMConfig) -> GeminiModel:
+        version = self.version_of(config)
+        key = config.id if config.id is not None else version
+        with self._lock:
+            entry = self._models.get(key)
+            if entry and entry[0] == version:
+                return entry[1]
+            model = GeminiModel(config.model, config.api_key, config.base_url)
+            self._models[key] = (version, model)
+            logger.info(f"{'Rebuilt' if entry else 'Created'} Gemini client for LLM config {key} (model {config.model}, version {version})")
+            return model
+
+
+class GeminiContextCache:
+    """
+    Gemini cachedContents for static prompt prefixes, keyed by (API key, model,
+    prefix hash). A cache is created on first use and replaced shortly before its
+    TTL runs out. A prefix the API refuses to cache is not retried until a TTL has
+    passed, and calls go without a cache meanwhile.
+    """
+
+    def __init__(self, ttl_seconds: int = CONTEXT_CACHE_TTL_SECONDS, min_tokens: int = CONTEXT_CACHE_MIN_TOKENS):
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        # key -> (cachedContents name or None after a failure, monotonic expiry)
+        self._entries: Dict[Tuple[str, str, str], Tuple[Optional[str], float]] = {}
+        self._key_locks: Dict[Tuple[str, str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.failed = 0
+
+    @staticmethod
+    def key_for(config: LLMConfig, prefix: str) -> Tuple[str, str, str]:
+        return config.api_key, config.model, hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+    def get(self, config: LLMConfig, prefix: str) -> Optional[str]:
+        """Returns the cachedContents name for prefix, creating it if needed; None to send the prompt uncached."""
+        if estimate_tokens(prefix) < self.min_tokens:
+            return None
+        key = self.key_for(config, prefix)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Concurrent first calls for a prefix wait for one creation instead of each creating a cache
+        with key_lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry and entry[1] - now > min(60, self.ttl_seconds / 10):
+                if entry[0]:
+                    self.reused += 1
+                return entry[0]
+            name = self._create(config, prefix)
+            self._entries[key] = (name, now + self.ttl_seconds)
+            return name
+
+    def invalidate(self, config: LLMConfig, prefix: str):
+        with self._lock:
+            self._entries.pop(self.key_for(config, prefix), None)
+
+    def _create(self, config: LLMConfig, prefix: str) -> Optional[str]:
+        model = config.model if config.model.startswith("models/") else f"models/{config.model}"
+        payload = {
+            "model": model,
+            "contents": [{"role": "user", "parts": [{"text": prefix}]}],
+            "ttl": f"{self.ttl_seconds}s",
+        }
+        try:
+            resp = http_clients.post(f"{GEMINI_API_BASE_URL}/cachedContents?key={config.api_key}", json=payload)
+            resp.raise_for_status()
+            name = resp.json()["name"]
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Could not create Gemini context cache for {config.model}; sending prompts uncached: {e}")
+            return None
+        self.created += 1
+        logger.info(f"Created Gemini context cache {name} for {config.model} ({len(prefix)} characters, ttl {self.ttl_seconds}s)")
+        return name
+
+    def stats(self) -> dict:
+        with self._lock:
+            active = sum(1 for name, expires in self._entries.values() if name and expires > time.monotonic())
+        return {"active": active, "created": self.created, "reused": self.reused, "failed": self.failed}
+
+
+class HedgingPolicy:
+    """
+    Recent response times per model and the hedge delay derived from them. The
+    history is seeded from stored results (see seed) and extended with every
+    streamed call.
+    """
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, min_samples: int = HEDGE_MIN_SAMPLES,
+                 history_size: int = HEDGE_HISTORY_SIZE):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.history_size = history_size
+        self._latencies: Dict[str, deque] = {}
+        self._seeded = set()
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def needs_history(self, model: str) -> bool:
+        with self._lock:
+            return model not in self._seeded
+
+    def seed(self, model: str, latencies_ms: Iterable[int]):
+        """Adds historical response times (oldest first) for model."""
+        with self._lock:
+            self._seeded.add(model)
+            history = self._latencies.setdefault(model, deque(maxlen=self.history_size))
+            history.extendleft(reversed(list(latencies_ms)[-self.history_size:]))
+
+    def observe(self, model: str, latency_ms: int):
+        with self._lock:
+            self._latencies.setdefault(model, deque(maxlen=self.history_size)).append(latency_ms)
+
+    def delay_seconds(self, model: str) -> Optional[float]:
+        """The percentile response time of model, or None until min_samples are known."""
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[max(0, math.ceil(self.percentile / 100 * len(samples)) - 1)] / 1000
+
+    def record(self, model: str, won: bool):
+        with self._lock:
+            self._counts[(model, "hedged")] += 1
+            if won:
+                self._counts[(model, "hedge_won")] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = set(self._latencies) | {model for model, _ in self._counts}
+        stats = {}
+        for model in sorted(models):
+            delay = self.delay_seconds(model)
+            with self._lock:
+                stats[model] = {
+                    "samples": len(self._latencies.get(model, ())),
+                    "hedge_after_ms": int(delay * 1000) if delay is not None else None,
+                    "hedged": self._counts[(model, "hedged")],
+                    "hedge_won": self._counts[(model, "hedge_won")],
+                }
+        return stats
+
+
+def gemini_usage(usage_metadata: Optional[dict]) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """(prompt, output, cached) token counts from a Gemini REST usageMetadata object."""
+    usage_metadata = usage_metadata or {}
+    return (
+        usage_metadata.get("promptTokenCount"),
+        usage_metadata.get("candidatesTokenCount"),
+        usage_metadata.get("cachedContentTokenCount"),
+    )
+
+
+def litellm_usage(usage) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """(prompt, output, cached) token counts from a LiteLLM usage object."""
+    if usage is None:
+        return None, None, None
+    # OpenAI-style prompt_tokens_details, or Anthropic's cache_read_input_tokens
+    cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None)
+    if cached is None:
+        cached = getattr(usage, "cache_read_input_tokens", None)
+    # Streamed chunks before the last may carry zeroed usage
+    return getattr(usage, "prompt_tokens", None) or None, getattr(usage, "completion_tokens", None) or None, cached or None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used to reserve TPM budget before a call."""
+    return max(1, len(text) // 4) if text else 0
+
+
+class TokenBucket:
+    """
+    Per-minute budget refilled continuously. reserve() always takes the amount and
+    returns how long the caller must wait for the bucket to be back in credit, so
+    concurrent callers are served in arrival order without polling.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def set_limit(self, per_minute: int):
+        if per_minute != self.capacity:
+            self._refill(time.monotonic())
+            self.capacity = float(per_minute)
+            self.rate = per_minute / 60.0
+            self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # A single request larger than the whole budget would otherwise wait forever
+        self.tokens -= min(amount, self.capacity)
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def debit(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+    def refund(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderBudget:
+    """RPM and TPM buckets plus a Retry-After block for one provider and API key."""
+
+    def __init__(self):
+        self.rpm: Optional[TokenBucket] = None
+        self.tpm: Optional[TokenBucket] = None
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.waited_seconds = 0.0
+        self.rate_limited = 0
+        self.refunded = 0
+
+
+@dataclass
+class RateReservation:
+    """The request and tokens one acquire took from a budget, so they can be refunded."""
+    key: Tuple[str, str]
+    tokens: int
+    refunded: bool = False
+
+
+def request_not_sent(exc: BaseException) -> bool:
+    """
+    True when exc (or an exception it wraps, e.g. in LiteLLM) is a failure to
+    connect, so the provider never received the request.
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, requests.ConnectTimeout, NewConnectionError)):
+            return True
+        if isinstance(exc, requests.ConnectionError) and exc.args and isinstance(getattr(exc.args[0], "reason", None), NewConnectionError):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+
+class RateLimiter:
+    """
+    Token-bucket rate limiting per (provider, API key), shared by every caller in
+    the process. Budgets come from LLMConfig.rpm_limit / tpm_limit (or the
+    EVAL_DEFAULT_* fallbacks); when several configs share a key, the most recently
+    used config's limits apply. A 429 blocks the key for its Retry-After period.
+    A call that is cancelled while waiting, or that fails before its request is
+    sent, gets its reservation refunded.
+    """
+
+    def __init__(self, default_rpm: int = DEFAULT_RPM_LIMIT, default_tpm: int = DEFAULT_TPM_LIMIT):
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self._budgets: Dict[Tuple[str, str], ProviderBudget] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(config: LLMConfig) -> Tuple[str, str]:
+        provider = LLMConfig.PROVIDER_GEMINI if config.model.startswith(("gemini", "models/gemini")) else (config.provider or "")
+        return provider, config.api_key or ""
+
+    def _budget(self, config: LLMConfig) -> ProviderBudget:
+        budget = self._budgets.setdefault(self.key_for(config), ProviderBudget())
+        for attr, limit in (("rpm", getattr(config, "rpm_limit", None) or self.default_rpm),
+                            ("tpm", getattr(config, "tpm_limit", None) or self.default_tpm)):
+            bucket = getattr(budget, attr)
+            if not limit:
+                setattr(budget, attr, None)
+            elif bucket is None:
+                setattr(budget, attr, TokenBucket(limit))
+            else:
+                bucket.set_limit(limit)
+        return budget
+
+    def reserve(self, config: LLMConfig, prompt: str) -> Tuple[float, RateReservation]:
+        """
+        Takes one request and the prompt's estimated tokens from the budget.
+        Returns the wait in seconds and the reservation.
+        """
+        now = time.monotonic()
+        reservation = RateReservation(self.key_for(config), estimate_tokens(prompt))
+        with self._lock:
+            budget = self._budget(config)
+            delay = max(budget.blocked_until - now, 0.0)
+            if budget.rpm:
+                delay = max(delay, budget.rpm.reserve(1, now))
+            if budget.tpm:
+                delay = max(delay, budget.tpm.reserve(reservation.tokens, now))
+            budget.requests += 1
+            if delay > 0:
+                budget.throttled += 1
+                budget.waited_seconds += delay
+        return delay, reservation
+
+    def acquire(self, config: LLMConfig, prompt: str, cancel_token: Optional["CancellationToken"] = None) -> RateReservation:
+        """
+        Blocks until the call fits the budget. Returns early, with the reservation
+        refunded, if cancel_token is cancelled.
+        """
+        delay, reservation = self.reserve(config, prompt)
+        if delay > 0:
+            logger.info(f"Rate limit: delaying {config.model} call by {delay:.2f}s")
+            if cancel_token is not None:
+                cancel_token.wait(delay)
+            else:
+                time.sleep(delay)
+        if cancel_token is not None and cancel_token.cancelled:
+            self.refund(reservation)
+        return reservation
+
+    async def aacquire(self, config: LLMConfig, prompt: str) -> RateReservation:
+        """Waits until the call fits the budget; cancelling the waiting task refunds the reservation."""
+        delay, reservation = self.reserve(config, prompt)
+        if delay > 0:
+            logger.info(f"Rate limit: delaying {config.model} call by {delay:.2f}s")
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.refund(reservation)
+                raise
+        return reservation
+
+    def refund(self, reservation: Optional[RateReservation]):
+        """Returns a reservation's request and tokens to its budget, once."""
+        if reservation is None or reservation.refunded:
+            return
+        now = time.monotonic()
+        with self._lock:
+            reservation.refunded = True
+            budget = self._budgets.get(reservation.key)
+            if budget is None:
+                return
+            if budget.rpm:
+                budget.rpm.refund(1, now)
+            if budget.tpm:
+                budget.tpm.refund(reservation.tokens, now)
+            budget.refunded += 1
+
+    def refund_if_unsent(self, reservation: Optional[RateReservation], exc: Exception):
+        """Refunds the reservation of a call that failed before its request was sent."""
+        if request_not_sent(exc):
+            self.refund(reservation)
+
+    def record_output_tokens(self, config: LLMConfig, output_tokens: Optional[int]):
+        """Charges generated tokens to the TPM budget once they are known."""
+        if not output_tokens:
+            return
+        with self._lock:
+            budget = self._budget(config)
+            if budget.tpm:
+                budget.tpm.debit(output_tokens, time.monotonic())
+
+    def note_error(self, config: LLMConfig, exc: Exception) -> Optional[float]:
+        """If exc is an HTTP 429, blocks the key for its Retry-After period and returns it."""
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None) or getattr(exc, "status_code", None)
+        if status != 429:
+            return None
+        headers = getattr(response, "headers", None) or getattr(exc, "litellm_response_headers", None) or {}
+        retry_after = parse_retry_after(headers.get("retry-after") or headers.get("Retry-After"))
+        if retry_after is None:
+            retry_after = DEFAULT_RETRY_AFTER_SECONDS
+        with self._lock:
+            budget = self._budget(config)
+            budget.blocked_until = max(budget.blocked_until, time.monotonic() + retry_after)
+            budget.rate_limited += 1
+        logger.warning(f"Rate limited by {self.key_for(config)[0]} for {config.model}; pausing the key for {retry_after:.1f}s")
+        return retry_after
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                f"{provider}:{api_key[-4:]}": {
+                    "rpm_limit": int(budget.rpm.capacity) if budget.rpm else None,
+                    "tpm_limit": int(budget.tpm.capacity) if budget.tpm else None,
+                    "requests": budget.requests,
+                    "throttled": budget.throttled,
+                    "waited_seconds": round(budget.waited_seconds, 2),
+                    "rate_limited_responses": budget.rate_limited,
+                    "refunded": budget.refunded,
+                    "blocked_for_seconds": round(max(budget.blocked_until - now, 0.0), 2),
+                }
+                for (provider, api_key), budget in self._budgets.items()
+            }
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+# Shared by every endpoint and run in the process
+rate_limiter = RateLimiter()
+
+
 class LLMService:
     """
     A service class to handle LLM calls.
@@ -18,6 +678,10 @@ class LLMService:
     def __init__(self):
         # Configure LiteLLM with default settings
         litellm.set_verbose = True
+        self.gemini_models = GeminiModelRegistry()
+        self.context_cache = GeminiContextCache()
+        self.hedging = HedgingPolicy()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_THREADS, thread_name_prefix="llm-hedge")
         
     def _get_litellm_model_name(self, config: LLMConfig) -> str:
         """
@@ -72,14 +736,16 @@ class LLMService:
         """
         Generate text using the specified LLM configuration.
         """
+        reservation = None
         try:
             if config.provider == LLMConfig.PROVIDER_GEMINI:
                 # For Gemini, use the direct Google API client
-                genai.configure(api_key=config.api_key)
-                model = genai.GenerativeModel(model_name=config.model)
+                model = self.gemini_models.get(config)
+                reservation = rate_limiter.acquire(config, prompt)
                 start_time = time.time()
                 response = model.generate_content(prompt)
                 response_time_ms = int((time.time() - start_time) * 1000)
+                rate_limiter.record_output_tokens(config, getattr(getattr(response, "usage_metadata", None), "candidates_token_count", None))
                 text = response.text
                 logger.info(f"Generated text length: {len(text)} characters")
                 return text, response_time_ms
@@ -91,6 +757,7 @@ class LLMService:
                 logger.info(f"Calling {config.provider} model {config.model} with params: {params}")
                 
                 # Make the API call
+                reservation = rate_limiter.acquire(config, prompt)
                 start_time = time.time()
                 response = completion(
                     messages=[{"role": "user", "content": prompt}],
@@ -98,6 +765,7 @@ class LLMService:
                 )
                 response_time_ms = int((time.time() - start_time) * 1000)
                 
+                rate_limiter.record_output_tokens(config, getattr(getattr(response, "usage", None), "completion_tokens", None))
                 # Extract the generated text
                 if hasattr(response, 'choices') and len(response.choices) > 0:
                     generated_text = response.choices[0].message.content
@@ -109,6 +777,8 @@ class LLMService:
                     return f"-- ERROR: {error_msg}", response_time_ms
                 
         except Exception as e:
+            rate_limiter.note_error(config, e)
+            rate_limiter.refund_if_unsent(reservation, e)
             error_msg = f"Error calling {config.provider} API: {str(e)}"
             logger.error(error_msg, exc_info=True)
             return f"-- ERROR: {error_msg}", 0
@@ -125,14 +795,18 @@ class LLMService:
         Returns:
             Tuple of (generated_text, response_time_ms)
         """
+        reservation = None
         try:
             if config.provider == LLMConfig.PROVIDER_GEMINI:
-                # For Gemini, use the direct Google API client
-                genai.configure(api_key=config.api_key)
-                model = genai.GenerativeModel(model_name=config.model)
+                # For Gemini, use the direct Google API client. The blocking call runs on the
+                # default executor so the event loop keeps serving other coroutines; the SDK's
+                # grpc.aio client is bound to the loop that created it, and runs use more than one loop.
+                model = self.gemini_models.get(config)
+                reservation = await rate_limiter.aacquire(config, prompt)
                 start_time = time.time()
-                response = model.generate_content(prompt)
+                response = await asyncio.get_running_loop().run_in_executor(None, model.generate_content, prompt)
                 response_time_ms = int((time.time() - start_time) * 1000)
+                rate_limiter.record_output_tokens(config, getattr(getattr(response, "usage_metadata", None), "candidates_token_count", None))
                 text = response.text
                 logger.info(f"Generated text length: {len(text)} characters")
                 return text, response_time_ms
@@ -144,6 +818,7 @@ class LLMService:
                 logger.info(f"Async calling {config.provider} model {config.model} with params: {params}")
                 
                 # Make the async API call
+                reservation = await rate_limiter.aacquire(config, prompt)
                 start_time = time.time()
                 response = await acompletion(
                     messages=[{"role": "user", "content": prompt}],
@@ -151,6 +826,7 @@ class LLMService:
                 )
                 response_time_ms = int((time.time() - start_time) * 1000)
                 
+                rate_limiter.record_output_tokens(config, getattr(getattr(response, "usage", None), "completion_tokens", None))
                 # Extract the generated text
                 if hasattr(response, 'choices') and len(response.choices) > 0:
                     generated_text = response.choices[0].message.content
@@ -162,9 +838,274 @@ class LLMService:
                     return f"-- ERROR: {error_msg}", response_time_ms
                 
         except Exception as e:
+            rate_limiter.note_error(config, e)
+            rate_limiter.refund_if_unsent(reservation, e)
             error_msg = f"Async error calling {config.provider} API: {str(e)}"
             logger.error(error_msg, exc_info=True)
             return f"-- ERROR: {error_msg}", 0
 
+    def _is_gemini(self, config: LLMConfig) -> bool:
+        return config.provider == LLMConfig.PROVIDER_GEMINI or config.model.startswith(("gemini", "models/gemini"))
+
+    def _gemini_stream_request(self, config: LLMConfig, prompt: str, cached_content: Optional[str] = None,
+                               static_prefix_chars: int = 0, base_url: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """With cached_content, only the part of prompt after its static prefix is sent."""
+        url = f"{base_url or GEMINI_API_BASE_URL}/models/{config.model}:streamGenerateContent?alt=sse&key={config.api_key}"
+        if cached_content:
+            payload = {"cachedContent": cached_content, "contents": [{"role": "user", "parts": [{"text": prompt[static_prefix_chars:]}]}]}
+        else:
+            payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        if config.default_parameters:
+            payload.update(config.default_parameters)
+        return url, payload
+
+    def _gemini_cached_content(self, config: LLMConfig, prompt: str, static_prefix_chars: int) -> Optional[str]:
+        if not CONTEXT_CACHING_ENABLED or not static_prefix_chars:
+            return None
+        return self.context_cache.get(config, prompt[:static_prefix_chars])
+
+    def _open_gemini_stream(self, config: LLMConfig, prompt: str, static_prefix_chars: int,
+                            base_url: Optional[str] = None, cached_content: Optional[str] = None) -> requests.Response:
+        url, payload = self._gemini_stream_request(config, prompt, cached_content, static_prefix_chars, base_url)
+        resp = http_clients.post(url, json=payload, headers={"Content-Type": "application/json"}, stream=True)
+        if cached_content and resp.status_code in (400, 403, 404):
+            # The cache expired or was deleted before our TTL; send the whole prompt instead
+            logger.warning(f"Gemini context cache {cached_content} rejected ({resp.status_code}); retrying uncached")
+            resp.close()
+            self.context_cache.invalidate(config, prompt[:static_prefix_chars])
+            url, payload = self._gemini_stream_request(config, prompt)
+            resp = http_clients.post(url, json=payload, headers={"Content-Type": "application/json"}, stream=True)
+        return resp
+
+    @staticmethod
+    def _litellm_messages(config: LLMConfig, prompt: str, static_prefix_chars: int) -> list:
+        """
+        Chat messages for LiteLLM. Anthropic caches a prefix only when it is marked
+        with cache_control; OpenAI caches repeated prefixes automatically.
+        """
+        if CONTEXT_CACHING_ENABLED and static_prefix_chars and config.provider == LLMConfig.PROVIDER_ANTHROPIC:
+            return [{"role": "user", "content": [
+                {"type": "text", "text": prompt[:static_prefix_chars], "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": prompt[static_prefix_chars:]},
+            ]}]
+        return [{"role": "user", "content": prompt}]
+
+    @staticmethod
+    def _gemini_chunk(line: str) -> Tuple[Optional[str], Optional[dict]]:
+        """Parses one SSE line from streamGenerateContent into (text, usageMetadata)."""
+        if not line or not line.startswith("data:"):
+            return None, None
+        data = json.loads(line[len("data:"):].strip())
+        text = None
+        candidates = data.get("candidates") or []
+        if candidates:
+            parts = (candidates[0].get("content") or {}).get("parts") or []
+            text = ''.join(part.get("text", "") for part in parts)
+        return text, data.get("usageMetadata")
+
+    @staticmethod
+    def _interrupt_stream(resp: requests.Response):
+        """
+        Unblocks a read in progress on resp from another thread. Shutting the socket
+        down is used rather than resp.close(), which waits for the pending read.
+        """
+        sock = getattr(getattr(resp.raw, "connection", None), "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stream_generate(self, config: LLMConfig, prompt: str, abort_on: Iterable[str] = ABORT_SENTINELS,
+                        cancel_token: Optional[CancellationToken] = None, static_prefix_chars: int = 0,
+                        **kwargs) -> StreamResult:
+        """
+        Generate text with a streaming request, recording time-to-first-token, total
+        time and output tokens/sec. Stops early if the response starts with one of
+        the abort_on sentinels. Unlike generate(), provider errors are raised.
+        If cancel_token is cancelled the open stream is closed and GenerationCancelled
+        is raised. The first static_prefix_chars of prompt are cached provider-side
+        (Gemini cachedContents, Anthropic cache_control) where supported.
+
+        For configs with hedging_enabled, a call still running after the model's
+        HEDGE_PERCENTILE response time is duplicated to the config's first
+        alternate_base_url (or the same endpoint); the first response wins and the
+        other request is cancelled.
+        """
+        # A context cache is created (or looked up) before any timing starts, so a
+        # cache miss counts neither towards the call's latency nor the hedging delay
+        cached_content = self._gemini_cached_content(config, prompt, static_prefix_chars) if self._is_gemini(config) else None
+        delay = self.hedging.delay_seconds(config.model) if getattr(config, "hedging_enabled", False) else None
+        if delay is None:
+            result = self._stream_once(config, prompt, abort_on, cancel_token, static_prefix_chars, None, cached_content, **kwargs)
+        else:
+            result = self._hedged_stream(config, prompt, abort_on, cancel_token, static_prefix_chars, delay, cached_content, **kwargs)
+        if not result.aborted_early:
+            self.hedging.observe(config.model, result.total_time_ms)
+        return result
+
+    def _hedged_stream(self, config: LLMConfig, prompt: str, abort_on: Iterable[str], cancel_token: Optional[CancellationToken],
+                       static_prefix_chars: int, delay: float, cached_content: Optional[str], **kwargs) -> StreamResult:
+        cancel_token = cancel_token or CancellationToken()
+        cancel_token.raise_if_cancelled()
+        hedge_url = (getattr(config, "alternate_base_urls", None) or [None])[0]
+        start = time.perf_counter()
+        primary_token, detach_primary = cancel_token.child()
+        hedge_token, detach_hedge = cancel_token.child()
+        try:
+            primary = self._hedge_executor.submit(self._stream_once, config, prompt, abort_on, primary_token, static_prefix_chars, None,
+                                                  cached_content, **kwargs)
+            done, _ = wait([primary], timeout=delay)
+            if done:
+                return primary.result()
+            logger.info(f"{config.model} call exceeded {delay * 1000:.0f} ms; hedging to {hedge_url or 'the same endpoint'}")
+            # Context caches live on the primary endpoint
+            hedge = self._hedge_executor.submit(self._stream_once, config, prompt, abort_on, hedge_token,
+                                                0 if hedge_url else static_prefix_chars, hedge_url,
+                                                None if hedge_url else cached_content, **kwargs)
+            pending = {primary, hedge}
+            errors = {}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        errors[future] = e
+                        continue
+                    won = future is hedge
+                    (primary_token if won else hedge_token).cancel("hedge_lost")
+                    self.hedging.record(config.model, won)
+                    elapsed_ms = int((time.perf_counter() - start) * 1000)
+                    # Latency is measured from the first request, as seen by the caller
+                    ttft = result.time_to_first_token_ms
+                    if won and ttft is not None:
+                        ttft += elapsed_ms - result.total_time_ms
+                    return replace(result, total_time_ms=elapsed_ms, time_to_first_token_ms=ttft, hedged=True, hedge_won=won)
+            self.hedging.record(config.model, False)
+            cancel_token.raise_if_cancelled()
+            raise errors.get(primary) or errors[hedge]
+        finally:
+            detach_primary()
+            detach_hedge()
+
+    def _stream_once(self, config: LLMConfig, prompt: str, abort_on: Iterable[str], cancel_token: Optional[CancellationToken],
+                     static_prefix_chars: int, base_url: Optional[str], cached_content: Optional[str] = None,
+                     **kwargs) -> StreamResult:
+        """
+        A single streaming request, to base_url instead of the config's default endpoint
+        if given, sending only the part of prompt after the Gemini cached_content prefix.
+        """
+        cancel_token = cancel_token or CancellationToken()
+        cancel_token.raise_if_cancelled()
+        reservation = rate_limiter.acquire(config, prompt, cancel_token)
+        cancel_token.raise_if_cancelled()
+        recorder = _StreamRecorder(abort_on, prompt)
+        unregister = lambda: None
+        try:
+            if self._is_gemini(config):
+                logger.info(f"Streaming Gemini model {config.model}")
+                with self._open_gemini_stream(config, prompt, static_prefix_chars, base_url, cached_content) as resp:
+                    unregister = cancel_token.on_cancel(lambda: self._interrupt_stream(resp))
+                    resp.raise_for_status()
+                    for line in resp.iter_lines(decode_unicode=True):
+                        cancel_token.raise_if_cancelled()
+                        text, usage_metadata = self._gemini_chunk(line)
+                        if usage_metadata:
+                            recorder.record_usage(*gemini_usage(usage_metadata))
+                        if not recorder.add(text):
+                            break
+            else:
+                params = self._get_litellm_params(config, **kwargs)
+                if base_url:
+                    params['api_base'] = base_url
+                logger.info(f"Streaming {config.provider} model {config.model}")
+                response = completion(
+                    messages=self._litellm_messages(config, prompt, static_prefix_chars),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **params
+                )
+                for chunk in response:
+                    cancel_token.raise_if_cancelled()
+                    usage = getattr(chunk, "usage", None)
+                    if usage:
+                        recorder.record_usage(*litellm_usage(usage))
+                    if chunk.choices and not recorder.add(chunk.choices[0].delta.content):
+                        break
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            # A read interrupted by the cancel callback surfaces as a connection error
+            cancel_token.raise_if_cancelled()
+            rate_limiter.note_error(config, e)
+            rate_limiter.refund_if_unsent(reservation, e)
+            raise
+        finally:
+            unregister()
+        cancel_token.raise_if_cancelled()
+        result = recorder.result()
+        rate_limiter.record_output_tokens(config, result.output_tokens)
+        logger.info(f"Streamed {len(result.text)} characters (ttft {result.time_to_first_token_ms} ms, total {result.total_time_ms} ms, aborted early: {result.aborted_early})")
+        return result
+
+    async def astream_generate(self, config: LLMConfig, prompt: str, abort_on: Iterable[str] = ABORT_SENTINELS,
+                               cancel_token: Optional[CancellationToken] = None, static_prefix_chars: int = 0,
+                               **kwargs) -> StreamResult:
+        """
+        Async variant of stream_generate. Cancelling the awaiting task also stops the stream.
+        """
+        cancel_token = cancel_token or CancellationToken()
+        cancel_token.raise_if_cancelled()
+        cached_content = None
+        if self._is_gemini(config):
+            # Creating a context cache is a blocking call, and is not timed as part of the stream
+            cached_content = await asyncio.get_running_loop().run_in_executor(
+                None, self._gemini_cached_content, config, prompt, static_prefix_chars)
+        reservation = await rate_limiter.aacquire(config, prompt)
+        recorder = _StreamRecorder(abort_on, prompt)
+        try:
+            if self._is_gemini(config):
+                url, payload = self._gemini_stream_request(config, prompt, cached_content, static_prefix_chars)
+                logger.info(f"Async streaming Gemini model {config.model}")
+                async with http_clients.async_client(url).stream("POST", url, json=payload) as resp:
+                    if cached_content and resp.status_code in (400, 403, 404):
+                        # Expired early; the next call creates a new cache
+                        self.context_cache.invalidate(config, prompt[:static_prefix_chars])
+                    resp.raise_for_status()
+                    async for line in resp.aiter_lines():
+                        cancel_token.raise_if_cancelled()
+                        text, usage_metadata = self._gemini_chunk(line)
+                        if usage_metadata:
+                            recorder.record_usage(*gemini_usage(usage_metadata))
+                        if not recorder.add(text):
+                            break
+            else:
+                params = self._get_litellm_params(config, **kwargs)
+                logger.info(f"Async streaming {config.provider} model {config.model}")
+                response = await acompletion(
+                    messages=self._litellm_messages(config, prompt, static_prefix_chars),
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    **params
+                )
+                async for chunk in response:
+                    cancel_token.raise_if_cancelled()
+                    usage = getattr(chunk, "usage", None)
+                    if usage:
+                        recorder.record_usage(*litellm_usage(usage))
+                    if chunk.choices and not recorder.add(chunk.choices[0].delta.content):
+                        break
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            rate_limiter.note_error(config, e)
+            rate_limiter.refund_if_unsent(reservation, e)
+            raise
+        result = recorder.result()
+        rate_limiter.record_output_tokens(config, result.output_tokens)
+        logger.info(f"Async streamed {len(result.text)} characters (ttft {result.time_to_first_token_ms} ms, total {result.total_time_ms} ms, aborted early: {result.aborted_early})")
+        return result
+
 # Create a singleton instance
 llm_service = LLMService()
@@ -0,0 +1,215 @@
+"""
+Mock LLM provider and provider record/replay, for load testing without network access.
+
+MockProvider serves configs that have no real provider behind them (see
+provider_of). It samples a time to first token from a latency distribution,
+streams the mock SQL at a token rate, and fails a share of calls with an HTTP
+status. The EVAL_MOCK_* settings are the defaults, and each LLM config can
+override them with a "mock" entry in default_parameters, e.g.
+{"mock": {"distribution": "lognormal", "latency_ms": 800, "spread": 0.5,
+"error_rate": 0.02, "error_status": 503, "tokens_per_second": 60}}.
+
+ExchangeFixtures records real provider exchanges to a JSONL file when
+EVAL_LLM_FIXTURE_MODE=record, and serves them back with their recorded timings
+(scaled by EVAL_LLM_REPLAY_TIME_SCALE) instead of calling the provider when
+EVAL_LLM_FIXTURE_MODE=replay. Only Gemini exchanges are recorded and replayed;
+mock configs keep using MockProvider in both modes. Exchanges are matched on
+model and the SHA-256 of the prompt; repeated recordings of a prompt are
+replayed in turn. A prompt with no recording fails with fixture_missing, which
+does not count against the circuit breaker.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+from dataclasses import dataclass, fields
+from typing import Dict, List, Optional
+from app.services.llm_service import CancellationToken, GenerationCancelled, StreamResult, estimate_tokens
+from app.services.response_cache import VAR_DIR
+
+logger = logging.getLogger("mock_provider")
+
+MOCK_LATENCY_DISTRIBUTION = os.getenv("EVAL_MOCK_LATENCY_DISTRIBUTION", "fixed")  # fixed, uniform, normal, lognormal
+MOCK_LATENCY_MS = float(os.getenv("EVAL_MOCK_LATENCY_MS", "0"))  # Median time to first token
+MOCK_LATENCY_SPREAD = float(os.getenv("EVAL_MOCK_LATENCY_SPREAD", "0"))  # +/- ms (uniform), std dev ms (normal), sigma (lognormal)
+MOCK_TOKENS_PER_SECOND = float(os.getenv("EVAL_MOCK_TOKENS_PER_SECOND", "0"))  # 0 streams the whole response at once
+MOCK_ERROR_RATE = float(os.getenv("EVAL_MOCK_ERROR_RATE", "0"))
+MOCK_ERROR_STATUS = int(os.getenv("EVAL_MOCK_ERROR_STATUS", "503"))
+
+FIXTURE_MODE_OFF = "off"
+FIXTURE_MODE_RECORD = "record"
+FIXTURE_MODE_REPLAY = "replay"
+
+LLM_FIXTURE_MODE = os.getenv("EVAL_LLM_FIXTURE_MODE", FIXTURE_MODE_OFF)
+LLM_FIXTURE_PATH = os.getenv("EVAL_LLM_FIXTURE_PATH", os.path.join(VAR_DIR, "llm_fixtures.jsonl"))
+LLM_REPLAY_TIME_SCALE = float(os.getenv("EVAL_LLM_REPLAY_TIME_SCALE", "1"))  # 0 replays without waiting
+
+
+class MockProviderError(Exception):
+    """A simulated (or replayed) provider failure; status_code is classified like a LiteLLM error."""
+
+    def __init__(self, status_code: int, message: str = ""):
+        super().__init__(message or f"Mock provider returned HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FixtureNotFoundError(LookupError):
+    """Raised in replay mode for a prompt that was never recorded."""
+
+
+@dataclass
+class MockProfile:
+    distribution: str = MOCK_LATENCY_DISTRIBUTION
+    latency_ms: float = MOCK_LATENCY_MS
+    spread: float = MOCK_LATENCY_SPREAD
+    tokens_per_second: float = MOCK_TOKENS_PER_SECOND
+    error_rate: float = MOCK_ERROR_RATE
+    error_status: int = MOCK_ERROR_STATUS
+
+    @classmethod
+    def for_config(cls, config) -> "MockProfile":
+        overrides = (config.default_parameters or {}).get("mock") or {}
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in overrides.items() if k in names})
+
+    def sample_latency_ms(self, rng: random.Random) -> float:
+        if self.distribution == "uniform":
+            latency = rng.uniform(self.latency_ms - self.spread, self.latency_ms + self.spread)
+        elif self.distribution == "normal":
+            latency = rng.gauss(self.latency_ms, self.spread)
+        elif self.distribution == "lognormal":
+            # latency_ms is the median; spread is sigma of the underlying normal
+            latency = self.latency_ms * rng.lognormvariate(0, self.spread)
+        else:
+            latency = self.latency_ms
+        return max(0.0, latency)
+
+
+def _sleep(cancel_token: Optional[CancellationToken], seconds: float):
+    if seconds <= 0:
+        return
+    if cancel_token is None:
+        cancel_token = CancellationToken()
+    if cancel_token.wait(seconds):
+        raise GenerationCancelled(cancel_token.reason)
+
+
+class MockProvider:
+    """Generates mock SQL with simulated latency, throughput and failures."""
+
+    def __init__(self, seed: Optional[int] = None):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def stream_generate(self, config, prompt: str, text: str,
+                        cancel_token: Optional[CancellationToken] = None) -> StreamResult:
+        profile = MockProfile.for_config(config)
+        with self._lock:
+            ttft_ms = profile.sample_latency_ms(self._rng)
+            failed = self._rng.random() < profile.error_rate
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        _sleep(cancel_token, ttft_ms / 1000)
+        if failed:
+            raise MockProviderError(profile.error_status)
+        output_tokens = estimate_tokens(text)
+        stream_ms = output_tokens / profile.tokens_per_second * 1000 if profile.tokens_per_second > 0 else 0
+        _sleep(cancel_token, stream_ms / 1000)
+        return StreamResult(
+            text=text,
+            total_time_ms=int(ttft_ms + stream_ms),
+            time_to_first_token_ms=int(ttft_ms),
+            output_tokens=output_tokens,
+            output_tokens_per_second=round(output_tokens / (stream_ms / 1000), 2) if stream_ms else None,
+            prompt_tokens=estimate_tokens(prompt),
+            cached_tokens=0,
+        )
+
+
+class ExchangeFixtures:
+    """JSONL store of recorded provider exchanges."""
+
+    def __init__(self, mode: str = LLM_FIXTURE_MODE, path: str = LLM_FIXTURE_PATH, time_scale: float = LLM_REPLAY_TIME_SCALE):
+        if mode not in (FIXTURE_MODE_OFF, FIXTURE_MODE_RECORD, FIXTURE_MODE_REPLAY):
+            raise ValueError(f"Unknown EVAL_LLM_FIXTURE_MODE {mode!r}")
+        self.mode = mode
+        self.path = path
+        self.time_scale = time_scale
+        self._exchanges: Optional[Dict[tuple, List[dict]]] = None
+        self._next: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == FIXTURE_MODE_RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == FIXTURE_MODE_REPLAY
+
+    @staticmethod
+    def _key(model: str, prompt: str) -> tuple:
+        return model, hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def _append(self, entry: dict):
+        with self._lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def record(self, config, prompt: str, result: StreamResult):
+        model, prompt_sha256 = self._key(config.model, prompt)
+        self._append({
+            "model": model,
+            "prompt_sha256": prompt_sha256,
+            "text": result.text,
+            "total_time_ms": result.total_time_ms,
+            "time_to_first_token_ms": result.time_to_first_token_ms,
+            "output_tokens": result.output_tokens,
+            "output_tokens_per_second": result.output_tokens_per_second,
+            "aborted_early": result.aborted_early,
+            "prompt_tokens": result.prompt_tokens,
+            "cached_tokens": result.cached_tokens,
+        })
+
+    def record_error(self, config, prompt: str, status_code: int, message: str, elapsed_ms: int):
+        model, prompt_sha256 = self._key(config.model, prompt)
+        self._append({"model": model, "prompt_sha256": prompt_sha256, "error_status": status_code,
+                      "error": message, "total_time_ms": elapsed_ms})
+
+    def _load(self) -> Dict[tuple, List[dict]]:
+        with self._lock:
+            if self._exchanges is None:
+                exchanges: Dict[tuple, List[dict]] = {}
+                if os.path.exists(self.path):
+                    with open(self.path, encoding="utf-8") as f:
+                        for line in f:
+                            if line.strip():
+                                entry = json.loads(line)
+                                exchanges.setdefault((entry["model"], entry["prompt_sha256"]), []).append(entry)
+                logger.info(f"Loaded {sum(map(len, exchanges.values()))} recorded exchanges from {self.path}")
+                self._exchanges = exchanges
+            return self._exchanges
+
+    def replay(self, config, prompt: str, cancel_token: Optional[CancellationToken] = None) -> StreamResult:
+        key = self._key(config.model, prompt)
+        recorded = self._load().get(key)
+        if not recorded:
+            raise FixtureNotFoundError(f"No recorded exchange for model {config.model} and prompt {key[1][:12]}")
+        with self._lock:
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+        entry = recorded[index % len(recorded)]
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+        _sleep(cancel_token, entry["total_time_ms"] * self.time_scale / 1000)
+        if "error_status" in entry:
+            raise MockProviderError(entry["error_status"], entry.get("error", ""))
+        return StreamResult(**{f.name: entry[f.name] for f in fields(StreamResult) if f.name in entry})
+
+
+# Create singleton instances
+mock_provider = MockProvider()
+exchange_fixtures = ExchangeFixtures()
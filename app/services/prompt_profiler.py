@@ -0,0 +1,215 @@
+"""
+Token-budget profiles of prompt sets.
+
+A profile renders a prompt set and reports its size under two tokenizers: a
+tiktoken count (LiteLLM's token_counter for EVAL_PROFILE_TIKTOKEN_MODEL) and the
+~4 characters per token approximation used for Gemini. It breaks the count down
+per include file (each file's own text, times the number of times it is
+included), and compares the prompt against the context window of every
+configured model. Models whose prompt exceeds EVAL_PROMPT_BUDGET_FRACTION of
+their context window get a warning.
+
+Profiles are cached by a hash over the contents of every file in the include
+tree, the NLQ and the models, so editing any include produces a fresh profile.
+A repeated request is answered from the (mtime, size, inode) signatures of the
+include tree it last resolved to, without compiling the prompt set again.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+import litellm
+from app.services.llm_service import estimate_tokens
+from app.utils import file_readers
+from app.utils.file_cache import file_cache, file_signature
+
+logger = logging.getLogger("prompt_profiler")
+
+PROFILE_TIKTOKEN_MODEL = os.getenv("EVAL_PROFILE_TIKTOKEN_MODEL", "gpt-4o")
+PROMPT_BUDGET_FRACTION = float(os.getenv("EVAL_PROMPT_BUDGET_FRACTION", "0.5"))
+PROFILE_CACHE_SIZE = int(os.getenv("EVAL_PROFILE_CACHE_SIZE", "64"))
+
+TOKENIZER_TIKTOKEN = "tiktoken"
+TOKENIZER_GEMINI = "gemini_approx"
+
+# Input context windows for models LiteLLM's model map may not know, matched by prefix
+DEFAULT_CONTEXT_WINDOWS = {
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-1.5-flash": 1_048_576,
+    "gemini-2.0-flash": 1_048_576,
+    "gemini-2.5": 1_048_576,
+    "claude-": 200_000,
+}
+
+
+def count_tokens(text: str, tokenizer: str, model: Optional[str] = None) -> int:
+    if tokenizer == TOKENIZER_GEMINI:
+        return estimate_tokens(text)
+    try:
+        return litellm.token_counter(model=model or PROFILE_TIKTOKEN_MODEL, text=text)
+    except Exception as e:
+        logger.warning(f"Token counting with {model or PROFILE_TIKTOKEN_MODEL} failed ({e}); estimating from length")
+        return estimate_tokens(text)
+
+
+def context_window(model: str) -> Optional[int]:
+    try:
+        window = litellm.get_model_info(model).get("max_input_tokens")
+        if window:
+            return window
+    except Exception:
+        pass
+    for prefix, window in DEFAULT_CONTEXT_WINDOWS.items():
+        if model.startswith(prefix):
+            return window
+    return None
+
+
+class PromptProfiler:
+    def __init__(self, cache_size: int = PROFILE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._profiles: "OrderedDict[str, dict]" = OrderedDict()
+        # (main path, nlq, models) -> (signature of every file in the include tree, content hash)
+        self._signatures: "OrderedDict[tuple, Tuple[List[tuple], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _include_counts(main_path: str) -> Counter:
+        """How many times each file of the include tree ends up in the prompt."""
+        counts = Counter()
+
+        def walk(path):
+            counts[path] += 1
+            base_dir = os.path.dirname(path)
+            for match in file_readers.INCLUDE_PATTERN.finditer(file_cache.read(path)):
+                walk(os.path.abspath(os.path.join(base_dir, match.group(1).strip())))
+
+        walk(os.path.abspath(main_path))
+        return counts
+
+    def profile(self, prompt_set, llm_configs: List, prompt_sets_base_dir: str = "prompt_sets", nlq: str = "") -> dict:
+        """
+        Profiles a prompt set rendered for nlq. Raises FileNotFoundError or ValueError
+        like compile_prompt_set_by_name when the prompt cannot be built.
+        """
+        models = sorted({(c.model, c.provider or "") for c in llm_configs})
+        main_path = os.path.abspath(os.path.join(
+            prompt_sets_base_dir,
+            file_readers.safe_name_to_dirname(prompt_set.name),
+            file_readers.prompt_set_name_to_filename(prompt_set.name),
+        ))
+        request_key = (main_path, nlq, tuple(models))
+        content_hash, cached = self._cached_for_unchanged_files(request_key)
+        if cached is None:
+            compiled = file_readers.compile_prompt_set_by_name(prompt_set.name, prompt_sets_base_dir)
+            digest = hashlib.sha256()
+            signatures = []
+            for path in compiled.dependencies:
+                # Stat before reading: a file edited in between gets a stale signature and is profiled again
+                signatures.append((path, file_signature(os.stat(path))))
+                digest.update(path.encode("utf-8") + b"\0" + file_cache.read(path).encode("utf-8") + b"\0")
+            digest.update(repr((nlq, models)).encode("utf-8"))
+            content_hash = digest.hexdigest()
+            with self._lock:
+                cached = self._profiles.get(content_hash)
+            if cached is None:
+                cached = self._build(compiled, models, nlq)
+            with self._lock:
+                self._profiles[content_hash] = cached
+                self._profiles.move_to_end(content_hash)
+                self._signatures[request_key] = (signatures, content_hash)
+                self._signatures.move_to_end(request_key)
+                for entries in (self._profiles, self._signatures):
+                    while len(entries) > self.cache_size:
+                        entries.popitem(last=False)
+        else:
+            logger.info(f"Prompt profile for {prompt_set.name} served from cache ({content_hash[:12]})")
+        models_by_name: Dict[str, List[int]] = {}
+        for config in llm_configs:
+            models_by_name.setdefault(config.model, []).append(config.id)
+        return {
+            **cached,
+            "prompt_set_id": prompt_set.id,
+            "name": prompt_set.name,
+            "content_hash": content_hash,
+            "models": [{**m, "llm_config_ids": models_by_name.get(m["model"], [])} for m in cached["models"]],
+        }
+
+    def _cached_for_unchanged_files(self, request_key: tuple) -> Tuple[Optional[str], Optional[dict]]:
+        """(content hash, profile) of an earlier identical request whose files are all unchanged, else (None, None)."""
+        with self._lock:
+            entry = self._signatures.get(request_key)
+        if entry is None:
+            return None, None
+        signatures, content_hash = entry
+        try:
+            if any(file_signature(os.stat(path)) != signature for path, signature in signatures):
+                return None, None
+        except OSError:
+            return None, None
+        with self._lock:
+            cached = self._profiles.get(content_hash)
+            if cached is None:
+                return None, None
+            self._profiles.move_to_end(content_hash)
+            self._signatures.move_to_end(request_key)
+        return content_hash, cached
+
+    def _build(self, compiled, models: List[tuple], nlq: str) -> dict:
+        prompt = compiled.render({"NLQ": nlq, "BASELINE_SQL": ""})
+        tokens = {TOKENIZER_TIKTOKEN: count_tokens(prompt, TOKENIZER_TIKTOKEN), TOKENIZER_GEMINI: count_tokens(prompt, TOKENIZER_GEMINI)}
+        base_dir = os.path.dirname(os.path.abspath(compiled.main_path))
+        includes = []
+        for path, occurrences in self._include_counts(compiled.main_path).items():
+            own_text = file_readers.INCLUDE_PATTERN.sub("", file_cache.read(path))
+            file_tokens = {name: count_tokens(own_text, name) * occurrences for name in tokens}
+            includes.append({
+                "file": os.path.relpath(path, base_dir),
+                "occurrences": occurrences,
+                "chars": len(own_text) * occurrences,
+                "tokens": file_tokens,
+                "share": round(file_tokens[TOKENIZER_TIKTOKEN] / tokens[TOKENIZER_TIKTOKEN], 4) if tokens[TOKENIZER_TIKTOKEN] else 0.0,
+            })
+        includes.sort(key=lambda i: i["tokens"][TOKENIZER_TIKTOKEN], reverse=True)
+
+        model_reports, warnings = [], []
+        for model, provider in models:
+            if provider == "gemini" or model.startswith("gemini"):
+                tokenizer, prompt_tokens = TOKENIZER_GEMINI, tokens[TOKENIZER_GEMINI]
+            else:
+                tokenizer, prompt_tokens = model, count_tokens(prompt, TOKENIZER_TIKTOKEN, model)
+            window = context_window(model)
+            budget = int(window * PROMPT_BUDGET_FRACTION) if window else None
+            over_budget = budget is not None and prompt_tokens > budget
+            if over_budget:
+                warnings.append(f"{model}: prompt is ~{prompt_tokens} tokens, over its budget of {budget} "
+                                f"({PROMPT_BUDGET_FRACTION:.0%} of a {window}-token context window)")
+            elif window is None:
+                warnings.append(f"{model}: context window unknown; budget not checked")
+            model_reports.append({
+                "model": model,
+                "provider": provider or None,
+                "tokenizer": tokenizer,
+                "prompt_tokens": prompt_tokens,
+                "context_window": window,
+                "budget_tokens": budget,
+                "context_used": round(prompt_tokens / window, 4) if window else None,
+                "over_budget": over_budget,
+            })
+        for warning in warnings:
+            logger.warning(f"Prompt budget: {warning}")
+        return {
+            "nlq": nlq,
+            "rendered_chars": len(prompt),
+            "static_prefix_chars": compiled.static_prefix_chars,
+            "tokens": tokens,
+            "includes": includes,
+            "models": model_reports,
+            "warnings": warnings,
+        }
+
+
+# Create a singleton instance
+prompt_profiler = PromptProfiler()
@@ -0,0 +1,228 @@
+"""
+Retries and circuit breaking for provider calls.
+
+A RetryPolicy retries calls that failed with a retryable error class (timeouts,
+5xx, 429 by default) with exponential backoff and full jitter. A CircuitBreaker
+per (provider, model) tracks the outcome of recent attempts; once the share of
+failures in its window passes a threshold it opens and calls fail immediately
+with CircuitOpenError instead of waiting on a provider that is down. After a
+cool-down one probe call is let through, and its outcome closes or re-opens
+the circuit.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, Optional, Tuple
+from app.models.core import GeneratedResult
+from app.services.llm_service import CancellationToken, GenerationCancelled
+
+logger = logging.getLogger("resilience")
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("EVAL_RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("EVAL_RETRY_BASE_DELAY_SECONDS", "1"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("EVAL_RETRY_MAX_DELAY_SECONDS", "30"))
+RETRY_ERROR_CLASSES = os.getenv(
+    "EVAL_RETRY_ERROR_CLASSES",
+    ",".join([GeneratedResult.ERROR_TIMEOUT, GeneratedResult.ERROR_SERVER, GeneratedResult.ERROR_RATE_LIMIT]),
+)
+
+# Error classes that count against a provider's health; a 429 is handled by the
+# rate limiter, and client or parse errors mean the provider did answer
+BREAKER_FAILURE_CLASSES = frozenset([GeneratedResult.ERROR_TIMEOUT, GeneratedResult.ERROR_SERVER, GeneratedResult.ERROR_OTHER])
+
+BREAKER_WINDOW = int(os.getenv("EVAL_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("EVAL_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("EVAL_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("EVAL_BREAKER_OPEN_SECONDS", "30"))
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+    def __init__(self, key: Tuple[str, str], retry_in: float):
+        super().__init__(f"Circuit open for {key[0]}/{key[1]}; retrying in {retry_in:.0f}s")
+        self.key = key
+        self.retry_in = retry_in
+
+
+@dataclass
+class RetryPolicy:
+    max_attempts: int = RETRY_MAX_ATTEMPTS
+    base_delay: float = RETRY_BASE_DELAY_SECONDS
+    max_delay: float = RETRY_MAX_DELAY_SECONDS
+    retryable: FrozenSet[str] = field(
+        default_factory=lambda: frozenset(c.strip() for c in RETRY_ERROR_CLASSES.split(",") if c.strip())
+    )
+
+    def backoff(self, retry: int) -> float:
+        """Full-jitter delay before the given retry (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (retry - 1))))
+
+
+class CircuitBreaker:
+    """
+    Closed -> open when at least min_calls of the last window attempts are recorded
+    and the failure rate reaches failure_rate. Open -> half-open after open_seconds,
+    admitting a single probe. before_call hands the probe a token; only the
+    call holding it can close, re-open or release the half-open circuit.
+    """
+    STATE_CLOSED = "closed"
+    STATE_OPEN = "open"
+    STATE_HALF_OPEN = "half_open"
+
+    def __init__(self, key: Tuple[str, str], window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, open_seconds: float = BREAKER_OPEN_SECONDS):
+        self.key = key
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.state = self.STATE_CLOSED
+        self.opened_at = 0.0
+        self._probe: Optional[object] = None
+        self.outcomes = deque(maxlen=window)
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def probe_in_flight(self) -> bool:
+        return self._probe is not None
+
+    def before_call(self) -> Optional[object]:
+        """
+        Raises CircuitOpenError unless a call may go through now. Returns the probe
+        token when the call is the half-open probe, and None otherwise; the caller
+        passes it back to record or release_probe.
+        """
+        with self._lock:
+            if self.state == self.STATE_CLOSED:
+                return None
+            remaining = self.opened_at + self.open_seconds - time.monotonic()
+            if self.state == self.STATE_OPEN and remaining <= 0:
+                self.state = self.STATE_HALF_OPEN
+            if self.state == self.STATE_HALF_OPEN and self._probe is None:
+                self._probe = object()
+                return self._probe
+            self.rejected += 1
+            raise CircuitOpenError(self.key, max(remaining, 0))
+
+    def record(self, success: bool, probe: Optional[object] = None):
+        with self._lock:
+            if self.state == self.STATE_HALF_OPEN:
+                if probe is None or probe is not self._probe:
+                    # A call admitted before the circuit opened; only the probe decides
+                    return
+                self._probe = None
+                if success:
+                    self.state = self.STATE_CLOSED
+                    self.outcomes.clear()
+                    logger.info(f"Circuit for {self.key[0]}/{self.key[1]} closed after a successful probe")
+                else:
+                    self._open()
+                return
+            self.outcomes.append(success)
+            failures = self.outcomes.count(False)
+            if (self.state == self.STATE_CLOSED and len(self.outcomes) >= self.min_calls
+                    and failures / len(self.outcomes) >= self.failure_rate):
+                self._open()
+
+    def release_probe(self, probe: Optional[object]):
+        """Frees the half-open probe slot when the probe ended without a verdict (e.g. cancelled or a 429)."""
+        with self._lock:
+            if probe is not None and probe is self._probe:
+                self._probe = None
+
+    def _open(self):
+        self.state = self.STATE_OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        logger.warning(f"Circuit for {self.key[0]}/{self.key[1]} opened for {self.open_seconds:.0f}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "recent_calls": len(self.outcomes),
+                "recent_failures": self.outcomes.count(False),
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected,
+            }
+
+
+class CircuitBreakers:
+    """Process-wide registry of circuit breakers keyed by (provider, model)."""
+
+    def __init__(self):
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        key = (provider, model)
+        with self._lock:
+            if key not in self._breakers:
+                self._breakers[key] = CircuitBreaker(key)
+            return self._breakers[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {f"{b.key[0]}/{b.key[1]}": b.stats() for b in breakers}
+
+
+@dataclass
+class RetryOutcome:
+    """Result of call_with_retry: either result or the last exception and its error class."""
+    result: Any = None
+    exception: Optional[Exception] = None
+    error_class: Optional[str] = None
+    retries: int = 0
+
+
+def call_with_retry(call: Callable[[], Any], breaker: CircuitBreaker, policy: RetryPolicy,
+                    classify_error: Callable[[Exception], str],
+                    cancel_token: Optional[CancellationToken] = None) -> RetryOutcome:
+    """
+    Runs call until it succeeds, fails with a non-retryable error class, or the
+    policy's attempts are used up. Every attempt passes through breaker. Backoff
+    sleeps end early on cancellation, which raises GenerationCancelled, as does a
+    cancelled call.
+    """
+    retries = 0
+    while True:
+        try:
+            probe = breaker.before_call()
+        except CircuitOpenError as open_exc:
+            return RetryOutcome(exception=open_exc, error_class=GeneratedResult.ERROR_CIRCUIT_OPEN, retries=retries)
+        try:
+            result = call()
+        except GenerationCancelled:
+            breaker.release_probe(probe)
+            raise
+        except Exception as exc:
+            error_class = classify_error(exc)
+            retryable = error_class in policy.retryable
+            if error_class in BREAKER_FAILURE_CLASSES:
+                breaker.record(False, probe)
+            else:
+                breaker.release_probe(probe)
+            if not retryable or retries + 1 >= policy.max_attempts:
+                return RetryOutcome(exception=exc, error_class=error_class, retries=retries)
+            retries += 1
+            delay = policy.backoff(retries)
+            logger.info(f"Retrying {breaker.key[0]}/{breaker.key[1]} call after {error_class} in {delay:.1f}s (retry {retries})")
+            if cancel_token is not None:
+                if cancel_token.wait(delay):
+                    raise GenerationCancelled(cancel_token.reason)
+            else:
+                time.sleep(delay)
+            continue
+        breaker.record(True, probe)
+        return RetryOutcome(result=result, retries=retries)
+
+
+# Create a singleton instance
+circuit_breakers = CircuitBreakers()
@@ -0,0 +1,128 @@
+"""
+Persistent LLM response cache.
+
+Responses are stored in their own SQLite file, keyed by SHA-256 over (provider,
+model, default_parameters, SHA-256 of the rendered prompt). Entries expire after a
+TTL, and once the stored responses exceed a size budget the least recently used
+entries are evicted. Runs opt in with use_cache.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger("response_cache")
+
+# Runtime data lives in var/ at the project root, outside the app package
+VAR_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "var")
+RESPONSE_CACHE_PATH = os.getenv("EVAL_RESPONSE_CACHE_PATH", os.path.join(VAR_DIR, "llm_response_cache.db"))
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("EVAL_RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("EVAL_RESPONSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def cache_key(provider: str, model: str, parameters: Optional[dict], prompt: str) -> str:
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    material = json.dumps([provider, model, parameters or {}, prompt_hash], sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed response store with TTL expiry and size-bounded LRU eviction.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH, ttl_seconds: int = RESPONSE_CACHE_TTL_SECONDS,
+                 max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so that importing the module never touches the disk
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " provider TEXT, model TEXT,"
+                " response TEXT NOT NULL,"
+                " response_time_ms INTEGER,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access)")
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def key_for(llm_config, prompt: str) -> str:
+        return cache_key(getattr(llm_config, "provider", None) or "", llm_config.model, llm_config.default_parameters, prompt)
+
+    def get(self, llm_config, prompt: str) -> Optional[str]:
+        """Returns the cached response for this config and prompt, or None on a miss or expired entry."""
+        key = self.key_for(llm_config, prompt)
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT response, created_at, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            response, created_at, size = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._total_bytes -= size
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return response
+
+    def put(self, llm_config, prompt: str, response: str, response_time_ms: Optional[int] = None):
+        key = self.key_for(llm_config, prompt)
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            previous = conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, response, response_time_ms, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, getattr(llm_config, "provider", None), llm_config.model, response, response_time_ms, size, now, now),
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Deletes expired entries, then least recently used ones until back under 90% of the budget."""
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        self._total_bytes = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        target = int(self.max_bytes * 0.9)
+        if self._total_bytes <= target:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            if self._total_bytes <= target:
+                break
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._total_bytes -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} least recently used responses; cache holds {self._total_bytes} bytes")
+
+    def clear(self):
+        with self._lock:
+            self._connection().execute("DELETE FROM responses")
+            self._total_bytes = 0
+
+
+# Create a singleton instance
+response_cache = ResponseCache()
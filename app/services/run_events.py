@@ -0,0 +1,64 @@
+"""
+In-process pub/sub for validation run events.
+
+The job runner publishes events from its own thread; subscribers (such as the
+Server-Sent Events endpoint) consume them from an asyncio.Queue on their own
+event loop. Delivery is handed across threads with call_soon_threadsafe.
+"""
+import asyncio
+import json
+import logging
+import threading
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger("run_events")
+
+EVENT_RESULT = "result"
+EVENT_PROGRESS = "progress"
+EVENT_DONE = "done"
+
+
+class RunEventBroker:
+    """Fans out events for a run to every subscriber of that run."""
+
+    def __init__(self):
+        self._subscribers: Dict[int, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, run_id: int) -> asyncio.Queue:
+        """Must be called from the subscriber's running event loop."""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(run_id, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, run_id: int, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = [s for s in self._subscribers.get(run_id, []) if s[1] is not queue]
+            if subscribers:
+                self._subscribers[run_id] = subscribers
+            else:
+                self._subscribers.pop(run_id, None)
+
+    def has_subscribers(self, run_id: int) -> bool:
+        return bool(self._subscribers.get(run_id))
+
+    def publish(self, run_id: int, event: str, data: dict):
+        """Thread-safe: may be called from any thread or event loop."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(run_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (event, data))
+            except RuntimeError:
+                # Subscriber loop already closed
+                self.unsubscribe(run_id, queue)
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encodes one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+# Create a singleton instance
+run_events = RunEventBroker()
@@ -0,0 +1,150 @@
+"""
+Leased work items for out-of-process evaluation workers.
+
+A run dispatched in "workers" mode has one RunWorkItem per cell. Workers claim
+batches of pending items with a time-bound lease, renew the lease while the cells
+are in flight and mark them done in the same transaction that stores their
+results. An item whose lease expires (e.g. its worker died) becomes claimable
+again, so any number of processes or hosts sharing the database can drain a run.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Set
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from app.models.core import RunWorkItem
+
+logger = logging.getLogger("work_queue")
+
+LEASE_SECONDS = int(os.getenv("EVAL_WORK_LEASE_SECONDS", "120"))
+
+
+def enqueue(db: Session, run_id: int, cell_keys: Iterable[tuple]) -> int:
+    """
+    Replaces the work items of a run with one pending item per
+    (nlq_id, prompt_set_id, llm_config_id) key. The caller commits.
+    """
+    db.execute(delete(RunWorkItem).where(RunWorkItem.validation_run_id == run_id))
+    rows = [
+        {
+            "validation_run_id": run_id,
+            "nlq_id": nlq_id,
+            "prompt_set_id": prompt_set_id,
+            "llm_config_id": llm_config_id,
+            "status": RunWorkItem.STATUS_PENDING,
+            "attempts": 0,
+        }
+        for nlq_id, prompt_set_id, llm_config_id in cell_keys
+    ]
+    if rows:
+        db.execute(insert(RunWorkItem), rows)
+    return len(rows)
+
+
+def _claimable(now: datetime):
+    return or_(
+        RunWorkItem.status == RunWorkItem.STATUS_PENDING,
+        and_(RunWorkItem.status == RunWorkItem.STATUS_LEASED, RunWorkItem.lease_expires_at < now),
+    )
+
+
+def claim(db: Session, worker_id: str, limit: int, lease_seconds: int = LEASE_SECONDS) -> List:
+    """
+    Leases up to limit pending (or lease-expired) items to worker_id, oldest first,
+    and commits. Returns rows with id, validation_run_id, nlq_id, prompt_set_id,
+    llm_config_id and attempts.
+
+    The claimable condition is repeated on the outer UPDATE so that a row claimed by
+    a concurrent worker between the subquery and the update is not taken twice.
+    """
+    now = datetime.utcnow()
+    candidates = select(RunWorkItem.id).where(_claimable(now)).order_by(RunWorkItem.id).limit(limit).scalar_subquery()
+    claimed = db.execute(
+        update(RunWorkItem)
+        .where(RunWorkItem.id.in_(candidates), _claimable(now))
+        .values(
+            status=RunWorkItem.STATUS_LEASED,
+            lease_owner=worker_id,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            attempts=RunWorkItem.attempts + 1,
+        )
+        .returning(
+            RunWorkItem.id,
+            RunWorkItem.validation_run_id,
+            RunWorkItem.nlq_id,
+            RunWorkItem.prompt_set_id,
+            RunWorkItem.llm_config_id,
+            RunWorkItem.attempts,
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+    db.commit()
+    reclaimed = sum(1 for item in claimed if item.attempts > 1)
+    if claimed:
+        logger.info(f"Worker {worker_id} leased {len(claimed)} work items ({reclaimed} reclaimed from expired leases)")
+    return claimed
+
+
+def renew(db: Session, worker_id: str, item_ids: Iterable[int], lease_seconds: int = LEASE_SECONDS) -> int:
+    """Extends the leases worker_id still holds on item_ids and commits. Returns the number renewed."""
+    item_ids = list(item_ids)
+    if not item_ids:
+        return 0
+    renewed = db.execute(
+        update(RunWorkItem)
+        .where(
+            RunWorkItem.id.in_(item_ids),
+            RunWorkItem.lease_owner == worker_id,
+            RunWorkItem.status == RunWorkItem.STATUS_LEASED,
+        )
+        .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return renewed
+
+
+def complete(db: Session, worker_id: str, item_ids: Iterable[int]) -> Set[int]:
+    """
+    Marks the items worker_id still holds as done, without committing, so the caller
+    can store their results in the same transaction. Returns the ids that were
+    still held; results for the others belong to whichever worker reclaimed them.
+    """
+    item_ids = list(item_ids)
+    if not item_ids:
+        return set()
+    done = db.execute(
+        update(RunWorkItem)
+        .where(
+            RunWorkItem.id.in_(item_ids),
+            RunWorkItem.lease_owner == worker_id,
+            RunWorkItem.status == RunWorkItem.STATUS_LEASED,
+        )
+        .values(status=RunWorkItem.STATUS_DONE, lease_expires_at=None)
+        .returning(RunWorkItem.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    return set(done)
+
+
+def release(db: Session, worker_id: str) -> int:
+    """Returns every item still leased to worker_id to the pending state and commits."""
+    released = db.execute(
+        update(RunWorkItem)
+        .where(RunWorkItem.lease_owner == worker_id, RunWorkItem.status == RunWorkItem.STATUS_LEASED)
+        .values(status=RunWorkItem.STATUS_PENDING, lease_owner=None, lease_expires_at=None)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    return released
+
+
+def remaining(db: Session, run_id: int) -> int:
+    """Number of items of a run that are not done yet."""
+    return db.execute(
+        select(func.count(RunWorkItem.id)).where(
+            RunWorkItem.validation_run_id == run_id,
+            RunWorkItem.status != RunWorkItem.STATUS_DONE,
+        )
+    ).scalar_one()
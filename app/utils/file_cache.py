@@ -0,0 +1,163 @@
+"""
+Process-wide cache of prompt-set file contents.
+
+Entries are keyed by absolute path and validated on every read against the
+file's (mtime, size, inode), so an edited file is re-read on its next use. The
+cached contents are bounded by EVAL_FILE_CACHE_MAX_BYTES, evicting the least
+recently used files first.
+
+With EVAL_FILE_CACHE_WATCH=1 a background thread polls the prompt_sets tree
+every EVAL_FILE_CACHE_WATCH_INTERVAL_SECONDS and re-reads changed or new files
+ahead of their next use, so requests after an edit still hit the cache.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger("file_cache")
+
+FILE_CACHE_MAX_BYTES = int(os.getenv("EVAL_FILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+FILE_CACHE_WATCH = os.getenv("EVAL_FILE_CACHE_WATCH", "").lower() in ("1", "true", "yes")
+FILE_CACHE_WATCH_DIR = os.getenv("EVAL_FILE_CACHE_WATCH_DIR", "prompt_sets")
+FILE_CACHE_WATCH_INTERVAL_SECONDS = float(os.getenv("EVAL_FILE_CACHE_WATCH_INTERVAL_SECONDS", "2"))
+
+
+def file_signature(stat: os.stat_result) -> Tuple[int, int, int]:
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class FileCache:
+    def __init__(self, max_bytes: int = FILE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        # path -> (signature, contents), least recently used first
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int, int], str]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.prewarmed = 0
+        self._lock = threading.Lock()
+        self._watch_stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    def read(self, path: str) -> str:
+        """Returns the contents of path, from the cache while the file is unchanged. Raises OSError like open()."""
+        path = os.path.abspath(path)
+        signature = file_signature(os.stat(path))
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self.stale += 1
+            else:
+                self.misses += 1
+        return self._load(path)
+
+    def _load(self, path: str) -> str:
+        # Stat before reading: a write racing with the read leaves a signature that
+        # no longer matches, so the next read reloads
+        signature = file_signature(os.stat(path))
+        with open(path, 'r') as f:
+            contents = f.read()
+        self._store(path, signature, contents)
+        return contents
+
+    def _store(self, path: str, signature: Tuple[int, int, int], contents: str):
+        size = len(contents.encode("utf-8"))
+        with self._lock:
+            self._discard(path)
+            if size > self.max_bytes:
+                return
+            self._entries[path] = (signature, contents)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _discard(self, path: str):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= len(entry[1].encode("utf-8"))
+
+    def invalidate(self, path: Optional[str] = None):
+        """Drops one file, or every file when path is None."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                self._discard(os.path.abspath(path))
+
+    def refresh_tree(self, root: str):
+        """Re-reads cached or new files under root whose signature changed, and drops deleted ones."""
+        root = os.path.abspath(root)
+        seen = set()
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                seen.add(path)
+                try:
+                    signature = file_signature(os.stat(path))
+                    with self._lock:
+                        entry = self._entries.get(path)
+                    if entry is None or entry[0] != signature:
+                        self._load(path)
+                        with self._lock:
+                            self.prewarmed += 1
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.warning(f"Could not pre-warm {path}: {e}")
+        with self._lock:
+            for path in [p for p in self._entries if p.startswith(root + os.sep) and p not in seen]:
+                self._discard(path)
+
+    def start_watcher(self, root: str = FILE_CACHE_WATCH_DIR, interval: float = FILE_CACHE_WATCH_INTERVAL_SECONDS):
+        """Starts polling root for changes in a daemon thread; the first pass warms the cache."""
+        if self._watcher is not None:
+            return
+        if not os.path.isdir(root):
+            logger.warning(f"Not watching {root}: directory does not exist")
+            return
+        self._watch_stop.clear()
+
+        def watch():
+            while True:
+                self.refresh_tree(root)
+                if self._watch_stop.wait(interval):
+                    return
+
+        self._watcher = threading.Thread(target=watch, name="file-cache-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"Watching {os.path.abspath(root)} every {interval:.0f}s")
+
+    def stop_watcher(self):
+        if self._watcher is None:
+            return
+        self._watch_stop.set()
+        self._watcher.join()
+        self._watcher = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.stale
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_reloads": self.stale,
+                "evictions": self.evictions,
+                "prewarmed": self.prewarmed,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "watching": self._watcher is not None,
+            }
+
+
+# Create a singleton instance
+file_cache = FileCache()
@@ -1,7 +1,11 @@
 import json
+import re
 import yaml
-from typing import Any
+from typing import Any, List, Optional, Tuple
 import logging
+from app.utils.file_cache import file_cache
+from app.utils.prompt_templating import MACRO_PATTERN, MissingMacrosError, Template
+from app.utils.schema_index import RELEVANT_SCHEMA_MACRO, SchemaIndex, build_schema_index
 
 # Ensure prompt_loader logs always display to the terminal
 prompt_loader_logger = logging.getLogger("prompt_loader")
@@ -38,13 +42,26 @@ def load_prompt_set_by_name(prompt_set_name: str, prompt_sets_base_dir: str, dyn
     """
     Loads the main prompt file for a prompt set by name, with macro substitution.
     Raises FileNotFoundError with a clear message if the file is missing.
+    To render the same prompt set for many NLQs, use compile_prompt_set_by_name once instead.
+    """
+    return compile_prompt_set_by_name(prompt_set_name, prompt_sets_base_dir).render(dynamic_values)
+
+
+def compile_prompt_set_by_name(prompt_set_name: str, prompt_sets_base_dir: str) -> "CompiledPrompt":
+    """
+    Compiles the main prompt file for a prompt set by name: all includes are resolved
+    and macro slots located, so the result can be rendered per NLQ without file I/O.
+    Raises FileNotFoundError with a clear message if the file is missing.
     """
     import os
     filename = prompt_set_name_to_filename(prompt_set_name)
     main_path = os.path.join(prompt_sets_base_dir, safe_name_to_dirname(prompt_set_name), filename)
     if not os.path.isfile(main_path):
         raise FileNotFoundError(f"Prompt set main file not found: {main_path}.\nExpected main file for prompt set '{prompt_set_name}'.\nCheck that the file exists and the name is valid (spaces and special characters are replaced with underscores).")
-    return load_prompt_with_macros(main_path, dynamic_values)
+    compiled = compile_prompt(main_path)
+    if RELEVANT_SCHEMA_MACRO in compiled.macro_names:
+        compiled.schema_index = build_schema_index(os.path.dirname(main_path), exclude=[main_path])
+    return compiled
 
 
 def safe_name_to_dirname(name: str) -> str:
@@ -55,70 +72,141 @@ def safe_name_to_dirname(name: str) -> str:
     return re.sub(r'[^A-Za-z0-9_-]', '_', name)
 
 
-def load_prompt_with_macros(main_path: str, dynamic_values: dict) -> str:
+# Ends the static, cacheable section of a prompt; everything before it must be macro-free
+CACHE_BREAK_PATTERN = re.compile(r"{{\s*cache_break\s*}}")
+
+
+class CompiledPrompt:
     """
-    Loads a prompt file, performs macro substitution for dynamic values and file includes.
-    - dynamic_values: dict of macro_name -> value (e.g., {'NLQ': 'find all users'})
-    - File includes use syntax: {{include:filename}}
-    Enhanced with logging and error handling for traceability.
+    A prompt with every {{include:...}} already spliced in and tokenized into a
+    Template (app.utils.prompt_templating). Rendering fills the macro slots in one
+    pass and does no file I/O, so one instance can be reused for every NLQ in a run.
+
+    A {{RELEVANT_SCHEMA}} macro in a prompt set is filled with the schema and
+    semantic-layer chunks most relevant to the NLQ (app.utils.schema_index).
+
+    A {{cache_break}} directive marks the end of a static prefix that is identical
+    for every NLQ; static_prefix_chars is its length in every rendered prompt (0
+    without the directive), so providers can cache it.
+    """
+
+    def __init__(self, main_path: str, text: str, dependencies: Optional[List[str]] = None):
+        self.main_path = main_path
+        self.dependencies = dependencies or [main_path]  # Every file read to build text
+        breaks = list(CACHE_BREAK_PATTERN.finditer(text))
+        if len(breaks) > 1:
+            raise ValueError(f"Prompt {main_path} has more than one {{{{cache_break}}}}")
+        self.static_prefix_chars = 0
+        if breaks:
+            static_prefix = text[:breaks[0].start()]
+            if MACRO_PATTERN.search(static_prefix):
+                raise ValueError(f"Prompt {main_path} uses macros before {{{{cache_break}}}}; the cached prefix must be static")
+            text = static_prefix + text[breaks[0].end():]
+            self.static_prefix_chars = len(static_prefix)
+        self.text = text
+        self.template = Template(text)
+        self.macro_names = self.template.macro_names
+        # Fills {{RELEVANT_SCHEMA}} from the NLQ; set by compile_prompt_set_by_name
+        self.schema_index: Optional[SchemaIndex] = None
+
+    def render(self, dynamic_values: dict, strict: bool = True) -> str:
+        """
+        Substitutes dynamic values into the macro slots.
+        Raises ValueError (MissingMacrosError) if the prompt uses a macro that is not
+        in dynamic_values, unless strict is False.
+        """
+        logger = logging.getLogger("prompt_loader")
+        if self.schema_index is not None and RELEVANT_SCHEMA_MACRO not in dynamic_values:
+            dynamic_values = {**dynamic_values, RELEVANT_SCHEMA_MACRO: self.schema_index.relevant_schema(str(dynamic_values.get("NLQ", "")))}
+        try:
+            return self.template.render(dynamic_values, strict)
+        except MissingMacrosError as e:
+            for key in e.missing:
+                logger.error(f"Macro '{{{{{key}}}}}' not found in dynamic values!")
+            logger.error(f"Prompt construction error: missing macros not substituted: {e.missing}")
+            raise
+
+
+INCLUDE_PATTERN = re.compile(r"{{include:([^}]+)}}")
+# Deepest chain of nested includes accepted before the prompt is rejected
+INCLUDE_MAX_DEPTH = 16
+
+
+def resolve_includes(main_path: str, max_depth: int = INCLUDE_MAX_DEPTH) -> Tuple[str, List[str]]:
+    """
+    Reads a prompt file (through the process-wide file_cache) and expands its file
+    includes ({{include:filename}}) in a single pass over each file, building the
+    result with one join. Includes may nest; each filename is resolved relative
+    to the file that includes it.
+    Returns (text, dependencies), where dependencies lists the absolute path of
+    every file read, the main file first.
+    Raises FileNotFoundError for a missing file and ValueError for an include
+    cycle or a chain deeper than max_depth.
     """
     import os
-    import re
 
     logger = logging.getLogger("prompt_loader")
-
-    def include_file(base_dir, filename):
-        file_path = os.path.join(base_dir, filename)
-        try:
-            with open(file_path, 'r') as f:
-                logger.info(f"Including file: {file_path}")
-                return f.read()
-        except Exception as e:
-            logger.error(f"Error including file '{file_path}': {e}")
-            raise FileNotFoundError(f"Include file not found or could not be read: {file_path}")
+    texts = {}
+    parts = []
+    stack = []
+
+    def read(path, is_main):
+        if path not in texts:
+            try:
+                if not is_main:
+                    logger.info(f"Including file: {path}")
+                texts[path] = file_cache.read(path)
+            except Exception as e:
+                if is_main:
+                    logger.error(f"Error reading main prompt file '{path}': {e}")
+                    raise FileNotFoundError(f"Main prompt file not found or could not be read: {path}")
+                logger.error(f"Error including file '{path}': {e}")
+                raise FileNotFoundError(f"Include file not found or could not be read: {path}")
+        return texts[path]
+
+    def expand(path, is_main=False):
+        if path in stack:
+            chain = " -> ".join(stack[stack.index(path):] + [path])
+            raise ValueError(f"Include cycle in prompt {main_path}: {chain}")
+        if len(stack) > max_depth:
+            raise ValueError(f"Includes in prompt {main_path} are nested more than {max_depth} levels deep at {path}")
+        text = read(path, is_main)
+        stack.append(path)
+        base_dir = os.path.dirname(path)
+        position = 0
+        for match in INCLUDE_PATTERN.finditer(text):
+            parts.append(text[position:match.start()])
+            expand(os.path.abspath(os.path.join(base_dir, match.group(1).strip())))
+            position = match.end()
+        parts.append(text[position:])
+        stack.pop()
 
     logger.info(f"Loading main prompt file: {main_path}")
-    logger.info(f"Dynamic values for macro substitution: {json.dumps(dynamic_values, indent=2)}")
+    expand(os.path.abspath(main_path), is_main=True)
+    return ''.join(parts), list(texts)
 
-    # Read main prompt
-    try:
-        with open(main_path, 'r') as f:
-            prompt = f.read()
-    except Exception as e:
-        logger.error(f"Error reading main prompt file '{main_path}': {e}")
-        raise FileNotFoundError(f"Main prompt file not found or could not be read: {main_path}")
-
-    base_dir = os.path.dirname(main_path)
-
-    # Substitute file includes first
-    include_pattern = re.compile(r"{{include:([^}]+)}}")
-    while True:
-        match = include_pattern.search(prompt)
-        if not match:
-            break
-        filename = match.group(1).strip()
-        try:
-            included_content = include_file(base_dir, filename)
-        except Exception as e:
-            logger.error(f"Failed to include file '{filename}' in prompt: {e}")
-            raise
-        prompt = prompt[:match.start()] + included_content + prompt[match.end():]
-
-    # Substitute dynamic values
-    missing_macros = []
-    macro_pattern = re.compile(r"{{\s*([A-Za-z0-9_]+)\s*}}")
-    found_macros = set(macro_pattern.findall(prompt))
-    for key in found_macros:
-        if key not in dynamic_values:
-            missing_macros.append(key)
-            logger.error(f"Macro '{{{{{key}}}}}' not found in dynamic values!")
-    for key, value in dynamic_values.items():
-        prompt = prompt.replace(f"{{{{{key}}}}}", str(value))
-
-    if missing_macros:
-        logger.error(f"Prompt construction error: missing macros not substituted: {missing_macros}")
-        raise ValueError(f"Prompt construction error: missing macros not substituted: {missing_macros}")
 
+def compile_prompt(main_path: str) -> CompiledPrompt:
+    """
+    Reads a prompt file and resolves its file includes ({{include:filename}}),
+    returning a CompiledPrompt ready for macro substitution.
+    """
+    text, dependencies = resolve_includes(main_path)
+    return CompiledPrompt(main_path, text, dependencies)
+
+
+def load_prompt_with_macros(main_path: str, dynamic_values: dict, strict: bool = True) -> str:
+    """
+    Loads a prompt file, performs macro substitution for dynamic values and file includes.
+    - dynamic_values: dict of macro_name -> value (e.g., {'NLQ': 'find all users'})
+    - File includes use syntax: {{include:filename}}
+    - strict: raise on macros missing from dynamic_values instead of leaving them in place
+    Enhanced with logging and error handling for traceability.
+    """
+    logger = logging.getLogger("prompt_loader")
+    compiled = compile_prompt(main_path)
+    logger.info(f"Dynamic values for macro substitution: {json.dumps(dynamic_values, indent=2)}")
+    prompt = compiled.render(dynamic_values, strict)
     logger.info(f"Final constructed prompt:\n{prompt}")
     return prompt
 
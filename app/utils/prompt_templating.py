@@ -1,19 +1,77 @@
-from typing import Dict
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
 import re
 
-def apply_prompt_template(template: str, macros: Dict[str, str]) -> str:
-    """Replace all {{macro}} in template with their corresponding values from macros dict. Supports dot notation for nested dicts."""
-    def get_macro_value(key: str):
-        parts = key.split('.')
-        val = macros
-        for part in parts:
-            if isinstance(val, dict) and part in val:
-                val = val[part]
+# {{name}} or {{dotted.path}} into nested dicts
+MACRO_PATTERN = re.compile(r'\{\{\s*([\w\.]+)\s*\}\}')
+
+_MISSING = object()
+
+
+class MissingMacrosError(ValueError):
+    """Raised by a strict render for macros that have no value."""
+
+    def __init__(self, missing: List[str]):
+        super().__init__(f"Prompt construction error: missing macros not substituted: {missing}")
+        self.missing = missing
+
+
+class Template:
+    """
+    A template tokenized once into literal and {{macro}} slot segments, so every
+    render is a single pass joining literals with looked-up values.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        # (start, end, macro) for every macro occurrence, in order
+        self.slots: List[Tuple[int, int, str]] = [(m.start(), m.end(), m.group(1)) for m in MACRO_PATTERN.finditer(text)]
+        self.macro_names = {macro for _, _, macro in self.slots}
+        self._paths = [macro.split('.') for _, _, macro in self.slots]
+        self._literals = []
+        position = 0
+        for start, end, _ in self.slots:
+            self._literals.append(text[position:start])
+            position = end
+        self._literals.append(text[position:])
+
+    @staticmethod
+    def _lookup(values: Dict[str, Any], path: List[str]):
+        value = values
+        for part in path:
+            if isinstance(value, dict) and part in value:
+                value = value[part]
+            else:
+                return _MISSING
+        return value
+
+    def render(self, values: Dict[str, Any], strict: bool = False) -> str:
+        """
+        Fills every slot from values, following dotted paths into nested dicts.
+        Missing macros raise MissingMacrosError when strict, and are left in place
+        as {{macro}} otherwise.
+        """
+        parts = [self._literals[0]]
+        missing = []
+        for (_, _, macro), path, literal in zip(self.slots, self._paths, self._literals[1:]):
+            value = self._lookup(values, path)
+            if value is _MISSING:
+                missing.append(macro)
+                parts.append(f"{{{{{macro}}}}}")
             else:
-                return f"{{{{{key}}}}}"  # Leave macro as-is if not found
-        return str(val)
-    def replacer(match):
-        macro = match.group(1)
-        return get_macro_value(macro)
-    pattern = re.compile(r'\{\{\s*([\w\.]+)\s*\}\}')
-    return pattern.sub(replacer, template)
+                parts.append(str(value))
+            parts.append(literal)
+        if missing and strict:
+            raise MissingMacrosError(sorted(set(missing)))
+        return ''.join(parts)
+
+
+@lru_cache(maxsize=256)
+def compile_template(template: str) -> Template:
+    """Tokenizes template, reusing the result for templates rendered repeatedly."""
+    return Template(template)
+
+
+def apply_prompt_template(template: str, macros: Dict[str, Any], strict: bool = False) -> str:
+    """Replace all {{macro}} in template with their corresponding values from macros dict. Supports dot notation for nested dicts."""
+    return compile_template(template).render(macros, strict)
@@ -0,0 +1,259 @@
+"""
+Relevance-based schema pruning for the {{RELEVANT_SCHEMA}} prompt macro.
+
+A prompt set's schema DDL is split into one chunk per CREATE TABLE/VIEW, and its
+semantic-layer YAML into one chunk per model. The chunks are indexed with BM25
+over their names (weighted up), column, dimension and measure names, and
+descriptions. For each NLQ, the top_k chunks are rendered in place of the macro.
+Any table a chosen model reads from is rendered too. Glossary terms (and their
+"aka" aliases) found in the NLQ add their definitions to the query, so business
+vocabulary reaches the right tables.
+
+Sources are found in the prompt set folder: text files with CREATE TABLE/VIEW
+statements, YAML files with a models list, and glossary files with "Term:"
+entries. An optional relevant_schema.yaml there can name them explicitly
+(ddl, semantic_layers, glossary lists) and set top_k.
+"""
+import logging
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+import yaml
+from app.utils.file_cache import file_cache
+
+logger = logging.getLogger("schema_index")
+
+RELEVANT_SCHEMA_MACRO = "RELEVANT_SCHEMA"
+RELEVANT_SCHEMA_CONFIG = "relevant_schema.yaml"
+RELEVANT_SCHEMA_TOP_K = int(os.getenv("EVAL_RELEVANT_SCHEMA_TOP_K", "3"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+NAME_WEIGHT = 3  # Name tokens are counted this many times
+
+DDL_STATEMENT_PATTERN = re.compile(r'^[ \t]*create\s+(?:or\s+replace\s+)?(?:\w+\s+)*?(?:table|view)\s+([\w.$"]+)', re.IGNORECASE | re.MULTILINE)
+SEMANTIC_SQL_TABLE_PATTERN = re.compile(r'\$\{(\w+\.\w+\.\w+)\.\w+\}')
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it me of on or show the to what which with per give list".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words split on anything non-alphanumeric (including underscores), lightly stemmed."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4) if text else 0
+
+
+@dataclass
+class SchemaChunk:
+    KIND_TABLE = "table"
+    KIND_MODEL = "model"
+    kind: str
+    name: str
+    text: str
+    terms: Counter = field(default_factory=Counter)
+    tables: List[str] = field(default_factory=list)  # Tables a semantic model reads from
+
+    @property
+    def length(self) -> int:
+        return sum(self.terms.values())
+
+
+def ddl_column_names(definition: str) -> List[str]:
+    """Column names from the parenthesized column list that starts a table or view definition."""
+    start = definition.find("(")
+    if start < 0:
+        return []
+    columns, depth, current = [], 0, []
+    for char in definition[start:]:
+        if char == "(":
+            depth += 1
+            if depth == 1:
+                continue
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                break
+        if depth == 1 and char == ",":
+            columns.append("".join(current))
+            current = []
+        elif depth >= 1:
+            current.append(char)
+    columns.append("".join(current))
+    return [m.group(0) for m in (re.search(r"\w+", c) for c in columns) if m]
+
+
+def ddl_chunks(text: str) -> List[SchemaChunk]:
+    matches = list(DDL_STATEMENT_PATTERN.finditer(text))
+    chunks = []
+    for i, match in enumerate(matches):
+        statement = text[match.start():matches[i + 1].start() if i + 1 < len(matches) else len(text)].strip()
+        name = match.group(1).replace('"', '').rstrip('(').upper()
+        terms = Counter(tokenize(name.split('.')[-1]) * NAME_WEIGHT)
+        terms.update(tokenize(' '.join(ddl_column_names(statement[match.end() - match.start():]))))
+        chunks.append(SchemaChunk(SchemaChunk.KIND_TABLE, name, statement, terms))
+    return chunks
+
+
+def semantic_chunks(text: str) -> List[SchemaChunk]:
+    models = (yaml.safe_load(text) or {}).get("models") or []
+    chunks = []
+    for model in models:
+        if not isinstance(model, dict) or not model.get("name"):
+            continue
+        # Keep the file as written (comments included) when it defines a single model
+        model_text = text.strip() if len(models) == 1 else yaml.safe_dump({"models": [model]}, sort_keys=False, width=1000).strip()
+        terms = Counter(tokenize(model["name"]) * NAME_WEIGHT)
+        terms.update(tokenize(str(model.get("description") or "")))
+        for section in ("dimensions", "measures", "metrics"):
+            for item in model.get(section) or []:
+                if isinstance(item, dict):
+                    terms.update(tokenize(f"{item.get('name') or ''} {item.get('description') or ''}"))
+        tables = list(dict.fromkeys(t.upper() for t in SEMANTIC_SQL_TABLE_PATTERN.findall(model_text)))
+        chunks.append(SchemaChunk(SchemaChunk.KIND_MODEL, model["name"], model_text, terms, tables))
+    return chunks
+
+
+def glossary_entries(text: str) -> List[Tuple[List[str], str]]:
+    """(phrases, definition) per "Term:" entry; phrases are the term and its aliases."""
+    entries = []
+    for block in text.split("---"):
+        fields = {}
+        for line in block.splitlines():
+            key, sep, value = line.partition(":")
+            if sep:
+                fields[key.strip().lower()] = value.strip()
+        if "term" not in fields:
+            continue
+        term = re.sub(r"\s*\(.*?\)", "", fields["term"])
+        phrases = [term] + [a.strip() for a in fields.get("aka", "").split(",") if a.strip()]
+        entries.append(([p.lower() for p in phrases if p], f"{fields['term']} {fields.get('definition', '')}"))
+    return entries
+
+
+class SchemaIndex:
+    """BM25 index over the schema and semantic-layer chunks of one prompt set."""
+
+    def __init__(self, chunks: List[SchemaChunk], glossary: Optional[List[Tuple[List[str], str]]] = None,
+                 top_k: int = RELEVANT_SCHEMA_TOP_K):
+        self.chunks = chunks
+        self.glossary = glossary or []
+        self.top_k = top_k
+        self.tables = {c.name: c for c in chunks if c.kind == SchemaChunk.KIND_TABLE}
+        self.average_length = sum(c.length for c in chunks) / len(chunks) if chunks else 0
+        document_frequency = Counter(term for c in chunks for term in c.terms)
+        self.idf = {
+            term: math.log(1 + (len(chunks) - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+        self.full_text = self._render(chunks)
+
+    def query_terms(self, nlq: str) -> List[str]:
+        terms = tokenize(nlq)
+        lowered = f" {' '.join(TOKEN_PATTERN.findall(nlq.lower()))} "
+        for phrases, definition in self.glossary:
+            if any(f" {' '.join(TOKEN_PATTERN.findall(p))} " in lowered for p in phrases):
+                terms.extend(tokenize(definition))
+        return terms
+
+    def score(self, chunk: SchemaChunk, query: List[str]) -> float:
+        score = 0.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / self.average_length) if self.average_length else BM25_K1
+        for term in query:
+            tf = chunk.terms.get(term)
+            if tf:
+                score += self.idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+        return score
+
+    def select(self, nlq: str) -> List[Tuple[SchemaChunk, float]]:
+        """The top_k chunks with a positive score, plus the tables chosen models read from (score 0)."""
+        query = self.query_terms(nlq)
+        scored = sorted(((self.score(c, query), i) for i, c in enumerate(self.chunks)), reverse=True)
+        chosen = {i: score for score, i in scored[:self.top_k] if score > 0}
+        for i in list(chosen):
+            for table in self.chunks[i].tables:
+                if table in self.tables:
+                    chosen.setdefault(self.chunks.index(self.tables[table]), 0.0)
+        return [(self.chunks[i], chosen[i]) for i in sorted(chosen)]
+
+    @staticmethod
+    def _render(chunks: List[SchemaChunk]) -> str:
+        tables = [c.text for c in chunks if c.kind == SchemaChunk.KIND_TABLE]
+        models = [c.text for c in chunks if c.kind == SchemaChunk.KIND_MODEL]
+        sections = []
+        if tables:
+            sections.append("Here are the schemas:\n\n" + "\n\n".join(tables))
+        if models:
+            sections.append("Here are the semantic layer mappings:\n\n" + "\n\n".join(models))
+        return "\n\n".join(sections)
+
+    def relevant_schema(self, nlq: str) -> str:
+        """
+        Renders the chunks relevant to nlq; falls back to every chunk when nothing
+        matches, so a vague question still gets the full schema.
+        """
+        selected = self.select(nlq)
+        if not selected:
+            logger.info(f"RELEVANT_SCHEMA: no chunk matched {nlq!r}; using all {len(self.chunks)} chunks")
+            return self.full_text
+        text = self._render([c for c, _ in selected])
+        full_tokens, tokens = estimate_tokens(self.full_text), estimate_tokens(text)
+        chosen = ", ".join(f"{c.kind} {c.name} ({score:.2f})" if score else f"{c.kind} {c.name} (required)" for c, score in selected)
+        logger.info(f"RELEVANT_SCHEMA for {nlq!r}: {len(selected)} of {len(self.chunks)} chunks [{chosen}]; "
+                    f"~{tokens} tokens instead of ~{full_tokens} (saved ~{full_tokens - tokens})")
+        return text
+
+
+def _is_glossary(text: str) -> bool:
+    return bool(re.search(r"^Term:", text, re.MULTILINE))
+
+
+def build_schema_index(prompt_set_dir: str, exclude: Optional[List[str]] = None) -> SchemaIndex:
+    """
+    Builds the index for a prompt set folder from relevant_schema.yaml, or from the
+    sources found in the folder. Files are read through file_cache.
+    """
+    exclude = {os.path.abspath(p) for p in exclude or []}
+    config_path = os.path.join(prompt_set_dir, RELEVANT_SCHEMA_CONFIG)
+    config = yaml.safe_load(file_cache.read(config_path)) or {} if os.path.isfile(config_path) else {}
+    chunks, glossary = [], []
+    if any(key in config for key in ("ddl", "semantic_layers", "glossary")):
+        for name in config.get("ddl") or []:
+            chunks.extend(ddl_chunks(file_cache.read(os.path.join(prompt_set_dir, name))))
+        for name in config.get("semantic_layers") or []:
+            chunks.extend(semantic_chunks(file_cache.read(os.path.join(prompt_set_dir, name))))
+        for name in config.get("glossary") or []:
+            glossary.extend(glossary_entries(file_cache.read(os.path.join(prompt_set_dir, name))))
+    else:
+        for name in sorted(os.listdir(prompt_set_dir)):
+            path = os.path.join(prompt_set_dir, name)
+            if name == RELEVANT_SCHEMA_CONFIG or os.path.abspath(path) in exclude or not os.path.isfile(path):
+                continue
+            text = file_cache.read(path)
+            if name.endswith((".yaml", ".yml")):
+                try:
+                    chunks.extend(semantic_chunks(text))
+                except yaml.YAMLError as e:
+                    logger.warning(f"Skipping {path} for RELEVANT_SCHEMA: {e}")
+            elif DDL_STATEMENT_PATTERN.search(text):
+                chunks.extend(ddl_chunks(text))
+            elif _is_glossary(text):
+                glossary.extend(glossary_entries(text))
+    if not chunks:
+        raise ValueError(f"No schema DDL or semantic-layer models found in {prompt_set_dir} for {{{{{RELEVANT_SCHEMA_MACRO}}}}}")
+    logger.info(f"Indexed {len(chunks)} schema chunks and {len(glossary)} glossary terms from {prompt_set_dir}")
+    return SchemaIndex(chunks, glossary, int(config.get("top_k", RELEVANT_SCHEMA_TOP_K)))
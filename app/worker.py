@@ -0,0 +1,233 @@
+"""
+Standalone evaluation worker.
+
+Drains validation runs dispatched with EVAL_DISPATCH_MODE=workers by claiming
+leased work items from the shared database. Start as many as needed, on one host
+or several:
+
+    python -m app.worker [--worker-id ID] [--batch-size N] [--lease-seconds S]
+
+Each worker renews the leases of its in-flight cells; if it dies, its cells are
+reclaimed by other workers once their leases expire.
+"""
+import logging
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+)
+
+import argparse
+import asyncio
+import os
+import socket
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+from app.api.evaluate import ResultWriter, build_cells, cancellation_message, engine, load_reference_rows, seed_hedging_history
+from app.database.database import SessionLocal
+from app.models import core
+from app.services import work_queue
+from app.services.llm_service import CancellationToken
+from app.services.response_cache import response_cache
+
+logger = logging.getLogger("worker")
+
+WORKER_BATCH_SIZE = int(os.getenv("EVAL_WORKER_BATCH_SIZE", "16"))
+WORKER_POLL_SECONDS = float(os.getenv("EVAL_WORKER_POLL_SECONDS", "2"))
+# How often a worker checks whether the runs it is evaluating were cancelled
+WORKER_CANCEL_POLL_SECONDS = float(os.getenv("EVAL_WORKER_CANCEL_POLL_SECONDS", "2"))
+
+
+class LeasedResultWriter(ResultWriter):
+    """
+    ResultWriter for cells claimed from the work queue. A result is stored only if
+    this worker still holds the lease on its work item, and run counters are
+    incremented in SQL since other workers update the same run concurrently.
+    """
+
+    def __init__(self, db, run, worker_id: str, item_ids: Dict[tuple, int]):
+        super().__init__(db, run)
+        self.worker_id = worker_id
+        self.item_ids = item_ids
+        self.done_ids = set()
+
+    @property
+    def in_flight_ids(self) -> List[int]:
+        return [item_id for item_id in self.item_ids.values() if item_id not in self.done_ids]
+
+    def _owned_rows(self, rows: list) -> list:
+        keys = {row: (row.nlq_id, row.prompt_set_id, row.llm_config_id) for row in rows}
+        owned = work_queue.complete(self.db, self.worker_id, [self.item_ids[key] for key in keys.values()])
+        self.done_ids.update(self.item_ids[key] for key in keys.values())
+        lost = [row for row in rows if self.item_ids[keys[row]] not in owned]
+        if lost:
+            logger.warning(f"Worker {self.worker_id} lost the lease on {len(lost)} cells of run {self.run.id}; dropping their results")
+        return [row for row in rows if self.item_ids[keys[row]] in owned]
+
+    def _record_counts(self, counts: dict):
+        VR = core.ValidationRun
+        self.db.query(VR).filter(VR.id == self.run.id).update({
+            getattr(VR, column): getattr(VR, column) + increment for column, increment in counts.items()
+        }, synchronize_session=False)
+
+
+class Worker:
+    """
+    Keeps up to batch_size work items in flight, evaluated with the shared
+    EvaluationEngine. Items are claimed again as soon as earlier ones finish, so
+    one slow cell does not hold up the rest of its claim.
+    """
+
+    def __init__(self, worker_id: str, batch_size: int = WORKER_BATCH_SIZE,
+                 lease_seconds: int = work_queue.LEASE_SECONDS, poll_seconds: float = WORKER_POLL_SECONDS,
+                 cancel_poll_seconds: float = WORKER_CANCEL_POLL_SECONDS):
+        self.worker_id = worker_id
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.cancel_poll_seconds = cancel_poll_seconds
+
+    async def run(self, exit_when_idle: bool = False):
+        logger.info(f"Worker {self.worker_id} started (batch size {self.batch_size}, lease {self.lease_seconds}s)")
+        # Task per claimed group of a run's items -> number of items in it
+        in_flight: Dict[asyncio.Task, int] = {}
+        try:
+            while True:
+                free = self.batch_size - sum(in_flight.values())
+                items = []
+                if free > 0:
+                    db = SessionLocal()
+                    try:
+                        items = work_queue.claim(db, self.worker_id, free, self.lease_seconds)
+                    finally:
+                        db.close()
+                by_run = defaultdict(list)
+                for item in items:
+                    by_run[item.validation_run_id].append(item)
+                for run_id, run_items in by_run.items():
+                    in_flight[asyncio.create_task(self.process_run_items(run_id, run_items))] = len(run_items)
+                if not in_flight:
+                    if exit_when_idle:
+                        return
+                    await asyncio.sleep(self.poll_seconds)
+                    continue
+                # Wait for a slot to free up; while slots are left over, look for new work every poll
+                full = len(items) == free
+                done, _ = await asyncio.wait(in_flight, timeout=None if full else self.poll_seconds,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    del in_flight[task]
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            db = SessionLocal()
+            try:
+                released = work_queue.release(db, self.worker_id)
+                if released:
+                    logger.info(f"Worker {self.worker_id} released {released} unfinished work items")
+            finally:
+                db.close()
+
+    async def process_run_items(self, run_id: int, items: list):
+        # Preloaded reference rows must stay loaded across the per-batch commits
+        db = SessionLocal(expire_on_commit=False)
+        try:
+            run = db.query(core.ValidationRun).filter(core.ValidationRun.id == run_id).first()
+            if not run:
+                logger.warning(f"ValidationRun id {run_id} not found; dropping its work items")
+                work_queue.complete(db, self.worker_id, [item.id for item in items])
+                db.commit()
+                return
+            if run.status == core.ValidationRun.STATUS_QUEUED:
+                run.status = core.ValidationRun.STATUS_RUNNING
+                run.started_at = run.started_at or datetime.utcnow()
+                db.commit()
+            cancel_token = CancellationToken()
+            if run.status == core.ValidationRun.STATUS_CANCELLED:
+                cancel_token.cancel(core.GeneratedResult.ERROR_CANCELLED)
+
+            nlqs, prompt_sets, llm_configs = load_reference_rows(db, run.parameters or {})
+            seed_hedging_history(db, llm_configs)
+            item_ids = {(item.nlq_id, item.prompt_set_id, item.llm_config_id): item.id for item in items}
+            cells = build_cells(list(item_ids), nlqs, prompt_sets, llm_configs)
+            writer = LeasedResultWriter(db, run, self.worker_id, item_ids)
+            heartbeat = asyncio.create_task(self._heartbeat(db, writer))
+            cancel_watch = asyncio.create_task(self._watch_cancellation(run.id, cancel_token))
+            flusher = asyncio.create_task(writer.flush_periodically())
+            try:
+                deadline_seconds = (run.deadline_at - datetime.utcnow()).total_seconds() if run.deadline_at else None
+                cache = response_cache if (run.parameters or {}).get("use_cache") else None
+                await engine.run(cells, llm_configs, writer.add, cancel_token=cancel_token, deadline_seconds=deadline_seconds, cache=cache)
+            finally:
+                heartbeat.cancel()
+                cancel_watch.cancel()
+                flusher.cancel()
+                writer.flush()
+            self._finish_if_drained(db, run)
+        except Exception:
+            logger.exception(f"Worker {self.worker_id} failed on run {run_id}; its leases will be reclaimed")
+            db.rollback()
+        finally:
+            db.close()
+
+    async def _heartbeat(self, db, writer: LeasedResultWriter):
+        """Renews the leases of in-flight cells."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            work_queue.renew(db, self.worker_id, writer.in_flight_ids, self.lease_seconds)
+
+    async def _watch_cancellation(self, run_id: int, cancel_token: CancellationToken):
+        """Cancels the run's cells once the run is cancelled, checking every cancel_poll_seconds."""
+        while not cancel_token.cancelled:
+            await asyncio.sleep(min(self.cancel_poll_seconds, self.lease_seconds / 3))
+            # A fresh session each time: a long-lived one could keep reading an old snapshot
+            db = SessionLocal()
+            try:
+                status = db.query(core.ValidationRun.status).filter(core.ValidationRun.id == run_id).scalar()
+            finally:
+                db.close()
+            if status == core.ValidationRun.STATUS_CANCELLED:
+                cancel_token.cancel(core.GeneratedResult.ERROR_CANCELLED)
+
+    def _finish_if_drained(self, db, run):
+        if work_queue.remaining(db, run.id):
+            return
+        VR = core.ValidationRun
+        now = datetime.utcnow()
+        skipped = db.query(VR.skipped_cells).filter(VR.id == run.id).scalar()
+        values = {VR.status: VR.STATUS_COMPLETED, VR.finished_at: now}
+        if skipped and run.deadline_at and run.deadline_at <= now:
+            values = {VR.status: VR.STATUS_CANCELLED, VR.finished_at: now,
+                      VR.error: cancellation_message(run, core.GeneratedResult.ERROR_DEADLINE)}
+        # Only one worker moves the run out of running; a cancelled run keeps its status
+        finished = db.query(VR).filter(
+            VR.id == run.id, VR.status.in_([VR.STATUS_QUEUED, VR.STATUS_RUNNING])
+        ).update(values, synchronize_session=False)
+        db.commit()
+        if finished:
+            logger.info(f"Evaluation run {run.id} finished by worker {self.worker_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluation worker: drains leased run cells from the database.")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--batch-size", type=int, default=WORKER_BATCH_SIZE, help="Cells kept in flight")
+    parser.add_argument("--lease-seconds", type=int, default=work_queue.LEASE_SECONDS)
+    parser.add_argument("--poll-seconds", type=float, default=WORKER_POLL_SECONDS, help="Idle wait between claims")
+    parser.add_argument("--cancel-poll-seconds", type=float, default=WORKER_CANCEL_POLL_SECONDS,
+                        help="Interval between checks for cancelled runs")
+    parser.add_argument("--exit-when-idle", action="store_true", help="Exit once no work item is claimable")
+    args = parser.parse_args()
+    worker = Worker(args.worker_id, args.batch_size, args.lease_seconds, args.poll_seconds, args.cancel_poll_seconds)
+    try:
+        asyncio.run(worker.run(exit_when_idle=args.exit_when_idle))
+    except KeyboardInterrupt:
+        logger.info(f"Worker {args.worker_id} stopped")
+    finally:
+        engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
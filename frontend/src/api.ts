@@ -20,6 +20,37 @@ export async function runEvaluation(nlqIds: number[], promptSetIds: number[], ll
   return res.json();
 }
 
+export async function cancelRun(runId: number) {
+  const res = await fetch(`http://localhost:8000/runs/${runId}/cancel`, { method: "POST" });
+  if (!res.ok) throw new Error("Failed to cancel run");
+  return res.json();
+}
+
+export async function fetchRunStatus(runId: number) {
+  const res = await fetch(`http://localhost:8000/runs/${runId}/status`);
+  if (!res.ok) throw new Error("Failed to fetch run status");
+  return res.json();
+}
+
+export function streamRunResults(runId: number, onResult: (result: any) => void, onProgress?: (progress: any) => void): Promise<any> {
+  // Server-Sent Events: each result arrives as soon as it is persisted; resolves when the run finishes
+  return new Promise((resolve, reject) => {
+    const source = new EventSource(`http://localhost:8000/runs/${runId}/events`);
+    source.addEventListener("result", (e) => onResult(JSON.parse((e as MessageEvent).data)));
+    source.addEventListener("progress", (e) => onProgress?.(JSON.parse((e as MessageEvent).data)));
+    source.addEventListener("done", (e) => {
+      source.close();
+      const progress = JSON.parse((e as MessageEvent).data);
+      if (progress.status === "failed") reject(new Error(progress.error || "Evaluation run failed"));
+      else resolve(progress);
+    });
+    source.onerror = () => {
+      source.close();
+      reject(new Error("Lost connection to the run event stream"));
+    };
+  });
+}
+
 export async function fetchRunDetails(runId: number) {
   const res = await fetch(`http://localhost:8000/runs/${runId}`);
   if (!res.ok) throw new Error("Failed to fetch run details");
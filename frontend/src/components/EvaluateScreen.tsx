@@ -8,7 +8,7 @@ import { SnowflakeConnection } from '../types/snowflakeTypes';
 
 import CloseIcon from '@mui/icons-material/Close';
 import ContentCopyIcon from '@mui/icons-material/ContentCopy';
-import { fetchPromptSets, fetchLLMConfigs, runEvaluation, fetchRunDetails, createNlq, updateGeneratedResult, explainQuery, fetchBaselineSqlForNlq, searchNlqByText } from '../api';
+import { fetchPromptSets, fetchLLMConfigs, runEvaluation, streamRunResults, fetchRunDetails, createNlq, updateGeneratedResult, explainQuery, fetchBaselineSqlForNlq, searchNlqByText } from '../api';
 
 interface PromptSet {
   id: number;
@@ -271,7 +271,15 @@ const handleRunEvaluation = async () => {
     try {
       const result = await runEvaluation([nlqId], selectedPromptSets, selectedLlmConfigs);
       setRunResult(result.run_id);
-      // Fetch run details
+      // Render each model's SQL as soon as it arrives
+      setRunDetails({ id: result.run_id, generated_results: [] });
+      await streamRunResults(result.run_id, (r: any) => {
+        setRunDetails((prev: any) => ({
+          ...prev,
+          generated_results: [...(prev?.generated_results || []).filter((x: any) => x.id !== r.id), r],
+        }));
+      });
+      // Fetch full run details (including prompts) once the run has finished
       const details = await fetchRunDetails(result.run_id);
       setRunDetails(details);
     } catch (e: any) {
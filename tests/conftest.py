@@ -0,0 +1,69 @@
+import os
+import sys
+
+# Run the tests from any directory, and keep LiteLLM from fetching its model cost map
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("LITELLM_LOCAL_MODEL_COST_MAP", "True")
+
+import pytest
+from sqlalchemy import create_engine
+from app.database.database import Base, SessionLocal
+from app.models import core
+
+PROMPT_SET_NAME = "Test Prompt Set"
+
+
+@pytest.fixture
+def database(tmp_path):
+    """Binds SessionLocal to an empty SQLite database under tmp_path for the test."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'eval.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    original_bind = SessionLocal.kw["bind"]
+    SessionLocal.configure(bind=engine)
+    yield SessionLocal
+    SessionLocal.configure(bind=original_bind)
+    engine.dispose()
+
+
+@pytest.fixture
+def prompt_sets_dir(tmp_path, monkeypatch):
+    """Runs the test from tmp_path, where build_cells finds PROMPT_SET_NAME under prompt_sets/."""
+    directory = tmp_path / "prompt_sets" / "Test_Prompt_Set"
+    directory.mkdir(parents=True)
+    (directory / "Test_Prompt_Set.txt").write_text("Write SQL for: {{NLQ}}\n")
+    monkeypatch.chdir(tmp_path)
+    return directory
+
+
+def seed(session_factory, nlq_count=1, mock_profiles=({},)):
+    """Adds NLQs, the test prompt set and one mock LLM config per profile; returns their ids."""
+    db = session_factory()
+    try:
+        nlqs = [core.NLQ(nlq_text=f"question {i}") for i in range(nlq_count)]
+        prompt_set = core.PromptSet(name=PROMPT_SET_NAME, description="test")
+        llm_configs = [
+            core.LLMConfig(name=f"mock {i}", api_key=f"key-{i}", model=f"mock-model-{i}", default_parameters={"mock": profile})
+            for i, profile in enumerate(mock_profiles)
+        ]
+        db.add_all(nlqs + [prompt_set] + llm_configs)
+        db.commit()
+        return {
+            "nlq_ids": [n.id for n in nlqs],
+            "prompt_set_ids": [prompt_set.id],
+            "llm_config_ids": [c.id for c in llm_configs],
+        }
+    finally:
+        db.close()
+
+
+def create_run(session_factory, ids, **fields):
+    """Adds a queued ValidationRun over the seeded matrix; returns its id."""
+    db = session_factory()
+    try:
+        cells = len(ids["nlq_ids"]) * len(ids["prompt_set_ids"]) * len(ids["llm_config_ids"])
+        run = core.ValidationRun(parameters=dict(ids), status=core.ValidationRun.STATUS_QUEUED, total_cells=cells, **fields)
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
@@ -0,0 +1,71 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+import httpx
+from fastapi import FastAPI
+from app.api import fake_batch
+from app.models.core import GeneratedResult
+from app.services import batch_jobs
+from app.services.batch_jobs import BatchExecutor
+from app.services.evaluation_engine import EvaluationCell, EvaluationEngine
+from app.services.response_cache import ResponseCache
+
+BASE_URL = "http://fake/fake_batch/v1"
+
+
+def fake_batch_client(monkeypatch):
+    """Routes the executor's HTTP calls to the fake batch endpoint in process."""
+    app = FastAPI()
+    app.include_router(fake_batch.router)
+    monkeypatch.setattr(fake_batch, "FAKE_BATCH_SECONDS", 0.05)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+    monkeypatch.setattr(batch_jobs.http_clients, "async_client", lambda url: client)
+
+
+def executor():
+    def generate(cell, llm_config, cancel_token):
+        raise AssertionError("batch cells must not be generated online")
+    engine = EvaluationEngine(generate=generate, provider_of=lambda config: "openai")
+    return BatchExecutor(engine, provider_of=lambda config: "openai",
+                         classify_error=lambda exc: GeneratedResult.ERROR_OTHER, poll_seconds=0.02, base_url=BASE_URL)
+
+
+def test_batch_round_trip_through_fake_endpoint(monkeypatch, tmp_path):
+    fake_batch_client(monkeypatch)
+    config = SimpleNamespace(id=7, name="fake", model="gpt-4o-mini", provider="openai", api_key="key", default_parameters=None)
+    cells = [EvaluationCell(nlq_id=n, prompt_set_id=1, llm_config_id=7, full_prompt=f"Question {n}") for n in (1, 2, 3)]
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    outcomes, submitted = [], []
+
+    asyncio.run(executor().run(cells, {7: config}, outcomes.append, cache=cache,
+                               on_submitted=lambda llm_config_id, batch_id: submitted.append(batch_id)))
+
+    assert sorted(o.cell.nlq_id for o in outcomes) == [1, 2, 3]
+    batch_id = submitted[0]
+    assert batch_id in fake_batch.batches and submitted == [batch_id, None]
+    for outcome in outcomes:
+        assert outcome.status == GeneratedResult.STATUS_SUCCESS
+        assert outcome.generated_sql.startswith("SELECT 1; -- FAKE BATCH SQL for model gpt-4o-mini")
+        assert outcome.cache_hit is False
+        assert outcome.prompt_tokens and outcome.completion_tokens
+        # Batch turnaround is recorded separately from model latency
+        assert outcome.batch_id == batch_id
+        assert outcome.llm_response_time_ms is None
+        assert outcome.batch_turnaround_ms >= 0
+    assert cache.get(config, "Question 1").startswith("SELECT 1;")
+    latencies = sqlite3.connect(cache.path).execute("SELECT response_time_ms FROM responses").fetchall()
+    assert latencies == [(None,)] * 3
+
+
+def test_batch_cells_answered_from_cache_are_not_submitted(monkeypatch, tmp_path):
+    fake_batch_client(monkeypatch)
+    config = SimpleNamespace(id=8, name="fake", model="gpt-4o-mini", provider="openai", api_key="key", default_parameters=None)
+    cache = ResponseCache(str(tmp_path / "cache.db"))
+    cache.put(config, "Cached question", "SELECT 42")
+    outcomes, submitted = [], []
+
+    asyncio.run(executor().run([EvaluationCell(1, 1, 8, "Cached question")], {8: config}, outcomes.append, cache=cache,
+                               on_submitted=lambda llm_config_id, batch_id: submitted.append(batch_id)))
+
+    assert [(o.generated_sql, o.cache_hit, o.batch_id) for o in outcomes] == [("SELECT 42", True, None)]
+    assert submitted == []
@@ -0,0 +1,106 @@
+import time
+import warnings
+import pytest
+from fastapi.testclient import TestClient
+from app.api import evaluate
+from app.main import app
+from app.models import core
+from app.services.evaluation_engine import EvaluationEngine
+from conftest import seed
+
+# A config slow enough to still be in flight when the run is cancelled
+SLOW_MOCK = {"latency_ms": 3000}
+
+
+@pytest.fixture
+def client(database, prompt_sets_dir, monkeypatch):
+    monkeypatch.setattr(evaluate, "DISPATCH_MODE", evaluate.DISPATCH_MODE_INLINE)
+    monkeypatch.setattr(evaluate, "engine", EvaluationEngine(
+        generate=evaluate.generate_for_cell, provider_of=evaluate.provider_of, classify_error=evaluate.classify_llm_error,
+    ))
+    with TestClient(app) as client:
+        yield client
+
+
+def wait_for_status(client, run_id, predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(f"/runs/{run_id}/status").json()
+        if predicate(status) or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+
+def result_rows(database, run_id):
+    db = database()
+    try:
+        GR = core.GeneratedResult
+        return db.query(GR.llm_config_id, GR.status, GR.error_class).filter(GR.validation_run_id == run_id).all()
+    finally:
+        db.close()
+
+
+def test_pending_cell_keys_excludes_finished_cells_without_sql_warnings(database):
+    ids = seed(database, nlq_count=2, mock_profiles=({}, {}))
+    db = database()
+    try:
+        run = core.ValidationRun(parameters=ids, status=core.ValidationRun.STATUS_RUNNING)
+        db.add(run)
+        db.commit()
+        nlq_a, nlq_b = ids["nlq_ids"]
+        (prompt_set_id,) = ids["prompt_set_ids"]
+        llm_a, llm_b = ids["llm_config_ids"]
+        GR = core.GeneratedResult
+        db.add_all([
+            GR(validation_run_id=run.id, nlq_id=nlq_id, prompt_set_id=prompt_set_id, llm_config_id=llm_a,
+               generated_sql="", full_prompt="", status=status)
+            for nlq_id, status in ((nlq_a, GR.STATUS_SUCCESS), (nlq_b, GR.STATUS_SKIPPED))
+        ])
+        db.commit()
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            pending = evaluate.pending_cell_keys(db, run, exclude_statuses=[GR.STATUS_SUCCESS, GR.STATUS_ERROR])
+    finally:
+        db.close()
+    assert sorted(pending) == sorted([
+        (nlq_b, prompt_set_id, llm_a),
+        (nlq_a, prompt_set_id, llm_b),
+        (nlq_b, prompt_set_id, llm_b),
+    ])
+
+
+def test_cancel_mid_run_skips_unfinished_cells(client, database):
+    ids = seed(database, nlq_count=2, mock_profiles=({}, SLOW_MOCK))
+    fast_id, slow_id = ids["llm_config_ids"]
+    run_id = client.post("/evaluate/run", json=ids).json()["run_id"]
+    assert wait_for_status(client, run_id, lambda s: s["completed"] == 2)["status"] == core.ValidationRun.STATUS_RUNNING
+
+    response = client.post(f"/runs/{run_id}/cancel")
+    assert response.status_code == 200
+    status = wait_for_status(client, run_id, lambda s: s["status"] == core.ValidationRun.STATUS_CANCELLED)
+
+    assert status["status"] == core.ValidationRun.STATUS_CANCELLED
+    assert (status["completed"], status["failed"], status["skipped"], status["pending"]) == (2, 0, 2, 0)
+    GR = core.GeneratedResult
+    assert sorted(result_rows(database, run_id)) == sorted(
+        [(fast_id, GR.STATUS_SUCCESS, None)] * 2 + [(slow_id, GR.STATUS_SKIPPED, GR.ERROR_CANCELLED)] * 2
+    )
+    assert status["error"] == "Cancelled by request"
+    # A finished run cannot be cancelled again
+    assert client.post(f"/runs/{run_id}/cancel").status_code == 409
+
+
+def test_deadline_skips_cells_still_in_flight(client, database):
+    ids = seed(database, nlq_count=2, mock_profiles=({}, SLOW_MOCK))
+    fast_id, slow_id = ids["llm_config_ids"]
+    run_id = client.post("/evaluate/run", json=dict(ids, deadline_seconds=1)).json()["run_id"]
+    status = wait_for_status(client, run_id, lambda s: s["status"] == core.ValidationRun.STATUS_CANCELLED)
+
+    assert status["status"] == core.ValidationRun.STATUS_CANCELLED
+    assert (status["completed"], status["skipped"]) == (2, 2)
+    GR = core.GeneratedResult
+    assert sorted(result_rows(database, run_id)) == sorted(
+        [(fast_id, GR.STATUS_SUCCESS, None)] * 2 + [(slow_id, GR.STATUS_SKIPPED, GR.ERROR_DEADLINE)] * 2
+    )
+    assert status["error"] == "Deadline of 1 seconds exceeded"
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+from app.models.core import GeneratedResult
+from app.services.evaluation_engine import EvaluationCell, EvaluationEngine
+from app.services.llm_service import CancellationToken
+
+CONFIG = SimpleNamespace(id=1, name="mock", model="mock-model", api_key="key")
+
+
+def test_cancelled_cells_keep_their_slot_until_the_call_returns():
+    release_call = threading.Event()
+    calls = []
+
+    def generate(cell, llm_config, cancel_token):
+        calls.append(cell.nlq_id)
+        if cell.nlq_id == 1:
+            # Ignores the token, like a call blocked before its stream opens
+            release_call.wait(5)
+        return "SELECT 1"
+
+    engine = EvaluationEngine(generate, provider_of=lambda config: "mock", max_in_flight_per_provider=1)
+
+    async def scenario():
+        token = CancellationToken()
+        first = asyncio.create_task(engine.run([EvaluationCell(1, 1, 1, "blocked")], {1: CONFIG}, lambda o: None, token))
+        await asyncio.sleep(0.2)
+        token.cancel(GeneratedResult.ERROR_CANCELLED)
+        outcomes = await first
+        assert [o.status for o in outcomes] == [GeneratedResult.STATUS_SKIPPED]
+
+        # The abandoned call still runs, so the next run waits for its provider slot
+        second = asyncio.create_task(engine.run([EvaluationCell(2, 1, 1, "next")], {1: CONFIG}, lambda o: None))
+        await asyncio.sleep(0.2)
+        assert calls == [1] and not second.done()
+        release_call.set()
+        outcomes = await asyncio.wait_for(second, 5)
+        assert [o.status for o in outcomes] == [GeneratedResult.STATUS_SUCCESS]
+        assert calls == [1, 2]
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        release_call.set()
+        engine.shutdown()
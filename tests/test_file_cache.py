@@ -0,0 +1,70 @@
+import os
+from app.utils.file_cache import FileCache
+
+
+def test_edited_file_is_reloaded(tmp_path):
+    path = tmp_path / "prompt.txt"
+    path.write_text("v1")
+    cache = FileCache()
+    assert cache.read(str(path)) == "v1"
+    assert cache.read(str(path)) == "v1"
+
+    # Same size, newer mtime
+    path.write_text("v2")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache.read(str(path)) == "v2"
+
+    # Replaced by rename, as editors do: new inode
+    replacement = tmp_path / "prompt.txt.new"
+    replacement.write_text("version 3")
+    os.replace(replacement, path)
+    assert cache.read(str(path)) == "version 3"
+
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"], stats["stale_reloads"]) == (1, 1, 2)
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    paths = {}
+    for name in "abc":
+        paths[name] = str(tmp_path / f"{name}.txt")
+        with open(paths[name], "w") as f:
+            f.write(name * 4)
+    cache = FileCache(max_bytes=10)
+    cache.read(paths["a"])
+    cache.read(paths["b"])
+    cache.read(paths["a"])  # b is now the least recently used
+    cache.read(paths["c"])
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["evictions"]) == (2, 8, 1)
+    cache.read(paths["a"])
+    cache.read(paths["c"])
+    assert cache.stats()["hits"] == 3
+    assert cache.read(paths["b"]) == "bbbb"
+    assert cache.stats()["misses"] == 4
+
+
+def test_file_larger_than_the_budget_is_not_cached(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_text("x" * 20)
+    cache = FileCache(max_bytes=10)
+    assert cache.read(str(path)) == "x" * 20
+    assert cache.stats()["entries"] == 0
+
+
+def test_refresh_tree_prewarms_changes_and_drops_deleted_files(tmp_path):
+    kept, deleted = tmp_path / "kept.txt", tmp_path / "deleted.txt"
+    kept.write_text("old")
+    deleted.write_text("gone")
+    cache = FileCache()
+    cache.refresh_tree(str(tmp_path))
+    assert cache.stats()["prewarmed"] == 2
+
+    kept.write_text("newer")
+    deleted.unlink()
+    cache.refresh_tree(str(tmp_path))
+    assert cache.read(str(kept)) == "newer"
+    stats = cache.stats()
+    assert (stats["entries"], stats["prewarmed"], stats["hits"], stats["misses"]) == (1, 3, 1, 0)
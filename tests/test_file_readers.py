@@ -0,0 +1,64 @@
+import pytest
+from app.utils.file_readers import resolve_includes
+
+
+def write(directory, name, text):
+    path = directory / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return str(path)
+
+
+def test_includes_resolve_relative_to_the_including_file(tmp_path):
+    main = write(tmp_path, "main.txt", "Schema:\n{{include:parts/schema.txt}}\nQuestion: {{NLQ}} {{include:parts/schema.txt}}")
+    write(tmp_path, "parts/schema.txt", "[{{include: columns.txt }}]")
+    write(tmp_path, "parts/columns.txt", "id, name")
+
+    text, dependencies = resolve_includes(main)
+
+    assert text == "Schema:\n[id, name]\nQuestion: {{NLQ}} [id, name]"
+    # Every file once, the main file first
+    assert dependencies == [main, str(tmp_path / "parts" / "schema.txt"), str(tmp_path / "parts" / "columns.txt")]
+
+
+def test_include_cycle_is_rejected(tmp_path):
+    main = write(tmp_path, "main.txt", "{{include:a.txt}}")
+    write(tmp_path, "a.txt", "A {{include:b.txt}}")
+    write(tmp_path, "b.txt", "B {{include:a.txt}}")
+
+    with pytest.raises(ValueError, match="Include cycle") as error:
+        resolve_includes(main)
+    assert f"{tmp_path / 'a.txt'} -> {tmp_path / 'b.txt'} -> {tmp_path / 'a.txt'}" in str(error.value)
+
+
+def test_self_include_is_a_cycle(tmp_path):
+    main = write(tmp_path, "main.txt", "{{include:main.txt}}")
+    with pytest.raises(ValueError, match="Include cycle"):
+        resolve_includes(main)
+
+
+def test_include_depth_limit(tmp_path):
+    main = write(tmp_path, "main.txt", "{{include:1.txt}}")
+    for level in range(1, 4):
+        write(tmp_path, f"{level}.txt", f"{level} {{{{include:{level + 1}.txt}}}}")
+    write(tmp_path, "4.txt", "4")
+
+    assert resolve_includes(main, max_depth=4)[0] == "1 2 3 4"
+    with pytest.raises(ValueError, match="nested more than 3 levels deep"):
+        resolve_includes(main, max_depth=3)
+
+
+def test_repeated_include_is_not_a_cycle(tmp_path):
+    main = write(tmp_path, "main.txt", "{{include:a.txt}}{{include:b.txt}}")
+    write(tmp_path, "a.txt", "{{include:shared.txt}}")
+    write(tmp_path, "b.txt", "{{include:shared.txt}}")
+    write(tmp_path, "shared.txt", "S")
+    assert resolve_includes(main)[0] == "SS"
+
+
+def test_missing_files_raise_file_not_found(tmp_path):
+    with pytest.raises(FileNotFoundError, match="Main prompt file"):
+        resolve_includes(str(tmp_path / "missing.txt"))
+    main = write(tmp_path, "main.txt", "{{include:missing.txt}}")
+    with pytest.raises(FileNotFoundError, match="Include file not found.*missing.txt"):
+        resolve_includes(main)
@@ -0,0 +1,86 @@
+import time
+from types import SimpleNamespace
+from google.ai import generativelanguage as glm
+from app.services.http_clients import http_clients
+from app.services.llm_service import GeminiModel, GeminiModelRegistry, LLMService
+
+
+def config(**overrides):
+    fields = dict(id=1, model="gemini-2.0-flash", api_key="key-1", base_url=None, default_parameters=None,
+                  provider="gemini", hedging_enabled=False)
+    return SimpleNamespace(**{**fields, **overrides})
+
+
+def test_generate_content_uses_the_model_own_client(monkeypatch):
+    model = GeminiModel("gemini-2.0-flash", "key-1")
+    requests = []
+
+    def generate_content(request):
+        requests.append(request)
+        return glm.GenerateContentResponse(
+            candidates=[glm.Candidate(content=glm.Content(parts=[glm.Part(text="SELECT 1")]), finish_reason=glm.Candidate.FinishReason.STOP)],
+            usage_metadata=glm.GenerateContentResponse.UsageMetadata(prompt_token_count=12, candidates_token_count=3),
+        )
+
+    monkeypatch.setattr(model.client, "generate_content", generate_content)
+    response = model.generate_content("How many orders?")
+
+    assert (response.text, response.usage_metadata.candidates_token_count) == ("SELECT 1", 3)
+    assert requests[0].model == "models/gemini-2.0-flash"
+    assert requests[0].contents[0].parts[0].text == "How many orders?"
+
+
+def test_registry_reuses_clients_until_the_config_changes():
+    registry = GeminiModelRegistry()
+    model = registry.get(config())
+    assert registry.get(config()) is model
+    assert registry.get(config(api_key="key-2")) is not model
+    assert registry.get(config(id=2)) is not registry.get(config(id=3))
+
+
+def test_registry_clients_use_the_config_base_url():
+    registry = GeminiModelRegistry()
+    default = registry.get(config())
+    proxied = registry.get(config(base_url="http://localhost:8080/v1beta"))
+    assert proxied is not default
+    assert proxied.client._transport._host == "http://localhost:8080"
+    assert "localhost" not in default.client._transport._host
+
+
+class FakeStream:
+    status_code = 200
+    raw = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_lines(self, decode_unicode=False):
+        yield 'data: {"candidates": [{"content": {"parts": [{"text": "SELECT 1"}]}}]}'
+
+
+def test_context_cache_creation_is_not_timed_as_stream_latency(monkeypatch):
+    service = LLMService()
+    posts = []
+
+    def create_cache(config, prefix):
+        time.sleep(0.3)  # A cache miss: blocking cachedContents POST
+        return "cachedContents/abc"
+
+    def post(url, json=None, **kwargs):
+        posts.append(json)
+        return FakeStream()
+
+    monkeypatch.setattr(service.context_cache, "get", create_cache)
+    monkeypatch.setattr(http_clients, "post", post)
+    result = service.stream_generate(config(api_key="timing-key"), "static prefix|How many orders?", static_prefix_chars=14)
+
+    assert result.text == "SELECT 1"
+    assert result.total_time_ms < 300 and result.time_to_first_token_ms < 300
+    assert posts[0]["cachedContent"] == "cachedContents/abc"
+    assert posts[0]["contents"][0]["parts"][0]["text"] == "How many orders?"
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+from fastapi.testclient import TestClient
+from app.api import evaluate
+from app.main import app
+from app.models import core
+from app.services.evaluation_engine import EvaluationEngine
+from app.services.job_runner import JobRunner
+from conftest import seed
+
+
+def run_with_timeout(target, timeout=10):
+    """Runs target in a thread so a deadlock fails the test instead of hanging it."""
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), f"{target.__name__} did not return within {timeout}s"
+
+
+def test_submit_returns_the_active_job_for_the_same_id():
+    runner = JobRunner()
+    release = threading.Event()
+    calls = []
+
+    async def job():
+        calls.append(1)
+        await asyncio.get_running_loop().run_in_executor(None, release.wait, 5)
+
+    try:
+        first = runner.submit(1, job)
+        assert runner.submit(1, job) is first
+        assert runner.is_active(1) and not runner.is_active(2)
+        release.set()
+        first.result(5)
+        assert not runner.is_active(1)
+        assert calls == [1]
+    finally:
+        release.set()
+        runner.stop()
+
+
+def test_stop_cancels_active_jobs_without_deadlocking():
+    runner = JobRunner()
+    started = threading.Event()
+
+    async def job():
+        started.set()
+        await asyncio.sleep(60)
+
+    future = runner.submit(1, job)
+    assert started.wait(5)
+    run_with_timeout(runner.stop)
+    assert future.cancelled()
+    assert not runner.is_active(1)
+
+    # The runner starts a new loop on the next submit
+    assert runner.submit(2, lambda: asyncio.sleep(0)).result(5) is None
+    runner.stop()
+
+
+def test_run_status_reports_progress_and_shutdown_stops_the_active_run(database, prompt_sets_dir, monkeypatch):
+    monkeypatch.setattr(evaluate, "DISPATCH_MODE", evaluate.DISPATCH_MODE_INLINE)
+    monkeypatch.setattr(evaluate, "engine", EvaluationEngine(
+        generate=evaluate.generate_for_cell, provider_of=evaluate.provider_of, classify_error=evaluate.classify_llm_error,
+    ))
+    ids = seed(database, nlq_count=2, mock_profiles=({}, {"latency_ms": 1500}))
+    state = {}
+
+    def scenario():
+        with TestClient(app) as client:
+            run_id = client.post("/evaluate/run", json=ids).json()["run_id"]
+            # The fast config finishes while the slow one keeps the run active
+            deadline = time.monotonic() + 5
+            while True:
+                status = client.get(f"/runs/{run_id}/status").json()
+                if status["completed"] == 2 or time.monotonic() > deadline:
+                    break
+                time.sleep(0.05)
+            state["status"] = status
+            state["active"] = evaluate.job_runner.is_active(run_id)
+        # Leaving the client runs the shutdown handler, which stops the runner mid-run
+        state["stopped_active"] = evaluate.job_runner.is_active(run_id)
+
+    run_with_timeout(scenario)
+    status = state["status"]
+    assert status["status"] == core.ValidationRun.STATUS_RUNNING
+    assert (status["total"], status["completed"], status["failed"], status["pending"]) == (4, 2, 0, 2)
+    assert state["active"] and not state["stopped_active"]
+
+
+def test_run_status_of_an_unknown_run_is_404(database):
+    with TestClient(app) as client:
+        assert client.get("/runs/999/status").status_code == 404
@@ -0,0 +1,46 @@
+from types import SimpleNamespace
+import pytest
+from app.api.evaluate import classify_llm_error
+from app.models.core import GeneratedResult
+from app.services.llm_service import StreamResult
+from app.services.mock_provider import ExchangeFixtures, FixtureNotFoundError, MockProviderError
+from app.services.resilience import BREAKER_FAILURE_CLASSES
+
+CONFIG = SimpleNamespace(model="gemini-2.0-flash", default_parameters=None)
+
+
+def test_record_then_replay_round_trip(tmp_path):
+    path = str(tmp_path / "fixtures" / "exchanges.jsonl")
+    recorded = StreamResult(text="SELECT 1", total_time_ms=120, time_to_first_token_ms=40, output_tokens=3,
+                            output_tokens_per_second=37.5, prompt_tokens=50, cached_tokens=10)
+    recorder = ExchangeFixtures("record", path)
+    recorder.record(CONFIG, "prompt A", recorded)
+    recorder.record(CONFIG, "prompt A", StreamResult(text="SELECT 2", total_time_ms=80))
+    recorder.record_error(CONFIG, "prompt B", 503, "Service Unavailable", 15)
+
+    replayer = ExchangeFixtures("replay", path, time_scale=0)
+    assert replayer.replay(CONFIG, "prompt A") == recorded
+    # Repeated recordings of a prompt are replayed in turn, then from the start
+    assert replayer.replay(CONFIG, "prompt A").text == "SELECT 2"
+    assert replayer.replay(CONFIG, "prompt A").text == "SELECT 1"
+    with pytest.raises(MockProviderError) as error:
+        replayer.replay(CONFIG, "prompt B")
+    assert error.value.status_code == 503
+
+
+def test_replay_miss_is_fixture_missing_and_spares_the_breaker(tmp_path):
+    replayer = ExchangeFixtures("replay", str(tmp_path / "exchanges.jsonl"), time_scale=0)
+    with pytest.raises(FixtureNotFoundError) as error:
+        replayer.replay(CONFIG, "never recorded")
+    # A recording for another model does not match either
+    ExchangeFixtures("record", replayer.path).record(SimpleNamespace(model="gemini-1.5-pro"), "never recorded",
+                                                     StreamResult(text="SELECT 1", total_time_ms=1))
+    with pytest.raises(FixtureNotFoundError):
+        ExchangeFixtures("replay", replayer.path, time_scale=0).replay(CONFIG, "never recorded")
+    assert classify_llm_error(error.value) == GeneratedResult.ERROR_FIXTURE_MISSING
+    assert GeneratedResult.ERROR_FIXTURE_MISSING not in BREAKER_FAILURE_CLASSES
+
+
+def test_unknown_fixture_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ExchangeFixtures("playback", str(tmp_path / "exchanges.jsonl"))
@@ -0,0 +1,83 @@
+import os
+from types import SimpleNamespace
+from app.services.llm_service import estimate_tokens
+from app.services.prompt_profiler import TOKENIZER_GEMINI, TOKENIZER_TIKTOKEN, PromptProfiler
+from app.utils import file_readers
+
+PROMPT_SET = SimpleNamespace(id=1, name="Profiled")
+GEMINI = SimpleNamespace(id=7, model="gemini-2.0-flash", provider="gemini")
+
+FILES = {
+    "Profiled.txt": "You write SQL.\n{{include:schema.txt}}\n{{include:rules.txt}}\n{{include:note.txt}}\nQ: {{NLQ}}\n",
+    "schema.txt": "CREATE TABLE clicks (day DATE, campaign_id INT, clicks INT);\n" * 20,
+    "rules.txt": "Use ANSI SQL only.\n{{include:note.txt}}\n",
+    "note.txt": "Dates are UTC.\n",
+}
+
+
+def write_prompt_set(tmp_path):
+    directory = tmp_path / "prompt_sets" / "Profiled"
+    directory.mkdir(parents=True)
+    for name, text in FILES.items():
+        (directory / name).write_text(text)
+    return directory
+
+
+def own_text(text):
+    return file_readers.INCLUDE_PATTERN.sub("", text)
+
+
+def test_profile_breaks_tokens_down_per_include(tmp_path):
+    write_prompt_set(tmp_path)
+    profile = PromptProfiler().profile(PROMPT_SET, [GEMINI], str(tmp_path / "prompt_sets"), nlq="clicks per day")
+
+    occurrences = {"Profiled.txt": 1, "schema.txt": 1, "rules.txt": 1, "note.txt": 2}
+    includes = {i["file"]: i for i in profile["includes"]}
+    assert set(includes) == set(FILES)
+    for name, text in FILES.items():
+        include = includes[name]
+        assert include["occurrences"] == occurrences[name]
+        assert include["chars"] == len(own_text(text)) * occurrences[name]
+        assert include["tokens"][TOKENIZER_GEMINI] == estimate_tokens(own_text(text)) * occurrences[name]
+    # Largest first, and the shares add up to about the whole prompt
+    assert profile["includes"][0]["file"] == "schema.txt"
+    assert [i["tokens"][TOKENIZER_TIKTOKEN] for i in profile["includes"]] == sorted(
+        (i["tokens"][TOKENIZER_TIKTOKEN] for i in profile["includes"]), reverse=True)
+    assert 0.9 < sum(i["share"] for i in profile["includes"]) <= 1.05
+    (model,) = profile["models"]
+    assert (model["tokenizer"], model["llm_config_ids"]) == (TOKENIZER_GEMINI, [7])
+    assert model["prompt_tokens"] == profile["tokens"][TOKENIZER_GEMINI]
+
+
+def test_unchanged_files_are_served_without_compiling(tmp_path, monkeypatch):
+    directory = write_prompt_set(tmp_path)
+    compiles = []
+    compile_prompt_set_by_name = file_readers.compile_prompt_set_by_name
+
+    def counting_compile(*args):
+        compiles.append(args[0])
+        return compile_prompt_set_by_name(*args)
+
+    monkeypatch.setattr(file_readers, "compile_prompt_set_by_name", counting_compile)
+    profiler = PromptProfiler()
+    base_dir = str(tmp_path / "prompt_sets")
+
+    first = profiler.profile(PROMPT_SET, [GEMINI], base_dir)
+    assert profiler.profile(PROMPT_SET, [GEMINI], base_dir)["content_hash"] == first["content_hash"]
+    assert len(compiles) == 1
+    # A different NLQ is a different profile
+    profiler.profile(PROMPT_SET, [GEMINI], base_dir, nlq="spend")
+    assert len(compiles) == 2
+
+    # Touching a nested include recompiles, but identical contents reuse the profile
+    note = directory / "note.txt"
+    stat = note.stat()
+    os.utime(note, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert profiler.profile(PROMPT_SET, [GEMINI], base_dir)["content_hash"] == first["content_hash"]
+    assert len(compiles) == 3
+
+    note.write_text("Dates are UTC; weeks start on Monday.\n")
+    edited = profiler.profile(PROMPT_SET, [GEMINI], base_dir)
+    assert len(compiles) == 4
+    assert edited["content_hash"] != first["content_hash"]
+    assert {i["file"]: i["chars"] for i in edited["includes"]}["note.txt"] == 2 * len("Dates are UTC; weeks start on Monday.\n")
@@ -0,0 +1,88 @@
+import os
+import re
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.file_readers import compile_prompt, prompt_set_name_to_filename
+from app.utils.prompt_templating import MACRO_PATTERN, MissingMacrosError, apply_prompt_template
+
+REPO_PROMPT_SETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompt_sets")
+
+# Prompt files were rendered with this pattern before the shared template engine
+OLD_MACRO_PATTERN = re.compile(r"{{\s*([A-Za-z0-9_]+)\s*}}")
+
+
+def old_render(text, values):
+    """The previous CompiledPrompt.render: every macro required, one join over the slots."""
+    slots = list(OLD_MACRO_PATTERN.finditer(text))
+    missing = sorted({m.group(1) for m in slots} - values.keys())
+    if missing:
+        raise ValueError(f"Prompt construction error: missing macros not substituted: {missing}")
+    parts, position = [], 0
+    for m in slots:
+        parts.append(text[position:m.start()])
+        parts.append(str(values[m.group(1)]))
+        position = m.end()
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def prompt_files():
+    for name in sorted(os.listdir(REPO_PROMPT_SETS)):
+        path = os.path.join(REPO_PROMPT_SETS, name, prompt_set_name_to_filename(name))
+        if os.path.isfile(path):
+            yield path
+
+
+@pytest.mark.parametrize("path", list(prompt_files()), ids=os.path.basename)
+def test_repo_prompt_sets_render_as_before(path):
+    compiled = compile_prompt(path)
+    values = {name: f"<{name} value>" for name in OLD_MACRO_PATTERN.findall(compiled.text)}
+    values.update(NLQ="total clicks yesterday", BASELINE_SQL="")
+    assert compiled.render(values) == old_render(compiled.text, values)
+
+
+def test_prompt_file_edge_cases_render_as_before(tmp_path):
+    (tmp_path / "part.txt").write_text("Included {{ NLQ }} text\n")
+    text = (
+        "Question: {{NLQ}} / {{ NLQ }} / {{{NLQ}}}\n"
+        "Jinja stays: {{ sum('clicks') }} and {{ BASELINE_SQL}}\n"
+        "{{include:part.txt}}"
+        "Unicode: é ✓ {{NLQ}}\n"
+    )
+    (tmp_path / "main.txt").write_text(text)
+    compiled = compile_prompt(str(tmp_path / "main.txt"))
+    values = {"NLQ": "spend by campaign", "BASELINE_SQL": "SELECT 1"}
+    assert compiled.render(values) == old_render(compiled.text, values)
+    with pytest.raises(MissingMacrosError, match=r"\['BASELINE_SQL'\]"):
+        compiled.render({"NLQ": "spend by campaign"})
+
+
+def test_macro_pattern_accepts_dotted_names():
+    text = "{{user.name}} {{ NLQ }} {{ sum('x') }} {{include:schema.txt}} {{a.b.c}}"
+    assert MACRO_PATTERN.findall(text) == ["user.name", "NLQ", "a.b.c"]
+    assert apply_prompt_template("Hi {{user.name}} ({{user.id}})", {"user": {"name": "Ann", "id": 7}}) == "Hi Ann (7)"
+    # Lenient rendering leaves unresolved paths in place
+    assert apply_prompt_template("{{user.email}} {{user}}", {"user": "x"}) == "{{user.email}} x"
+
+
+def test_prompt_template_api_strict_mode_rejects_missing_macros():
+    client = TestClient(app)
+    body = {"template": "{{a}} {{b.c}}", "macros": {"a": 1}}
+    assert client.post("/prompt_template", json=body).json()["result"] == "1 {{b.c}}"
+    response = client.post("/prompt_template", json=dict(body, strict=True))
+    assert response.status_code == 400
+    assert "['b.c']" in response.json()["detail"]
+
+
+def test_prompt_template_api_renders_macro_sets():
+    client = TestClient(app)
+    body = {"template": "{{NLQ}} for {{ctx.day}}", "macro_sets": [
+        {"NLQ": "clicks", "ctx": {"day": "Monday"}},
+        {"NLQ": "spend", "ctx": {"day": "Tuesday"}},
+        {"NLQ": "impressions"},
+    ]}
+    response = client.post("/prompt_template", json=body).json()
+    assert response["results"] == ["clicks for Monday", "spend for Tuesday", "impressions for {{ctx.day}}"]
+    assert response["result"] is None
+    assert client.post("/prompt_template", json=dict(body, strict=True)).status_code == 400
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import httpx
+import litellm
+import pytest
+import requests
+from app.services.llm_service import CancellationToken, RateLimiter, request_not_sent
+
+CONFIG = SimpleNamespace(model="gpt-4o-mini", provider="openai", api_key="key", rpm_limit=60, tpm_limit=None)
+
+
+def tokens_left(limiter):
+    return limiter._budgets[RateLimiter.key_for(CONFIG)].rpm.tokens
+
+
+def test_cancelled_wait_refunds_the_reservation():
+    limiter = RateLimiter()
+    for _ in range(60):
+        limiter.acquire(CONFIG, "prompt")
+    token = CancellationToken()
+    threading.Timer(0.05, token.cancel).start()
+    reservation = limiter.acquire(CONFIG, "prompt", token)  # Would wait ~1s for the bucket to refill
+
+    assert reservation.refunded
+    assert tokens_left(limiter) == pytest.approx(0, abs=0.1)
+    assert limiter.stats()["openai:key"]["refunded"] == 1
+
+
+def test_cancelled_async_wait_refunds_the_reservation():
+    limiter = RateLimiter()
+    for _ in range(60):
+        limiter.acquire(CONFIG, "prompt")
+
+    async def scenario():
+        waiting = asyncio.create_task(limiter.aacquire(CONFIG, "prompt"))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(scenario())
+    assert tokens_left(limiter) == pytest.approx(0, abs=0.1)
+    assert limiter.stats()["openai:key"]["refunded"] == 1
+
+
+def test_refund_is_applied_once():
+    limiter = RateLimiter()
+    reservation = limiter.acquire(CONFIG, "prompt")
+    limiter.refund(reservation)
+    limiter.refund(reservation)
+    assert tokens_left(limiter) == pytest.approx(60, abs=0.1)
+    assert limiter.stats()["openai:key"]["refunded"] == 1
+
+
+def test_only_failures_to_connect_are_refunded():
+    limiter = RateLimiter()
+    try:
+        requests.get("http://127.0.0.1:9", timeout=2)
+    except requests.ConnectionError as e:
+        refused = e
+    assert request_not_sent(refused)
+    limiter.refund_if_unsent(limiter.acquire(CONFIG, "prompt"), refused)
+    assert tokens_left(limiter) == pytest.approx(60, abs=0.1)
+
+    # Wrapped connect errors count too; errors after the request was sent do not
+    try:
+        try:
+            raise httpx.ConnectError("connection refused")
+        except httpx.ConnectError as e:
+            raise litellm.APIConnectionError(message=str(e), llm_provider="openai", model="gpt-4o-mini") from e
+    except litellm.APIConnectionError as e:
+        assert request_not_sent(e)
+    assert not request_not_sent(requests.ReadTimeout("read timed out"))
+    assert not request_not_sent(httpx.ReadError("connection reset"))
+    limiter.refund_if_unsent(limiter.acquire(CONFIG, "prompt"), requests.ReadTimeout("read timed out"))
+    assert tokens_left(limiter) == pytest.approx(59, abs=0.1)
@@ -0,0 +1,63 @@
+import pytest
+from app.models.core import GeneratedResult
+from app.services.llm_service import CancellationToken, GenerationCancelled
+from app.services.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, call_with_retry
+
+
+def half_open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker(("mock", "model"), window=2, min_calls=2, failure_rate=0.5, open_seconds=0)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.STATE_OPEN
+    return breaker
+
+
+def test_only_the_probe_decides_a_half_open_circuit():
+    breaker = half_open_breaker()
+    probe = breaker.before_call()
+    assert probe is not None and breaker.state == CircuitBreaker.STATE_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    # Calls admitted before the circuit opened finish without a say
+    breaker.record(True)
+    breaker.release_probe(None)
+    assert breaker.state == CircuitBreaker.STATE_HALF_OPEN and breaker.probe_in_flight
+
+    breaker.record(True, probe)
+    assert breaker.state == CircuitBreaker.STATE_CLOSED and not breaker.probe_in_flight
+    assert breaker.before_call() is None
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = half_open_breaker()
+    breaker.record(False, breaker.before_call())
+    assert breaker.state == CircuitBreaker.STATE_OPEN and breaker.times_opened == 2
+
+
+def test_released_probe_frees_the_slot_only_for_its_owner():
+    breaker = half_open_breaker()
+    probe = breaker.before_call()
+    breaker.release_probe(object())
+    assert breaker.probe_in_flight
+    breaker.release_probe(probe)
+    assert not breaker.probe_in_flight
+    assert breaker.before_call() is not probe
+
+
+def test_call_with_retry_passes_the_probe_token():
+    breaker = half_open_breaker()
+    outcome = call_with_retry(lambda: "SELECT 1", breaker, RetryPolicy(), lambda exc: GeneratedResult.ERROR_OTHER)
+    assert outcome.result == "SELECT 1"
+    assert breaker.state == CircuitBreaker.STATE_CLOSED
+
+    breaker = half_open_breaker()
+    token = CancellationToken()
+    token.cancel(GeneratedResult.ERROR_CANCELLED)
+
+    def cancelled():
+        raise GenerationCancelled(token.reason)
+
+    with pytest.raises(GenerationCancelled):
+        call_with_retry(cancelled, breaker, RetryPolicy(), lambda exc: GeneratedResult.ERROR_OTHER, token)
+    assert breaker.state == CircuitBreaker.STATE_HALF_OPEN and not breaker.probe_in_flight
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+from app.services import response_cache as response_cache_module
+from app.services.response_cache import ResponseCache
+
+
+def config(**overrides):
+    fields = dict(provider="openai", model="gpt-4o", default_parameters={"temperature": 0})
+    return SimpleNamespace(**{**fields, **overrides})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+def cache_with_clock(tmp_path, monkeypatch, **kwargs):
+    clock = Clock()
+    monkeypatch.setattr(response_cache_module, "time", clock)
+    return ResponseCache(str(tmp_path / "responses.db"), **kwargs), clock
+
+
+def test_entries_expire_after_the_ttl(tmp_path, monkeypatch):
+    cache, clock = cache_with_clock(tmp_path, monkeypatch, ttl_seconds=60)
+    cache.put(config(), "prompt", "SELECT 1", response_time_ms=120)
+    clock.now += 60
+    assert cache.get(config(), "prompt") == "SELECT 1"
+    clock.now += 1
+    assert cache.get(config(), "prompt") is None
+    # The expired entry was deleted, not just hidden
+    clock.now -= 61
+    assert cache.get(config(), "prompt") is None
+
+
+def test_eviction_drops_least_recently_used_entries_down_to_90_percent(tmp_path, monkeypatch):
+    cache, clock = cache_with_clock(tmp_path, monkeypatch, max_bytes=100)
+    for i in range(5):
+        clock.now += 1
+        cache.put(config(), f"prompt {i}", str(i) * 20)
+    clock.now += 1
+    assert cache.get(config(), "prompt 0") == "0" * 20  # Now the most recently used
+
+    clock.now += 1
+    cache.put(config(), "prompt 5", "5" * 20)  # 120 bytes: over budget, evicts down to 90
+
+    kept = [i for i in range(6) if cache.get(config(), f"prompt {i}") is not None]
+    assert kept == [0, 3, 4, 5]
+    assert cache._total_bytes == 80
+
+
+def test_keys_are_isolated_per_config_and_prompt(tmp_path, monkeypatch):
+    cache, _ = cache_with_clock(tmp_path, monkeypatch)
+    cache.put(config(), "prompt", "SELECT 1")
+    assert cache.get(config(), "prompt") == "SELECT 1"
+    assert cache.get(config(), "other prompt") is None
+    assert cache.get(config(model="gpt-4o-mini"), "prompt") is None
+    assert cache.get(config(provider="anthropic"), "prompt") is None
+    assert cache.get(config(default_parameters={"temperature": 0.7}), "prompt") is None
+    # Parameter order does not matter
+    cache.put(config(default_parameters={"temperature": 0, "top_p": 1}), "prompt", "SELECT 2")
+    assert cache.get(config(default_parameters={"top_p": 1, "temperature": 0}), "prompt") == "SELECT 2"
+
+
+def test_cache_reopens_with_its_stored_entries(tmp_path, monkeypatch):
+    cache, _ = cache_with_clock(tmp_path, monkeypatch)
+    cache.put(config(), "prompt", "SELECT 1")
+    reopened = ResponseCache(str(tmp_path / "responses.db"))
+    assert reopened.get(config(), "prompt") == "SELECT 1"
+    reopened.clear()
+    assert reopened.get(config(), "prompt") is None
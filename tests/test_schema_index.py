@@ -0,0 +1,105 @@
+import pytest
+from app.utils.schema_index import SchemaChunk, SchemaIndex, build_schema_index, ddl_chunks, tokenize
+
+DDL = """CREATE TABLE SALES.PUBLIC.ORDERS (
+    ORDER_ID NUMBER,
+    CUSTOMER_ID NUMBER,
+    ORDER_TOTAL NUMBER(10, 2),
+    ORDERED_AT TIMESTAMP
+);
+
+CREATE TABLE SALES.PUBLIC.CUSTOMERS (
+    CUSTOMER_ID NUMBER,
+    REGION VARCHAR,
+    SIGNUP_DATE DATE
+);
+
+CREATE OR REPLACE VIEW SALES.PUBLIC.AD_CLICKS (
+    CLICK_ID,
+    CAMPAIGN_NAME,
+    CLICKED_AT
+) AS SELECT * FROM RAW.CLICKS;
+"""
+
+SEMANTIC_LAYER = """models:
+  - name: revenue
+    description: Order revenue by day
+    sql: SELECT ${sales.public.orders.order_total} FROM sales.public.orders
+    measures:
+      - name: gross_revenue
+        description: Sum of order totals
+"""
+
+GLOSSARY = """Term: Churn
+Aka: churned, lapsed
+Definition: A customer in a region who has not ordered since signup
+"""
+
+
+@pytest.fixture
+def prompt_set_dir(tmp_path):
+    (tmp_path / "main.txt").write_text("{{RELEVANT_SCHEMA}}\n\n{{NLQ}}")
+    (tmp_path / "schema.sql").write_text(DDL)
+    (tmp_path / "revenue.yaml").write_text(SEMANTIC_LAYER)
+    (tmp_path / "glossary.txt").write_text(GLOSSARY)
+    return tmp_path
+
+
+def names(index, nlq):
+    return [chunk.name for chunk, _ in index.select(nlq)]
+
+
+def test_ddl_chunks_index_tables_and_views():
+    chunks = ddl_chunks(DDL)
+    assert [c.name for c in chunks] == ["SALES.PUBLIC.ORDERS", "SALES.PUBLIC.CUSTOMERS", "SALES.PUBLIC.AD_CLICKS"]
+    assert {"campaign", "clicked"} <= set(chunks[2].terms)
+    assert "number" not in chunks[0].terms  # Column types are not indexed
+
+
+def test_bm25_selects_the_tables_the_question_is_about(prompt_set_dir):
+    index = build_schema_index(str(prompt_set_dir), exclude=[str(prompt_set_dir / "main.txt")])
+    index.top_k = 1
+    assert names(index, "How many clicks did each campaign get?") == ["SALES.PUBLIC.AD_CLICKS"]
+    assert names(index, "customers by region") == ["SALES.PUBLIC.CUSTOMERS"]
+
+
+def test_semantic_model_brings_in_the_tables_it_reads(prompt_set_dir):
+    index = build_schema_index(str(prompt_set_dir), exclude=[str(prompt_set_dir / "main.txt")])
+    index.top_k = 1
+    selected = index.select("gross revenue last week")
+    scores = {(c.kind, c.name): score for c, score in selected}
+    assert set(scores) == {(SchemaChunk.KIND_MODEL, "revenue"), (SchemaChunk.KIND_TABLE, "SALES.PUBLIC.ORDERS")}
+    assert scores[(SchemaChunk.KIND_TABLE, "SALES.PUBLIC.ORDERS")] == 0.0  # Required by the model, not scored
+
+
+def test_glossary_terms_expand_the_query(prompt_set_dir):
+    index = build_schema_index(str(prompt_set_dir), exclude=[str(prompt_set_dir / "main.txt")])
+    assert "SALES.PUBLIC.CUSTOMERS" not in names(SchemaIndex(index.chunks, top_k=1), "lapsed users")
+    index.top_k = 1
+    assert names(index, "lapsed users") == ["SALES.PUBLIC.CUSTOMERS"]
+
+
+def test_unmatched_question_falls_back_to_the_full_schema(prompt_set_dir):
+    index = build_schema_index(str(prompt_set_dir), exclude=[str(prompt_set_dir / "main.txt")])
+    assert index.select("What is the weather like?") == []
+    schema = index.relevant_schema("What is the weather like?")
+    assert schema == index.full_text
+    assert all(chunk.text in schema for chunk in index.chunks)
+
+
+def test_relevant_schema_renders_only_the_selected_chunks(prompt_set_dir):
+    index = build_schema_index(str(prompt_set_dir), exclude=[str(prompt_set_dir / "main.txt")])
+    index.top_k = 1
+    schema = index.relevant_schema("clicks per campaign")
+    assert schema.startswith("Here are the schemas:")
+    assert "AD_CLICKS" in schema and "ORDERS" not in schema and "semantic layer" not in schema
+
+
+def test_folder_without_schema_is_rejected(tmp_path):
+    (tmp_path / "main.txt").write_text("{{RELEVANT_SCHEMA}}")
+    with pytest.raises(ValueError, match="No schema DDL"):
+        build_schema_index(str(tmp_path), exclude=[str(tmp_path / "main.txt")])
+
+
+def test_tokenize_splits_identifiers_and_drops_stopwords():
+    assert tokenize("Show the ORDER_TOTAL of orders") == ["order", "total", "order"]
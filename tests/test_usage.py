@@ -0,0 +1,56 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import core
+from conftest import create_run, seed
+
+
+def add_results(database, run_id, ids, rows):
+    """rows: (llm_config_id, prompt_tokens, cached_tokens, completion_tokens)."""
+    db = database()
+    try:
+        db.add_all([
+            core.GeneratedResult(
+                validation_run_id=run_id, nlq_id=ids["nlq_ids"][0], prompt_set_id=ids["prompt_set_ids"][0], llm_config_id=llm_config_id,
+                generated_sql="SELECT 1", full_prompt="", prompt_tokens=prompt, cached_tokens=cached, completion_tokens=completion,
+            )
+            for llm_config_id, prompt, cached, completion in rows
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_usage_rolls_up_tokens_and_cost_per_config_and_run(database):
+    ids = seed(database, mock_profiles=({}, {}, {}))
+    cached_priced, input_priced, unpriced = ids["llm_config_ids"]
+    run_id = create_run(database, ids)
+    add_results(database, run_id, ids, [
+        (cached_priced, 1000, 400, 200),
+        (cached_priced, 500, 0, 100),
+        (cached_priced, None, None, None),  # A skipped cell: no call, no tokens
+        (input_priced, 1000, 1000, 0),
+        (unpriced, 100, 0, 10),
+        (unpriced, None, None, None),
+    ])
+    client = TestClient(app)
+    client.post("/model_prices", json={"model": "mock-model-0", "input_per_million": 2, "output_per_million": 8,
+                                        "cached_input_per_million": 0.5})
+    # No cached price: cached tokens are charged at the input price
+    client.post("/model_prices", json={"model": "mock-model-1", "input_per_million": 3, "output_per_million": 10})
+
+    by_config = client.get("/usage/by_llm_config", params={"run_id": run_id}).json()
+    assert [(u["id"], u["name"], u["results"], u["prompt_tokens"], u["cached_tokens"], u["completion_tokens"], u["unpriced_results"])
+            for u in by_config] == [
+        (cached_priced, "mock 0", 3, 1500, 400, 300, 0),
+        (input_priced, "mock 1", 1, 1000, 1000, 0, 0),
+        (unpriced, "mock 2", 2, 100, 0, 10, 1),
+    ]
+    # (1100 * 2 + 400 * 0.5 + 300 * 8) / 1M, and (1000 * 3) / 1M
+    assert [u["cost_usd"] for u in by_config] == [pytest.approx(0.0048), pytest.approx(0.003), None]
+
+    (by_run,) = client.get("/usage/by_run").json()
+    assert by_run["id"] == run_id
+    assert (by_run["results"], by_run["prompt_tokens"], by_run["cached_tokens"], by_run["completion_tokens"]) == (6, 2600, 1400, 310)
+    assert by_run["cost_usd"] == pytest.approx(0.0078)
+    assert by_run["unpriced_results"] == 1
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from app import worker as worker_module
+from app.api import evaluate
+from app.models import core
+from app.services import work_queue
+from app.services.evaluation_engine import EvaluationEngine
+from app.worker import Worker
+from conftest import create_run, seed
+
+
+def queued_run(database, nlq_count=3, mock_profiles=({},), **fields):
+    ids = seed(database, nlq_count=nlq_count, mock_profiles=mock_profiles)
+    run_id = create_run(database, ids, **fields)
+    db = database()
+    try:
+        cell_keys = [(n, p, l) for n in ids["nlq_ids"] for p in ids["prompt_set_ids"] for l in ids["llm_config_ids"]]
+        work_queue.enqueue(db, run_id, cell_keys)
+        db.commit()
+    finally:
+        db.close()
+    return run_id
+
+
+def test_concurrent_claims_never_lease_an_item_twice(database):
+    run_id = queued_run(database, nlq_count=5)
+    db_a, db_b = database(), database()
+    try:
+        claimed_a = work_queue.claim(db_a, "worker-a", 3)
+        claimed_b = work_queue.claim(db_b, "worker-b", 3)
+        assert work_queue.claim(db_a, "worker-a", 3) == []
+        assert (len(claimed_a), len(claimed_b)) == (3, 2)
+        assert not {item.id for item in claimed_a} & {item.id for item in claimed_b}
+        assert work_queue.remaining(db_a, run_id) == 5
+    finally:
+        db_a.close()
+        db_b.close()
+
+
+def test_expired_leases_are_reclaimed_and_the_old_owner_loses_its_results(database):
+    run_id = queued_run(database, nlq_count=2)
+    db = database()
+    try:
+        stale = work_queue.claim(db, "worker-a", 2, lease_seconds=0)
+        time.sleep(0.01)
+        reclaimed = work_queue.claim(db, "worker-b", 2)
+        assert [item.id for item in reclaimed] == [item.id for item in stale]
+        assert [item.attempts for item in reclaimed] == [2, 2]
+        # worker-a can neither renew nor complete items it no longer holds
+        assert work_queue.renew(db, "worker-a", [item.id for item in stale]) == 0
+        assert work_queue.complete(db, "worker-a", [item.id for item in stale]) == set()
+        assert work_queue.complete(db, "worker-b", [item.id for item in reclaimed]) == {item.id for item in reclaimed}
+        db.commit()
+        assert work_queue.remaining(db, run_id) == 0
+    finally:
+        db.close()
+
+
+def test_release_returns_unfinished_items_to_the_queue(database):
+    queued_run(database, nlq_count=2)
+    db = database()
+    try:
+        work_queue.claim(db, "worker-a", 2)
+        assert work_queue.release(db, "worker-a") == 2
+        assert len(work_queue.claim(db, "worker-b", 2)) == 2
+    finally:
+        db.close()
+
+
+def test_workers_drain_a_run_and_complete_it(database, prompt_sets_dir, monkeypatch):
+    monkeypatch.setattr(worker_module, "engine", EvaluationEngine(
+        generate=evaluate.generate_for_cell, provider_of=evaluate.provider_of, classify_error=evaluate.classify_llm_error,
+    ))
+    run_id = queued_run(database, nlq_count=3, mock_profiles=({}, {"latency_ms": 50}))
+
+    async def drain():
+        workers = [Worker(f"worker-{i}", batch_size=2, poll_seconds=0.05) for i in range(2)]
+        await asyncio.gather(*(w.run(exit_when_idle=True) for w in workers))
+
+    asyncio.run(drain())
+    db = database()
+    try:
+        run = db.get(core.ValidationRun, run_id)
+        assert run.status == core.ValidationRun.STATUS_COMPLETED and run.finished_at
+        assert (run.completed_cells, run.failed_cells, run.skipped_cells) == (6, 0, 0)
+        assert db.query(core.GeneratedResult).filter(core.GeneratedResult.validation_run_id == run_id).count() == 6
+        assert work_queue.remaining(db, run_id) == 0
+    finally:
+        db.close()
+
+
+def test_finish_if_drained_waits_for_remaining_items_and_records_a_missed_deadline(database):
+    run_id = queued_run(database, nlq_count=1, deadline_at=datetime.utcnow() - timedelta(seconds=1))
+    worker = Worker("worker-a")
+    db = database()
+    try:
+        run = db.get(core.ValidationRun, run_id)
+        run.status = core.ValidationRun.STATUS_RUNNING
+        run.parameters = dict(run.parameters, deadline_seconds=30)
+        db.commit()
+        worker._finish_if_drained(db, run)
+        db.refresh(run)
+        assert run.status == core.ValidationRun.STATUS_RUNNING
+
+        (item,) = work_queue.claim(db, "worker-a", 1)
+        work_queue.complete(db, "worker-a", [item.id])
+        run.skipped_cells = 1
+        db.commit()
+        worker._finish_if_drained(db, run)
+        db.refresh(run)
+        assert run.status == core.ValidationRun.STATUS_CANCELLED
+        assert run.error == "Deadline of 30 seconds exceeded"
+    finally:
+        db.close()